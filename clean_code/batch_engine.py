@@ -0,0 +1,351 @@
+# This file contains a vectorized version of the simulation engine. It advances many
+# independent replications of the same (s,S) model at the same time using numpy arrays
+from typing import Callable
+import numpy as np
+
+from simulation_engine import InventorySimulation
+from sim_stats import StatisticsResults
+
+NO_EVENT: int = np.iinfo(np.int64).max
+"""Time stored in the calendar slots that have no event scheduled (e.g. no pending supply)"""
+
+# Rows of the event calendar. The rows follow the priority of the events, so taking the
+# argmin over a column breaks ties between simultaneous events the same way Event.__lt__ does
+END_ROW: int = 0
+SUPPLY_ROW: int = 1
+SELL_ROW: int = 2
+PAY_ROW: int = 3
+
+
+def array_ordering_cost(
+    cost_function: Callable[[int], float]
+) -> Callable[[np.ndarray], np.ndarray]:
+    """Returns the ordering cost of a scalar simulation as a function of an array of amounts. It is
+    tried on a few amounts, and a function that only handles a single amount (e.g. one with an if on
+    the amount) is applied to every amount of the array"""
+    amounts = np.array([1, 2, 10])
+    try:
+        costs = np.asarray(cost_function(amounts), dtype=np.float64)
+        if costs.shape == amounts.shape and all(
+            cost == cost_function(int(amount)) for cost, amount in zip(costs, amounts)
+        ):
+            return cost_function
+    except Exception:
+        pass
+    return np.vectorize(cost_function, otypes=[np.float64])
+
+
+class BatchInventorySimulation:
+    """Runs N independent replications of the inventory model in lockstep.
+    In every iteration each replication that is not over processes exactly its next event.
+    The policy and the parameters of the model can be single values or arrays with one value per
+    replication"""
+
+    def __init__(
+        self,
+        s: int | np.ndarray = 10,
+        S: int | np.ndarray = 20,
+        initial_inventory_level: int | np.ndarray = 0,
+        ordering_cost_function: Callable[[np.ndarray], np.ndarray] = lambda x: x * 5,
+        lead_time: int | np.ndarray = 10,
+        holding_cost_rate: int | np.ndarray = 3,
+        holding_pay_time: int | np.ndarray = 60,
+        product_value: int | np.ndarray = 10,
+        client_arrival_sampler: Callable[[np.ndarray], np.ndarray] | None = None,
+        client_demand_sampler: Callable[[np.ndarray], np.ndarray] | None = None,
+        sim_duration: int = 840,
+        seed: int | np.random.SeedSequence | None = None,
+    ):
+        if np.any(np.asarray(s) >= np.asarray(S)):
+            raise Exception("Problem: s >= S and this should not happen")
+        self.s: int | np.ndarray = s
+        """The minimum amount of units in inventory before ask for supply"""
+        self.S: int | np.ndarray = S
+        """The maximum amount of units the store wants to have in stock"""
+        self.initial_inventory_level: int | np.ndarray = initial_inventory_level
+        self.ordering_cost_func: Callable[[np.ndarray], np.ndarray] = ordering_cost_function
+        """Same as in InventorySimulation but it receives an array with the amounts of several orders"""
+        self.lead_time: int | np.ndarray = lead_time
+        self.holding_cost_rate: int | np.ndarray = holding_cost_rate
+        self.holding_pay_time: int | np.ndarray = holding_pay_time
+        self.product_value: int | np.ndarray = product_value
+        self.sim_duration: int = sim_duration
+        self.rng: np.random.Generator = np.random.default_rng(seed)
+        """The random generator used by the default samplers"""
+        # ------ Variables that represents the distributions
+        # A sampler receives the indexes of the replications that need a new value and
+        # returns an array with one value for each one of them
+        self.client_arrival_sampler: Callable[[np.ndarray], np.ndarray] = (
+            client_arrival_sampler
+            if client_arrival_sampler
+            else lambda lanes: self.rng.poisson(5, lanes.size)
+        )
+        self.client_demand_sampler: Callable[[np.ndarray], np.ndarray] = (
+            client_demand_sampler
+            if client_demand_sampler
+            else lambda lanes: self.rng.integers(1, 51, lanes.size)
+        )
+        # ------ The state of the replications, one position of each array per replication
+        self.number_of_runs: int = 0
+        self.policy_s: np.ndarray = np.zeros(0, dtype=np.int64)
+        """The s of the policy of each replication"""
+        self.policy_S: np.ndarray = np.zeros(0, dtype=np.int64)
+        """The S of the policy of each replication"""
+        self.lane_lead_time: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.lane_holding_cost_rate: np.ndarray = np.zeros(0, dtype=np.float64)
+        self.lane_holding_pay_time: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.lane_product_value: np.ndarray = np.zeros(0, dtype=np.float64)
+        self.time: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.inventory_level: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.balance: np.ndarray = np.zeros(0, dtype=np.float64)
+        self.pending_order: np.ndarray = np.zeros(0, dtype=bool)
+        self.supply_amount: np.ndarray = np.zeros(0, dtype=np.int64)
+        """The amount of units of the pending order of each replication"""
+        self.sell_amount: np.ndarray = np.zeros(0, dtype=np.int64)
+        """The amount of units that the next client of each replication wants to buy"""
+        self.sim_over: np.ndarray = np.zeros(0, dtype=bool)
+        self.calendar: np.ndarray = np.zeros((4, 0), dtype=np.int64)
+        """The time of the next event of each kind (rows) for each replication (columns)"""
+        # ------ Totals of each replication
+        self.total_demand: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.total_sold: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.holding_costs: np.ndarray = np.zeros(0, dtype=np.float64)
+        self.supply_costs: np.ndarray = np.zeros(0, dtype=np.float64)
+
+    @classmethod
+    def from_simulation(cls, simulation: InventorySimulation, seed: int | np.random.SeedSequence | None = None):
+        """Creates a batch engine with the same parameters of the simulation. The client
+        distributions of the simulation are scalar functions, so the default samplers are used and the
+        simulation must use the default distributions. Its ordering cost is used on arrays of amounts
+        if it can, otherwise it is applied to every amount (see array_ordering_cost)"""
+        if not simulation.has_default_clients():
+            raise Exception(
+                "The batch engine only knows the default client distributions, without a demand trace"
+            )
+        return cls(
+            s=simulation.s,
+            S=simulation.S,
+            initial_inventory_level=simulation.initial_inventory_level,
+            ordering_cost_function=array_ordering_cost(simulation.ordering_cost_func),
+            lead_time=simulation.lead_time,
+            holding_cost_rate=simulation.holding_cost_rate,
+            holding_pay_time=simulation.holding_pay_time,
+            product_value=simulation.product_value,
+            sim_duration=simulation.sim_duration,
+            seed=seed,
+        )
+
+    def initialize(self, number_of_runs: int):
+        """Creates the state of number_of_runs replications and schedules their first events"""
+        n = number_of_runs
+        self.number_of_runs = n
+        self.policy_s = self.per_lane(self.s, np.int64)
+        self.policy_S = self.per_lane(self.S, np.int64)
+        self.lane_lead_time = self.per_lane(self.lead_time, np.int64)
+        self.lane_holding_cost_rate = self.per_lane(self.holding_cost_rate, np.float64)
+        self.lane_holding_pay_time = self.per_lane(self.holding_pay_time, np.int64)
+        self.lane_product_value = self.per_lane(self.product_value, np.float64)
+        self.time = np.zeros(n, dtype=np.int64)
+        self.inventory_level = self.per_lane(self.initial_inventory_level, np.int64).copy()
+        self.balance = np.zeros(n, dtype=np.float64)
+        self.pending_order = np.zeros(n, dtype=bool)
+        self.supply_amount = np.zeros(n, dtype=np.int64)
+        self.sell_amount = np.zeros(n, dtype=np.int64)
+        self.sim_over = np.zeros(n, dtype=bool)
+        self.calendar = np.full((4, n), NO_EVENT, dtype=np.int64)
+        self.calendar[END_ROW] = self.sim_duration
+        self.calendar[PAY_ROW] = self.lane_holding_pay_time
+        self.total_demand = np.zeros(n, dtype=np.int64)
+        self.total_sold = np.zeros(n, dtype=np.int64)
+        self.holding_costs = np.zeros(n, dtype=np.float64)
+        self.supply_costs = np.zeros(n, dtype=np.float64)
+
+        lanes = np.arange(n)
+        self.verify_supply_policy(lanes)
+        self.generate_client_sell_events(lanes)
+
+    def per_lane(self, value: int | np.ndarray, dtype) -> np.ndarray:
+        """Returns a read only array with the value of a parameter for each replication"""
+        return np.broadcast_to(np.asarray(value, dtype=dtype), (self.number_of_runs,))
+
+    def ordering_cost(self, amount: np.ndarray, lanes: np.ndarray) -> np.ndarray:
+        """Returns the cost of the orders of the given replications"""
+        return self.ordering_cost_func(amount)
+
+    def generate_client_sell_events(self, lanes: np.ndarray):
+        """Schedules the next client of each one of the given replications"""
+        delay = np.asarray(self.client_arrival_sampler(lanes), dtype=np.int64)
+        zero = np.flatnonzero(delay == 0)
+        while zero.size:
+            # Same as the scalar engine, a client never arrives at the current time
+            delay[zero] = self.client_arrival_sampler(lanes[zero])
+            zero = zero[delay[zero] == 0]
+        self.calendar[SELL_ROW, lanes] = self.time[lanes] + delay
+        self.sell_amount[lanes] = self.client_demand_sampler(lanes)
+
+    def verify_supply_policy(self, lanes: np.ndarray):
+        """Places an order in the given replications whose inventory is low and have no pending order"""
+        lanes = lanes[
+            (self.inventory_level[lanes] <= self.policy_s[lanes])
+            & ~self.pending_order[lanes]
+        ]
+        self.supply_amount[lanes] = self.policy_S[lanes] - self.inventory_level[lanes]
+        self.calendar[SUPPLY_ROW, lanes] = self.time[lanes] + self.lane_lead_time[lanes]
+        self.pending_order[lanes] = True
+
+    def process_sell_events(self, lanes: np.ndarray):
+        """Process the arrival of a client in each one of the given replications"""
+        amount = self.sell_amount[lanes]
+        sell_amount = np.minimum(self.inventory_level[lanes], amount)
+        self.balance[lanes] += self.lane_product_value[lanes] * sell_amount
+        self.inventory_level[lanes] -= sell_amount
+        self.total_demand[lanes] += amount
+        self.total_sold[lanes] += sell_amount
+
+    def process_supply_arrival_events(self, lanes: np.ndarray):
+        """Process the arrival of the pending order in each one of the given replications"""
+        amount = self.supply_amount[lanes]
+        cost = self.ordering_cost(amount, lanes)
+        self.inventory_level[lanes] += amount
+        self.balance[lanes] -= cost
+        self.supply_costs[lanes] += cost
+        self.pending_order[lanes] = False
+        self.calendar[SUPPLY_ROW, lanes] = NO_EVENT
+
+    def process_pay_holding_events(self, lanes: np.ndarray):
+        """Process the payment for holding inventory in each one of the given replications"""
+        hold_cost = self.lane_holding_cost_rate[lanes] * self.inventory_level[lanes]
+        # The scalar engine adds the holding cost to the balance, both engines must agree
+        self.balance[lanes] += hold_cost
+        self.holding_costs[lanes] += hold_cost
+        self.calendar[PAY_ROW, lanes] += self.lane_holding_pay_time[lanes]
+
+    def step(self, lanes: np.ndarray):
+        """Process the next event of each one of the given replications"""
+        rows = self.calendar[:, lanes].argmin(axis=0)
+        self.time[lanes] = self.calendar[rows, lanes]
+
+        self.sim_over[lanes[rows == END_ROW]] = True
+        self.process_supply_arrival_events(lanes[rows == SUPPLY_ROW])
+        sells = lanes[rows == SELL_ROW]
+        self.process_sell_events(sells)
+        self.generate_client_sell_events(sells)
+        self.process_pay_holding_events(lanes[rows == PAY_ROW])
+
+        self.verify_supply_policy(lanes[rows != END_ROW])
+
+    def run(self, number_of_runs: int):
+        """Run number_of_runs replications of the simulation"""
+        self.initialize(number_of_runs)
+        lanes = np.arange(number_of_runs)
+        while lanes.size:
+            self.step(lanes)
+            lanes = lanes[~self.sim_over[lanes]]
+
+    def run_policies(
+        self, s: np.ndarray, S: np.ndarray, number_of_runs: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Runs number_of_runs replications of every policy (s[i], S[i]) at once and returns the loss,
+        costs and final balance of the runs as arrays with a row per policy"""
+        policies = len(s)
+        self.s = np.repeat(np.asarray(s, dtype=np.int64), number_of_runs)
+        self.S = np.repeat(np.asarray(S, dtype=np.int64), number_of_runs)
+        self.run(policies * number_of_runs)
+        shape = (policies, number_of_runs)
+        return (
+            self.loss().reshape(shape),
+            self.costs().reshape(shape),
+            self.balance.reshape(shape),
+        )
+
+    def loss(self) -> np.ndarray:
+        """The money lost in sales by each replication of the last run"""
+        return self.lane_product_value * (self.total_demand - self.total_sold)
+
+    def costs(self) -> np.ndarray:
+        """The money spent in holding inventory and supplies by each replication of the last run"""
+        return self.holding_costs + self.supply_costs
+
+    def calculate_statistics_results(self, number_of_runs: int = 40) -> StatisticsResults:
+        """Same as SimStatistics.calculate_statistics_results but all the runs are done at once"""
+        self.run(number_of_runs)
+        return StatisticsResults.from_samples(self.loss(), self.costs(), self.balance)
+
+
+class SharedStreamBatchSimulation(BatchInventorySimulation):
+    """Batch engine where the replications of different policies see the same clients. With lost sales
+    the arrivals and demands of the clients do not depend on the policy, so the clients of every
+    replication are drawn once before the run and each lane only keeps a counter of the next client
+    of its stream. This gives common random numbers between the policies without any extra draw"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.replications: int | None = None
+        """The number of client streams. The lane i uses the stream i % replications, by default
+        every lane has its own stream"""
+        self.arrival_times: np.ndarray = np.zeros((0, 0), dtype=np.int64)
+        """The arrival time of every client (columns) of every stream (rows)"""
+        self.demands: np.ndarray = np.zeros((0, 0), dtype=np.int64)
+        """The amount of units that every client of every stream wants to buy"""
+        self.lane_stream: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.next_client: np.ndarray = np.zeros(0, dtype=np.int64)
+        """The index of the next client of the stream of each lane"""
+
+    def draw_client_streams(self, replications: int, block_size: int = 256):
+        """Draws the clients of every stream until all of them arrive after the end of the simulation"""
+        streams = np.arange(replications)
+        blocks_times, blocks_demands = [], []
+        last = np.zeros(replications, dtype=np.int64)
+        while not blocks_times or np.any(last <= self.sim_duration):
+            lanes = np.tile(streams, block_size)
+            delay = np.asarray(self.client_arrival_sampler(lanes), dtype=np.int64)
+            zero = np.flatnonzero(delay == 0)
+            while zero.size:
+                # Same as the scalar engine, a client never arrives at the time of the previous one
+                delay[zero] = self.client_arrival_sampler(lanes[zero])
+                zero = zero[delay[zero] == 0]
+            times = last[:, None] + np.cumsum(delay.reshape(block_size, replications).T, axis=1)
+            blocks_times.append(times)
+            blocks_demands.append(
+                np.asarray(self.client_demand_sampler(lanes), dtype=np.int64)
+                .reshape(block_size, replications)
+                .T
+            )
+            last = times[:, -1]
+        self.arrival_times = np.concatenate(blocks_times, axis=1)
+        self.demands = np.concatenate(blocks_demands, axis=1)
+
+    def initialize(self, number_of_runs: int):
+        replications = self.replications or number_of_runs
+        self.draw_client_streams(replications)
+        self.lane_stream = np.arange(number_of_runs) % replications
+        self.next_client = np.zeros(number_of_runs, dtype=np.int64)
+        super().initialize(number_of_runs)
+
+    def generate_client_sell_events(self, lanes: np.ndarray):
+        streams, clients = self.lane_stream[lanes], self.next_client[lanes]
+        self.calendar[SELL_ROW, lanes] = self.arrival_times[streams, clients]
+        self.sell_amount[lanes] = self.demands[streams, clients]
+        self.next_client[lanes] += 1
+
+    def run_policies(
+        self, s: np.ndarray, S: np.ndarray, number_of_runs: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Same as BatchInventorySimulation.run_policies, but the run i of every policy sees the
+        clients of the same stream"""
+        self.replications = number_of_runs
+        try:
+            return super().run_policies(s, S, number_of_runs)
+        finally:
+            self.replications = None
+
+    def evaluate_policies(
+        self, s: np.ndarray, S: np.ndarray, number_of_runs: int = 40
+    ) -> list[StatisticsResults]:
+        """Returns the statistics of number_of_runs runs of every policy (s[i], S[i]), all of them
+        simulated at once over the same client streams"""
+        loss, costs, balance = self.run_policies(s, S, number_of_runs)
+        return [
+            StatisticsResults.from_samples(loss[i], costs[i], balance[i])
+            for i in range(len(loss))
+        ]
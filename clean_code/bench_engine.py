@@ -0,0 +1,149 @@
+# This file measures how many events per second the simulation engine processes with its
+# different event cores and checks that all of them produce the same runs.
+# Usage: python bench_engine.py [--runs 200] [--duration 840]
+import argparse
+import heapq
+import time
+
+from simulation_engine import InventorySimulation
+from events import *
+from parallel import replication_seed, seed_generators
+
+
+class LegacyEventQueue:
+    """The event queue as it was before HeapEventQueue: the heap stores the Event objects, so
+    every comparison calls Event.__lt__"""
+
+    def __init__(self) -> None:
+        self.heap: list[Event] = []
+
+    def push(self, event: Event):
+        heapq.heappush(self.heap, event)
+
+    def pop(self) -> Event:
+        return heapq.heappop(self.heap)
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+
+class LegacyInventorySimulation(InventorySimulation):
+    """The event core as it was before the dispatch table: a LegacyEventQueue and the handler
+    chosen with an isinstance chain"""
+
+    def create_event_queue(self) -> LegacyEventQueue:
+        return LegacyEventQueue()
+
+    def process_event(self, event: Event):
+        if isinstance(event, SellEvent):
+            self.process_sell_event(event)
+            self.generate_client_sell_event()
+        elif isinstance(event, SupplyArrivalEvent):
+            self.process_supply_arrival_event(event)
+        elif isinstance(event, PayHoldingEvent):
+            self.process_pay_holding_event(event)
+        elif isinstance(event, SimulationEndEvent):
+            self.process_simulation_end(event)
+        else:
+            raise Exception("Unknown event type")
+
+
+class QueueMethodsSimulation(InventorySimulation):
+    """The engine calling the push and pop methods of every queue, the heap included, to measure
+    what inlining heapq in the engine saves"""
+
+    def add_to_event_queue(self, event: Event):
+        self.event_queue.push(event)
+
+    def get_next_event_in_queue(self) -> Event:
+        return self.event_queue.pop()
+
+
+def measure_events_per_second(
+    simulation: InventorySimulation, runs: int, seed: int = 0
+) -> tuple[float, int, list[float]]:
+    """Runs the simulation 'runs' times and returns the events per second, the number of events
+    processed and the final balance of every run"""
+    events = 0
+    balances = []
+    elapsed = 0.0
+    for i in range(runs):
+        seed_generators(replication_seed(seed, i))
+        start = time.perf_counter()
+        simulation.initialize()
+        while not simulation.sim_over:
+            simulation.step()
+            events += 1
+        elapsed += time.perf_counter() - start
+        balances.append(simulation.actual_balance)
+    return events / elapsed, events, balances
+
+
+def measure_queue_operations(queue_class: type, operations: int = 200_000) -> float:
+    """Returns the pop+push pairs per second of an event queue holding one event of each kind,
+    the same load that the inventory model puts on it"""
+    queue = queue_class()
+    events: list[Event] = [
+        SimulationEndEvent(10**12),
+        SupplyArrivalEvent(10, 5),
+        SellEvent(3, 5),
+        PayHoldingEvent(60),
+    ]
+    for event in events:
+        queue.push(event)
+    delays = [0, 10, 5, 60]
+    start = time.perf_counter()
+    for _ in range(operations):
+        event = queue.pop()
+        event.time += delays[event.priority]
+        queue.push(event)
+    return operations / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--duration", type=int, default=840)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for queue_class in (LegacyEventQueue, HeapEventQueue, SlotEventQueue):
+        speed = max(measure_queue_operations(queue_class) for _ in range(args.repeat))
+        print(f"{queue_class.__name__}: {speed:,.0f} pop+push/s")
+
+    parameters = dict(s=20, S=300, initial_inventory_level=100, sim_duration=args.duration)
+    results = {}
+    engines = [
+        (
+            "before (heap of Event objects, isinstance dispatch)",
+            LegacyInventorySimulation(**parameters),
+        ),
+        (
+            "heap scheduler (tuple heap entries, dispatch table)",
+            InventorySimulation(**parameters, scheduler="heap"),
+        ),
+        (
+            "heap scheduler through the HeapEventQueue methods",
+            QueueMethodsSimulation(**parameters, scheduler="heap"),
+        ),
+        (
+            "slots scheduler (one slot per event kind, dispatch table)",
+            InventorySimulation(**parameters, scheduler="slots"),
+        ),
+    ]
+    for name, simulation in engines:
+        measures = [
+            measure_events_per_second(simulation, args.runs, args.seed)
+            for _ in range(args.repeat)
+        ]
+        speed = max(measure[0] for measure in measures)
+        _, events, balances = measures[0]
+        results[name] = balances
+        print(f"{name}: {events} events, {speed:,.0f} events/s")
+    if len({tuple(balances) for balances in results.values()}) != 1:
+        raise Exception("The engines did not produce the same runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,483 @@
+# This file contains the benchmark suite of the engine, the statistics, the optimizer and the plots.
+# Every case uses fixed seeds, so two runs of the suite simulate exactly the same thing.
+# Usage:
+#   python benchmarks.py [--quick] [--save results.json] [--compare baseline.json] [--only engine]
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable
+
+from simulation_engine import InventorySimulation
+from sim_stats import SimStatistics, FlattenRegistry
+from batch_engine import BatchInventorySimulation
+from optimizer import OptimizeSimulation, default_fitness
+from parallel import replication_seed, seed_generators
+
+DAY: int = 840
+"""A working day of the store in minutes"""
+HORIZONS: dict[str, int] = {"day": DAY, "month": 30 * DAY, "year": 365 * DAY}
+IMPORT_BUDGETS: dict[str, float] = {
+    "simulation_engine": 0.3,
+    "sim_stats": 0.4,
+    "batch_engine": 0.4,
+    "optimizer": 0.5,
+}
+"""The maximum seconds that importing each module in a new interpreter may take. None of them may
+load matplotlib, it is only needed by graphics when something is plotted"""
+
+
+class BenchmarkResult:
+    """The measures of a single benchmark case"""
+
+    def __init__(
+        self,
+        group: str,
+        name: str,
+        parameters: dict,
+        seconds: float,
+        work: int,
+        unit: str,
+        peak_memory: int,
+    ) -> None:
+        self.group: str = group
+        self.name: str = name
+        self.parameters: dict = parameters
+        self.seconds: float = seconds
+        """The best wall time of the repetitions"""
+        self.work: int = work
+        """How much work the case did (events, runs, policies...), used for the throughput"""
+        self.unit: str = unit
+        self.peak_memory: int = peak_memory
+        """The peak of memory allocated by python during the case, in bytes"""
+
+    def key(self) -> str:
+        return f"{self.group}/{self.name}"
+
+    def throughput(self) -> float:
+        return self.work / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "group": self.group,
+            "name": self.name,
+            "parameters": self.parameters,
+            "seconds": self.seconds,
+            "work": self.work,
+            "unit": self.unit,
+            "throughput": self.throughput(),
+            "peak_memory": self.peak_memory,
+        }
+
+
+def measure(
+    group: str,
+    name: str,
+    parameters: dict,
+    case: Callable[[], tuple[int, str]],
+    repeat: int = 1,
+) -> BenchmarkResult:
+    """Runs the case 'repeat' times to take the best time and once more under tracemalloc to take
+    the peak memory, so the memory tracing does not slow down the timed runs"""
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        work, unit = case()
+        seconds = min(seconds, time.perf_counter() - start)
+    tracemalloc.start()
+    case()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return BenchmarkResult(group, name, parameters, seconds, work, unit, peak)
+
+
+def new_simulation(duration: int = DAY, **kwargs) -> InventorySimulation:
+    return InventorySimulation(
+        s=20, S=300, initial_inventory_level=100, sim_duration=duration, **kwargs
+    )
+
+
+def engine_cases(quick: bool, seed: int) -> list[BenchmarkResult]:
+    """InventorySimulation.step for short and long horizons"""
+    results = []
+    horizons = ["day", "month"] if quick else ["day", "month", "year"]
+    for horizon in horizons:
+        for recording_level in ("full", "columnar", "totals"):
+            simulation = new_simulation(HORIZONS[horizon], recording_level=recording_level)
+
+            def case():
+                seed_generators(replication_seed(seed, 0))
+                simulation.initialize()
+                events = 0
+                while not simulation.sim_over:
+                    simulation.step()
+                    events += 1
+                return events, "events"
+
+            results.append(
+                measure(
+                    "engine",
+                    f"step/{horizon}/{recording_level}",
+                    {"horizon": HORIZONS[horizon], "recording_level": recording_level},
+                    case,
+                )
+            )
+    return results
+
+
+def registry_cases(quick: bool, seed: int) -> list[BenchmarkResult]:
+    """FlattenRegistry of the registry of a run"""
+    results = []
+    horizons = ["day", "month"] if quick else ["day", "month", "year"]
+    for horizon in horizons:
+        simulation = new_simulation(HORIZONS[horizon])
+        seed_generators(replication_seed(seed, 0))
+        simulation.run()
+        records = sum(simulation.registry.record_counts().values())
+
+        def case():
+            FlattenRegistry(simulation.registry)
+            return records, "records"
+
+        results.append(
+            measure(
+                "registry",
+                f"flatten/{horizon}",
+                {"horizon": HORIZONS[horizon]},
+                case,
+            )
+        )
+    return results
+
+
+def statistics_cases(quick: bool, seed: int) -> list[BenchmarkResult]:
+    """SimStatistics.calculate_statistics_results and the batch engine for several numbers of runs"""
+    results = []
+    scalar_runs = [2, 10, 40] if quick else [2, 10, 40, 100, 1000]
+    batch_runs = [2, 10, 100, 1000] if quick else [2, 10, 100, 1000, 10000]
+    for runs in scalar_runs:
+        stats = SimStatistics(new_simulation())
+        results.append(
+            measure(
+                "statistics",
+                f"scalar/{runs}",
+                {"runs": runs},
+                lambda: (stats.calculate_statistics_results(runs, seed=seed), (runs, "runs"))[1],
+            )
+        )
+    for runs in batch_runs:
+        batch = BatchInventorySimulation.from_simulation(new_simulation(), seed=seed)
+        results.append(
+            measure(
+                "statistics",
+                f"batch/{runs}",
+                {"runs": runs},
+                lambda: (batch.calculate_statistics_results(runs), (runs, "runs"))[1],
+            )
+        )
+    return results
+
+
+def optimizer_cases(quick: bool, seed: int) -> list[BenchmarkResult]:
+    """OptimizeSimulation.optimize and the successive halving search for realistic max_value"""
+    results = []
+    for max_value in [100, 300] if not quick else [100]:
+        def case():
+            seed_generators(replication_seed(seed, 0))
+            optimizer = OptimizeSimulation(
+                new_simulation(), (20, 100), 40, max_value, streaming=True, seed=seed
+            )
+            optimizer.optimize(steps_search=5)
+            return optimizer.simulated_runs, "runs"
+
+        results.append(
+            measure("optimizer", f"optimize/{max_value}", {"max_value": max_value}, case)
+        )
+
+        def case():
+            seed_generators(replication_seed(seed, 0))
+            optimizer = OptimizeSimulation(
+                new_simulation(), (20, 100), 40, max_value, seed=seed, shared_streams=True
+            )
+            optimizer.optimize(steps_search=5)
+            return optimizer.simulated_runs, "runs"
+
+        results.append(
+            measure(
+                "optimizer", f"optimize_shared/{max_value}", {"max_value": max_value}, case
+            )
+        )
+
+        def case():
+            optimizer = OptimizeSimulation(
+                new_simulation(), (20, 100), 40, max_value, streaming=True, seed=seed
+            )
+            optimizer.bayesian_optimize(seed=seed, workers=1)
+            return optimizer.simulated_runs, "runs"
+
+        results.append(
+            measure(
+                "optimizer", f"bayesian_optimize/{max_value}", {"max_value": max_value}, case
+            )
+        )
+    for max_value in [30, 60] if quick else [30, 60, 100]:
+        def case():
+            optimizer = OptimizeSimulation(new_simulation(), (20, 30), 40, max_value)
+            optimizer.successive_halving(seed=seed, workers=1)
+            return optimizer.simulated_runs, "runs"
+
+        results.append(
+            measure(
+                "optimizer",
+                f"successive_halving/{max_value}",
+                {"max_value": max_value},
+                case,
+            )
+        )
+
+        def case():
+            optimizer = OptimizeSimulation(new_simulation(), (20, 30), 40, max_value)
+            s, S = optimizer.all_policies()
+            optimizer.prescreen(top=20, workers=1)
+            return len(s), "policies"
+
+        results.append(
+            measure("optimizer", f"prescreen/{max_value}", {"max_value": max_value}, case)
+        )
+    return results
+
+
+def search_cases(quick: bool, seed: int) -> list[BenchmarkResult]:
+    """The runs each search needs and the quality of the policy it returns. The policies are scored
+    with the same independent runs, not with the runs of the search, so a lucky search is not favored.
+    The work of a case is its simulated runs, and the fitness of its policy is in the parameters"""
+    results = []
+    scoring_runs = 200 if quick else 1000
+    searches = {
+        "hill_climbing": lambda optimizer: optimizer.optimize(steps_search=40),
+        "successive_halving": lambda optimizer: optimizer.successive_halving(
+            seed=seed, workers=1
+        ),
+        "bayesian": lambda optimizer: optimizer.bayesian_optimize(seed=seed, workers=1),
+    }
+    for max_value in [100] if quick else [100, 300]:
+        for name, search in searches.items():
+            seed_generators(replication_seed(seed, 0))
+            simulation = new_simulation()
+            optimizer = OptimizeSimulation(
+                simulation, (20, 100), 40, max_value, streaming=True, seed=seed
+            )
+            start = time.perf_counter()
+            s, S = search(optimizer)
+            seconds = time.perf_counter() - start
+            simulation.s, simulation.S = s, S
+            scored = SimStatistics(simulation).calculate_streaming_statistics_results(
+                scoring_runs, seed=seed + 1
+            )
+            results.append(
+                BenchmarkResult(
+                    "search",
+                    f"{name}/{max_value}",
+                    {
+                        "max_value": max_value,
+                        "policy": [s, S],
+                        "fitness": default_fitness(scored),
+                        "scoring_runs": scoring_runs,
+                    },
+                    seconds,
+                    optimizer.simulated_runs,
+                    "runs",
+                    0,
+                )
+            )
+    return results
+
+
+def report_run_reduction(results: list[dict]):
+    """Prints how many times the runs of the Bayesian search the other searches needed, and the fitness
+    of the policies they returned (lower is better)"""
+    searches = {r["name"]: r for r in results if r["group"] == "search"}
+    for key, bayesian in searches.items():
+        if not key.startswith("bayesian/"):
+            continue
+        max_value = key.split("/")[1]
+        for other in ("hill_climbing", "successive_halving"):
+            result = searches.get(f"{other}/{max_value}")
+            if result is None:
+                continue
+            print(
+                f"max_value {max_value}: {other} used {result['work'] / bayesian['work']:.1f}x the "
+                f"runs of bayesian ({result['work']} vs {bayesian['work']}), fitness "
+                f"{result['parameters']['fitness']:,.0f} vs {bayesian['parameters']['fitness']:,.0f}"
+            )
+
+
+def plotting_cases(quick: bool, seed: int) -> list[BenchmarkResult]:
+    """The plots of Graphics for short and long runs, rendered without a window"""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from graphics import Graphics
+
+    results = []
+    horizons = ["day"] if quick else ["day", "month"]
+    for horizon in horizons:
+        simulation = new_simulation(HORIZONS[horizon])
+        seed_generators(replication_seed(seed, 0))
+        simulation.run()
+        graphics = Graphics(SimStatistics(simulation))
+        points = sum(simulation.registry.record_counts().values())
+
+        def case():
+            graphics.plot_sells()
+            graphics.plot_balance()
+            graphics.plot_loss(simulation.product_value)
+            graphics.plot_inventory_holding_cost()
+            graphics.plot_supply_costs()
+            plt.close("all")
+            return points, "points"
+
+        results.append(
+            measure("plotting", f"all_plots/{horizon}", {"horizon": HORIZONS[horizon]}, case)
+        )
+    return results
+
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s*(\d+)\s*\|\s*(\d+)\s*\|\s*(\S.*)$")
+"""A line of -X importtime: the self and cumulative microseconds and the name of the module, indented
+by its depth. The header and any other line written to stderr do not match"""
+
+
+def cold_import(module: str) -> tuple[float, bool]:
+    """Imports the module in a new interpreter and returns the seconds the import took, as measured
+    by -X importtime, and whether matplotlib was loaded"""
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            f"import sys, {module}; print(any(m.startswith('matplotlib') for m in sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    for line in reversed(process.stderr.splitlines()):
+        match = IMPORT_TIME_LINE.match(line)
+        if match is not None and match.group(3).strip() == module:
+            return int(match.group(2)) / 1e6, process.stdout.strip() == "True"
+    raise Exception(f"No import time of {module}")
+
+
+def import_cases(quick: bool, seed: int) -> list[BenchmarkResult]:
+    """The cold import time of the modules used by the workers and the command line tools"""
+    results = []
+    for module, budget in IMPORT_BUDGETS.items():
+        measures = [cold_import(module) for _ in range(3)]
+        results.append(
+            BenchmarkResult(
+                "imports",
+                module,
+                {
+                    "budget": budget,
+                    "loads_matplotlib": any(loaded for _, loaded in measures),
+                },
+                min(seconds for seconds, _ in measures),
+                1,
+                "imports",
+                0,
+            )
+        )
+    return results
+
+
+def check_import_budgets(results: list[dict]) -> bool:
+    """Prints the imports over their budget or loading matplotlib and returns if all of them are fine"""
+    fine = True
+    for result in results:
+        if result["group"] != "imports":
+            continue
+        if result["seconds"] > result["parameters"]["budget"]:
+            print(
+                f"{result['name']} takes {result['seconds']:.3f}s to import, "
+                f"the budget is {result['parameters']['budget']}s"
+            )
+            fine = False
+        if result["parameters"]["loads_matplotlib"]:
+            print(f"{result['name']} loads matplotlib when imported")
+            fine = False
+    return fine
+
+
+GROUPS: dict[str, Callable[[bool, int], list[BenchmarkResult]]] = {
+    "imports": import_cases,
+    "engine": engine_cases,
+    "registry": registry_cases,
+    "statistics": statistics_cases,
+    "optimizer": optimizer_cases,
+    "search": search_cases,
+    "plotting": plotting_cases,
+}
+
+
+def compare(results: list[dict], baseline: list[dict]):
+    """Prints the change of time of every case that is also in the baseline"""
+    old = {f"{r['group']}/{r['name']}": r for r in baseline}
+    for result in results:
+        key = f"{result['group']}/{result['name']}"
+        if key not in old:
+            continue
+        ratio = result["seconds"] / old[key]["seconds"]
+        print(f"{key:45} {old[key]['seconds']:10.4f}s -> {result['seconds']:10.4f}s  x{ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quick", action="store_true", help="skip the largest cases")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", choices=list(GROUPS), default=list(GROUPS))
+    parser.add_argument("--save", help="file where the results are written as json")
+    parser.add_argument("--compare", help="json file of a previous run to compare with")
+    args = parser.parse_args()
+
+    results = []
+    for group in args.only:
+        for result in GROUPS[group](args.quick, args.seed):
+            print(
+                f"{result.key():45} {result.seconds:10.4f}s "
+                f"{result.throughput():14,.0f} {result.unit}/s "
+                f"{result.peak_memory / 2**20:9.2f} MiB"
+            )
+            results.append(result.as_dict())
+
+    report_run_reduction(results)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file)["results"])
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "seed": args.seed,
+                    "quick": args.quick,
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+    if not check_import_budgets(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# This file contains the recorded demand traces used to replay real clients in the simulation instead of
+# drawing them from the distributions. A trace is a directory with two .npy columns, the arrival time of
+# every client (sorted) and the units it asked for. The columns are memory-mapped and read in chunks,
+# so a trace of any size is never loaded in memory, and all the readers of a trace share the same mapping
+import csv
+import json
+import os
+
+import numpy as np
+
+from result_store import ColumnWriter
+
+TRACE_COLUMNS: dict[str, np.dtype] = {
+    "time": np.dtype(np.int64),
+    "quantity": np.dtype(np.int64),
+}
+
+
+class DemandTraceWriter:
+    """Writes a trace appending the clients in chunks, so it can be built from a history larger than the
+    memory. The arrival times must be sorted. Use it as a context manager, the trace is complete once
+    it is closed"""
+
+    def __init__(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        self.path: str = path
+        self.columns: dict[str, ColumnWriter] = {
+            name: ColumnWriter(os.path.join(path, f"{name}.npy"), dtype)
+            for name, dtype in TRACE_COLUMNS.items()
+        }
+        self.last_time: int | None = None
+
+    def append(self, times, quantities):
+        times = np.asarray(times, dtype=np.int64)
+        quantities = np.asarray(quantities, dtype=np.int64)
+        if len(times) != len(quantities):
+            raise Exception("Every client needs an arrival time and a quantity")
+        if len(times) == 0:
+            return
+        if np.any(np.diff(times) < 0) or (
+            self.last_time is not None and times[0] < self.last_time
+        ):
+            raise Exception("The arrival times of the trace must be sorted")
+        self.columns["time"].append(times)
+        self.columns["quantity"].append(quantities)
+        self.last_time = int(times[-1])
+
+    def close(self):
+        for column in self.columns.values():
+            column.close()
+        with open(os.path.join(self.path, "trace.json"), "w") as file:
+            json.dump({"clients": self.columns["time"].length}, file, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_demand_trace(path: str, times, quantities) -> "DemandTrace":
+    """Writes a trace that fits in memory and returns it opened"""
+    with DemandTraceWriter(path) as writer:
+        writer.append(times, quantities)
+    return DemandTrace(path)
+
+
+def import_csv(
+    csv_path: str,
+    path: str,
+    time_column: str = "time",
+    quantity_column: str = "quantity",
+    chunk_size: int = 1_000_000,
+) -> "DemandTrace":
+    """Converts a point of sale history in csv (with a header, sorted by time) to a trace, chunk_size
+    rows at a time"""
+    with open(csv_path, newline="") as file, DemandTraceWriter(path) as writer:
+        times, quantities = [], []
+        for row in csv.DictReader(file):
+            times.append(int(row[time_column]))
+            quantities.append(int(row[quantity_column]))
+            if len(times) == chunk_size:
+                writer.append(times, quantities)
+                times, quantities = [], []
+        writer.append(times, quantities)
+    return DemandTrace(path)
+
+
+class DemandTrace:
+    """A trace written by DemandTraceWriter. Opening it only maps the columns, the clients are read by
+    the readers when they are needed"""
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self.times: np.ndarray = np.load(os.path.join(path, "time.npy"), mmap_mode="r")
+        self.quantities: np.ndarray = np.load(
+            os.path.join(path, "quantity.npy"), mmap_mode="r"
+        )
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def start_index(self, time: int) -> int:
+        """The index of the first client that arrives at or after the time. The search only reads the
+        few pages of the mapping it visits"""
+        return int(np.searchsorted(self.times, time, side="left"))
+
+    def reader(self, start_time: int = 0, chunk_size: int = 65536) -> "TraceReader":
+        """Returns a reader of the clients from start_time on"""
+        return TraceReader(self, self.start_index(start_time), chunk_size)
+
+    def windows(self, duration: int, start_time: int | None = None) -> list[int]:
+        """The start times of the consecutive windows of 'duration' covered by the trace, e.g. to use
+        every day of the history as a replication"""
+        if len(self) == 0:
+            return []
+        first = int(self.times[0]) if start_time is None else start_time
+        return list(range(first, int(self.times[-1]) - duration + 2, duration))
+
+
+class TraceReader:
+    """Reads the clients of a trace in order, chunk_size clients at a time. Only the actual chunk is in
+    memory. Copying a reader copies its position, not the trace"""
+
+    def __init__(self, trace: DemandTrace, index: int = 0, chunk_size: int = 65536) -> None:
+        self.trace: DemandTrace = trace
+        self.chunk_size: int = chunk_size
+        self.chunk_start: int = index
+        """The index in the trace of the first client of the chunk"""
+        self.times: list[int] = []
+        self.quantities: list[int] = []
+        self.index: int = 0
+        """The index in the chunk of the next client"""
+
+    def load_chunk(self, start: int):
+        end = start + self.chunk_size
+        self.chunk_start = start
+        self.times = self.trace.times[start:end].tolist()
+        self.quantities = self.trace.quantities[start:end].tolist()
+        self.index = 0
+
+    def next_client(self) -> tuple[int, int] | None:
+        """Returns the arrival time and the quantity of the next client, or None at the end of the trace"""
+        if self.index == len(self.times):
+            self.load_chunk(self.chunk_start + len(self.times))
+            if not self.times:
+                return None
+        client = self.times[self.index], self.quantities[self.index]
+        self.index += 1
+        return client
+
+    def position(self) -> int:
+        """The index in the trace of the next client"""
+        return self.chunk_start + self.index
+
+    def get_state(self) -> int:
+        return self.position()
+
+    def set_state(self, state: int):
+        if self.chunk_start <= state <= self.chunk_start + len(self.times):
+            self.index = state - self.chunk_start
+        else:
+            self.load_chunk(state)
+
+    def __deepcopy__(self, memo: dict) -> "TraceReader":
+        return TraceReader(self.trace, self.position(), self.chunk_size)
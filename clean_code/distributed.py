@@ -0,0 +1,237 @@
+# This file contains a coordinator/worker backend that spreads the replications of several policies over
+# many machines. The coordinator serves two queues over TCP with a multiprocessing manager: the workers
+# take batches of replications (policy, parameters, seed range) from one queue and put the accumulators
+# of the batch in the other one. The batches are small and deterministic, so a batch lost with its worker
+# is sent again and the merged results do not depend on the workers or the order they finish.
+#
+# Usage:
+#   coordinator:  backend = DistributedBackend(("0.0.0.0", 50000), b"secret"); backend.start()
+#                 OptimizeSimulation(simulation, (20, 100), 40, 300, seed=0, backend=backend)
+#   every node:   python distributed.py --host <coordinator> --port 50000 --authkey secret --workers 4
+import argparse
+import queue
+import threading
+import time
+from multiprocessing.managers import BaseManager
+from typing import Iterable
+
+from simulation_engine import InventorySimulation
+from sim_stats import SimStatistics, StatisticsResults, WelfordAccumulator
+from parallel import pool_context, replication_seed
+from model_parameters import build_simulation, simulation_parameters
+
+
+class QueueManager(BaseManager):
+    """Serves the queue of batches ("batches") and the queue of their results ("results")"""
+
+
+QueueManager.register("batches")
+QueueManager.register("results")
+
+
+def run_batch(
+    parameters: dict, s: int, S: int, seed: int, replications: range
+) -> tuple[WelfordAccumulator, WelfordAccumulator, WelfordAccumulator]:
+    """Runs the replications of a batch and returns the accumulators of their loss, costs and balance"""
+    stats = SimStatistics(build_simulation(parameters, s, S))
+    accumulators = WelfordAccumulator(), WelfordAccumulator(), WelfordAccumulator()
+    for i in replications:
+        for accumulator, value in zip(
+            accumulators, stats.run_replication(replication_seed(seed, i))
+        ):
+            accumulator.update(value)
+    return accumulators
+
+
+def run_worker(address: tuple[str, int], authkey: bytes):
+    """Takes batches from the coordinator and sends back their results until it receives None or the
+    coordinator is gone"""
+    manager = QueueManager(address=address, authkey=authkey)
+    manager.connect()
+    batches, results = manager.batches(), manager.results()
+    try:
+        while (batch := batches.get()) is not None:
+            key, parameters, s, S, seed, replications = batch
+            # Tells the coordinator the batch is running, the timeout starts now
+            results.put((key, None))
+            try:
+                results.put((key, run_batch(parameters, s, S, seed, replications)))
+            except Exception as error:
+                results.put((key, error))
+    except (EOFError, ConnectionError):
+        pass
+
+
+def start_local_workers(
+    address: tuple[str, int], authkey: bytes, count: int
+) -> list:
+    """Starts worker processes in this machine, e.g. to test the backend without other nodes"""
+    processes = [
+        pool_context().Process(target=run_worker, args=(address, authkey), daemon=True)
+        for _ in range(count)
+    ]
+    for process in processes:
+        process.start()
+    return processes
+
+
+class DistributedBackend:
+    """The coordinator. It splits the runs of every policy in batches of batch_size replications, sends
+    them to the workers and merges their results in the order of the batches. A batch lost with its
+    worker is sent again 'timeout' seconds after it was taken, up to max_attempts times, and an
+    evaluation fails when no worker answers in 'timeout' seconds"""
+
+    def __init__(
+        self,
+        address: tuple[str, int] = ("127.0.0.1", 0),
+        authkey: bytes = b"inventory",
+        batch_size: int = 10,
+        timeout: float = 60.0,
+        max_attempts: int = 3,
+    ) -> None:
+        self.address: tuple[str, int] = address
+        self.authkey: bytes = authkey
+        self.batch_size: int = batch_size
+        self.timeout: float = timeout
+        self.max_attempts: int = max_attempts
+        self.batches: queue.Queue = queue.Queue()
+        self.results: queue.Queue = queue.Queue()
+        self.jobs: int = 0
+        """The number of evaluations sent, it tells apart the batches of different evaluations"""
+        self.resent_batches: int = 0
+
+    def start(self):
+        """Starts serving the queues in a thread of this process"""
+        # A subclass per coordinator, register changes the class and the queues are the ones of this backend
+        manager_class = type("CoordinatorManager", (QueueManager,), {})
+        manager_class.register("batches", callable=lambda: self.batches)
+        manager_class.register("results", callable=lambda: self.results)
+        server = manager_class(address=self.address, authkey=self.authkey).get_server()
+        self.address = server.address
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop_workers(self, count: int):
+        """Tells 'count' workers to finish once they are idle"""
+        for _ in range(count):
+            self.batches.put(None)
+
+    def evaluate(
+        self,
+        parameters: dict,
+        policies: Iterable[tuple[int, int]],
+        number_of_runs: int,
+        seed: int,
+    ) -> list[StatisticsResults]:
+        """Returns the statistics of number_of_runs runs of every policy. The run i of every policy uses
+        the seed of the replication i, as SimStatistics.calculate_statistics_results"""
+        self.jobs += 1
+        policies = list(policies)
+        batches = {}
+        for policy, (s, S) in enumerate(policies):
+            for start in range(0, number_of_runs, self.batch_size):
+                replications = range(start, min(start + self.batch_size, number_of_runs))
+                batches[(self.jobs, policy, start)] = (parameters, s, S, seed, replications)
+        partials = self.collect(batches)
+
+        results = []
+        for policy in range(len(policies)):
+            merged = WelfordAccumulator(), WelfordAccumulator(), WelfordAccumulator()
+            for key in sorted(key for key in partials if key[1] == policy):
+                for accumulator, partial in zip(merged, partials[key]):
+                    accumulator.merge(partial)
+            results.append(StatisticsResults.from_accumulators(*merged))
+        return results
+
+    def collect(self, batches: dict[tuple, tuple]) -> dict[tuple, tuple]:
+        """Sends the batches and waits for all their results. Every batch has a deadline 'timeout' seconds
+        after it is sent, restarted when a worker takes it. A batch without result at its deadline is
+        sent again if it left the queue (its worker was lost). A batch still in the queue only waits more
+        if some worker sent a message in the last 'timeout' seconds, otherwise no worker is alive and
+        the evaluation fails"""
+        for key, batch in batches.items():
+            self.batches.put((key, *batch))
+        attempts = dict.fromkeys(batches, 1)
+        last_message = time.monotonic()
+        """The time of the last message of a worker"""
+        deadlines = dict.fromkeys(batches, last_message + self.timeout)
+        """The time limit of the batches without result"""
+        partials = {}
+        try:
+            while len(partials) < len(batches):
+                try:
+                    key, result = self.results.get(timeout=0.1)
+                except queue.Empty:
+                    now = time.monotonic()
+                    expired = [key for key, deadline in deadlines.items() if deadline <= now]
+                    queued = self.queued_batches() if expired else set()
+                    for key in expired:
+                        if key in queued:
+                            if now - last_message >= self.timeout:
+                                raise Exception(
+                                    f"No worker answered in {self.timeout} seconds, "
+                                    f"{len(batches) - len(partials)} batches have no result"
+                                )
+                            deadlines[key] = last_message + self.timeout
+                            continue
+                        if attempts[key] >= self.max_attempts:
+                            raise Exception(f"The batch {key} was lost {attempts[key]} times")
+                        deadlines[key] = now + self.timeout
+                        self.batches.put((key, *batches[key]))
+                        attempts[key] += 1
+                        self.resent_batches += 1
+                    continue
+                last_message = time.monotonic()
+                # The messages of old evaluations and the repeated results of resent batches are
+                # ignored, every attempt of a batch gives the same result
+                if key not in batches or key in partials:
+                    continue
+                if result is None:
+                    deadlines[key] = last_message + self.timeout
+                    continue
+                if isinstance(result, Exception):
+                    raise result
+                partials[key] = result
+                del deadlines[key]
+        finally:
+            # The copies of the batches that are not needed anymore are not run
+            self.discard_batches(batches)
+        return partials
+
+    def queued_batches(self) -> set[tuple]:
+        """The keys of the batches that no worker has taken yet"""
+        with self.batches.mutex:
+            return {batch[0] for batch in self.batches.queue if batch is not None}
+
+    def discard_batches(self, batches: dict[tuple, tuple]):
+        """Removes the given batches from the queue, the stop messages stay"""
+        with self.batches.mutex:
+            kept = [b for b in self.batches.queue if b is None or b[0] not in batches]
+            self.batches.queue.clear()
+            self.batches.queue.extend(kept)
+
+    def evaluate_simulation(
+        self,
+        simulation: InventorySimulation,
+        policies: Iterable[tuple[int, int]],
+        number_of_runs: int = 40,
+        seed: int = 0,
+    ) -> list[StatisticsResults]:
+        return self.evaluate(
+            simulation_parameters(simulation), policies, number_of_runs, seed
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the workers of a node")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=50000)
+    parser.add_argument("--authkey", default="inventory")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    address = (args.host, args.port)
+    for process in start_local_workers(address, args.authkey.encode(), args.workers):
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
+import heapq
+import math
 from typing import Self
 
 
 class Event:
+    __slots__ = ("time", "priority")
+
     def __init__(self, time: int = 0, priority: int = 0) -> None:
         self.time: int = time
         self.priority = priority
@@ -16,6 +20,8 @@ class Event:
 class SimulationEndEvent(Event):
     """This event tells the simulation that must finish everything"""
 
+    __slots__ = ()
+
     def __init__(self, time: int) -> None:
         super().__init__(time, 0)
 
@@ -23,6 +29,8 @@ class SimulationEndEvent(Event):
 class SupplyArrivalEvent(Event):
     """This event represents the number of units that the store receives by it's supplier"""
 
+    __slots__ = ("amount",)
+
     def __init__(self, time: int, amount: int) -> None:
         super().__init__(time, 1)
         self.amount: int = amount
@@ -32,6 +40,8 @@ class SupplyArrivalEvent(Event):
 class SellEvent(Event):
     """This event represents a client that wants to buy some units of the product"""
 
+    __slots__ = ("amount",)
+
     def __init__(self, time: int, amount: int) -> None:
         super().__init__(time, 2)
         self.amount: int = amount
@@ -41,5 +51,73 @@ class SellEvent(Event):
 class PayHoldingEvent(Event):
     """This event represents the moment in which the store should pay for the storage service"""
 
+    __slots__ = ()
+
     def __init__(self, time: int) -> None:
         super().__init__(time, 3)
+
+
+class HeapEventQueue:
+    """Binary heap of events. Its entries are (time, priority, sequence, event) tuples, so the heap
+    compares them natively and simultaneous events keep their insertion order. InventorySimulation
+    pushes and pops the heap itself on its hot path, so push and pop are the reference of the layout"""
+
+    def __init__(self) -> None:
+        self.heap: list[tuple[int, int, int, Event]] = []
+        self.sequence: int = 0
+        """The number of events pushed, used to break the ties"""
+
+    def push(self, event: Event):
+        heapq.heappush(self.heap, (event.time, event.priority, self.sequence, event))
+        self.sequence += 1
+
+    def pop(self) -> Event:
+        return heapq.heappop(self.heap)[3]
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+
+class SlotEventQueue:
+    """Queue with one slot per kind of event. The inventory model never has two events of the same
+    kind waiting, so the next event is the minimum of a constant number of slots.
+    The kinds of event are told apart by their priority, that is unique for each one"""
+
+    def __init__(self, kinds: int = 4) -> None:
+        self.slots: list[Event | None] = [None] * kinds
+        """The event waiting of each kind, in the position of its priority"""
+        self.times: list[float] = [math.inf] * kinds
+        """The time of the event of each slot, infinite if the slot is empty"""
+        self.size: int = 0
+
+    def push(self, event: Event):
+        priority = event.priority
+        if self.slots[priority] is not None:
+            raise Exception(
+                f"There is already a {type(event).__name__} waiting in the slot queue"
+            )
+        self.slots[priority] = event
+        self.times[priority] = event.time
+        self.size += 1
+
+    def pop(self) -> Event:
+        if not self.size:
+            raise Exception("The event queue is empty")
+        times = self.times
+        # index returns the first slot with the minimum time, so ties are broken by priority
+        priority = times.index(min(times))
+        event = self.slots[priority]
+        self.slots[priority] = None
+        times[priority] = math.inf
+        self.size -= 1
+        return event
+
+    def __len__(self) -> int:
+        return self.size
+
+
+SCHEDULERS: dict[str, type] = {
+    "heap": HeapEventQueue,
+    "slots": SlotEventQueue,
+}
+"""The event queues that the simulation can use, by name"""
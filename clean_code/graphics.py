@@ -1,60 +1,365 @@
+import os
+import importlib
+
+import numpy as np
+
 from sim_stats import SimStatistics, calculate_sell_loss
 from registers import *
-import matplotlib.pyplot as plt
+
+
+class LazyModule:
+    """Imports a module the first time one of its attributes is used. Importing matplotlib.pyplot
+    takes longer than importing the whole simulation, so it is only loaded when something is plotted
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+
+    def __getattr__(self, attribute: str):
+        return getattr(importlib.import_module(self.name), attribute)
+
+
+plt = LazyModule("matplotlib.pyplot")
+
+
+def downsample_lttb(x, y, max_points: int) -> tuple[np.ndarray, np.ndarray]:
+    """Reduces a series to max_points points with the largest-triangle-three-buckets algorithm.
+    The first and last points are kept and from every bucket in between it keeps the point that forms
+    the largest triangle with the point kept before and the mean of the next bucket, so the peaks and
+    the shape of the series are preserved"""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if max_points < 3 or len(x) <= max_points:
+        return x, y
+    # The buckets of the points between the first and the last one
+    edges = np.linspace(1, len(x) - 1, max_points - 1).astype(np.int64)
+    kept = np.empty(max_points, dtype=np.int64)
+    kept[0], kept[-1] = 0, len(x) - 1
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_x = x[end : edges[bucket + 2]].mean()
+            next_y = y[end : edges[bucket + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        previous = kept[bucket]
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        kept[bucket + 1] = start + int(areas.argmax())
+    return x[kept], y[kept]
+
+
+def values_on_grid(
+    times: np.ndarray,
+    values: np.ndarray,
+    offsets: np.ndarray,
+    grid: np.ndarray,
+    initial: float = np.nan,
+) -> np.ndarray:
+    """Returns the value of every run at every time of the grid, with shape (runs, len(grid)).
+    The records of all the runs are concatenated in times and values, sorted by time within each run,
+    and offsets has the index of the first record of every run (and the total at the end). The value
+    at a time is the one of the last record at or before it ('initial' before the first record).
+    All the runs are searched at once by shifting the times of every run past the ones of the previous run
+    """
+    times = np.asarray(times, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    runs = len(offsets) - 1
+    span = max(int(times.max(initial=0)), int(grid.max(initial=0))) + 1
+    run_of_record = np.repeat(np.arange(runs), np.diff(offsets))
+    keys = run_of_record * span + times
+    queries = (np.arange(runs)[:, None] * span + grid[None, :]).ravel()
+    index = np.searchsorted(keys, queries, side="right") - 1
+    run_of_query = np.repeat(np.arange(runs), len(grid))
+    # The search falls in the previous run when the run has no record at or before the time
+    found = (index >= offsets[run_of_query]) & (index >= 0)
+    result = np.full(len(queries), initial, dtype=np.float64)
+    result[found] = np.asarray(values, dtype=np.float64)[index[found]]
+    return result.reshape(runs, len(grid))
+
+
+def chunks_on_grid(
+    times: np.ndarray,
+    values: np.ndarray,
+    offsets: np.ndarray,
+    grid: np.ndarray,
+    initial: float = np.nan,
+    chunk_runs: int = 256,
+):
+    """Yields values_on_grid of the runs chunk_runs at a time, so only the records of a chunk are read
+    (e.g. from memory-mapped columns) and only a (chunk_runs, len(grid)) array is in memory"""
+    offsets = np.asarray(offsets, dtype=np.int64)
+    for first in range(0, len(offsets) - 1, chunk_runs):
+        chunk = offsets[first : first + chunk_runs + 1]
+        start, end = int(chunk[0]), int(chunk[-1])
+        yield values_on_grid(times[start:end], values[start:end], chunk - start, grid, initial)
+
+
+def quantiles_from_histogram(
+    counts: np.ndarray, low: np.ndarray, high: np.ndarray, quantiles
+) -> np.ndarray:
+    """Returns the quantiles of the values of every row of a histogram with counts of shape
+    (rows, bins) and equal bins between low and high of every row. The values of a bin are taken as
+    evenly spread inside it, so every value, and every quantile, is off by less than the width of a bin"""
+    bins = counts.shape[1]
+    cumulative = counts.cumsum(axis=1)
+    total = cumulative[:, -1]
+    rows = np.flatnonzero(total > 0)
+    cumulative = cumulative[rows]
+    width = (high[rows] - low[rows]) / bins
+
+    def sorted_value(position: np.ndarray) -> np.ndarray:
+        """The value at an integer position of the sorted values of every row"""
+        bin_index = (cumulative <= position[:, None]).sum(axis=1)
+        before = np.where(bin_index > 0, cumulative[np.arange(len(rows)), bin_index - 1], 0)
+        inside = (position - before + 0.5) / counts[rows, bin_index]
+        return low[rows] + (bin_index + inside) * width
+
+    result = np.full((len(quantiles), len(counts)), np.nan)
+    for i, q in enumerate(quantiles):
+        # Interpolates between the two values around the rank of the quantile, as np.quantile does
+        rank = q * (total[rows] - 1)
+        below = np.floor(rank)
+        above = np.minimum(below + 1, total[rows] - 1)
+        result[i, rows] = sorted_value(below) + (rank - below) * (
+            sorted_value(above) - sorted_value(below)
+        )
+    return result
+
+
+def finish_figure(name: str, output_dir: str | None):
+    """Shows the figure, or saves it as <output_dir>/<name>.png in the headless mode"""
+    if output_dir is None:
+        plt.show()
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    plt.savefig(os.path.join(output_dir, f"{name}.png"))
+    plt.close()
 
 
 class Graphics:
-    def __init__(self, sim_statistics: SimStatistics) -> None:
+    def __init__(
+        self,
+        sim_statistics: SimStatistics,
+        max_points: int | None = None,
+        output_dir: str | None = None,
+    ) -> None:
         self.sim_stats: SimStatistics = sim_statistics
+        self.max_points: int | None = max_points
+        """If set, the series with more points are downsampled to this number of points before plotting"""
+        self.output_dir: str | None = output_dir
+        """If set, the figures are saved to this directory instead of being shown"""
+
+    def plot(self, x, y, **kwargs):
+        """Plots a series, downsampled if it has more than max_points points"""
+        if self.max_points is not None:
+            x, y = downsample_lttb(x, y, self.max_points)
+        plt.plot(x, y, **kwargs)
+
+    def finish(self, name: str):
+        finish_figure(name, self.output_dir)
+
+    def render_all(self, product_price: float):
+        """Draws every plot of the run, in the headless mode it writes them all to output_dir"""
+        self.plot_sells()
+        self.plot_balance()
+        self.plot_loss(product_price)
+        self.plot_inventory_holding_cost()
+        self.plot_supply_costs()
 
     def plot_sells(self):
         stats = self.sim_stats
         real_sales = stats.get_sells_data(
             lambda sell_list: sum([s.amount_seeled for s in sell_list])
         )
-        plt.plot(real_sales[0], real_sales[1], label="real sales")
+        self.plot(real_sales[0], real_sales[1], label="real sales")
         plt.xlabel("Time")
         plt.ylabel("Total Sales")
         # plt.legend(handles = [real_sales], loc = 'upper right')
         plt.legend()
-        plt.show()
+        self.finish("sells")
 
     def plot_balance(self):
         stats = self.sim_stats
         balance = stats.get_balance_data(lambda balance: balance.balance)
-        zero_line = [0 for b in balance[0]]
-        plt.plot(balance[0], balance[1], label="balance of store")
-        plt.plot(balance[0], zero_line, label="zero line", color="r")
+        self.plot(balance[0], balance[1], label="balance of store")
+        plt.axhline(0, label="zero line", color="r")
         plt.xlabel("Time")
         plt.ylabel("Balance")
         plt.legend()
-        plt.show()
+        self.finish("balance")
 
     def plot_loss(self, product_price: float):
         stats = self.sim_stats
         loss = stats.get_sells_data(
             lambda sells: product_price * calculate_sell_loss(sells)
         )
-        plt.plot(loss[0], loss[1], label="money loss in sales")
+        self.plot(loss[0], loss[1], label="money loss in sales")
         plt.xlabel("Time")
         plt.ylabel("Total money loss")
         plt.legend()
-        plt.show()
+        self.finish("loss")
 
     def plot_inventory_holding_cost(self):
         stats = self.sim_stats
         costs = stats.get_pay_hold_data(lambda pay_record: pay_record.cost)
-        plt.plot(costs[0], costs[1], label="holding costs")
+        self.plot(costs[0], costs[1], label="holding costs")
         plt.xlabel("Time")
         plt.ylabel("Total money spent")
         plt.legend()
-        plt.show()
+        self.finish("holding_costs")
 
     def plot_supply_costs(self):
         stats = self.sim_stats
         supply_costs = stats.get_buy_data(lambda buy_record: buy_record.cost)
-        plt.plot(supply_costs[0], supply_costs[1], label="supply costs")
+        self.plot(supply_costs[0], supply_costs[1], label="supply costs")
         plt.xlabel("Time")
         plt.ylabel("Money spent in supply payment")
         plt.legend()
-        plt.show()
+        self.finish("supply_costs")
+
+
+class ReplicationsGraphics:
+    """Plots the mean and the quantile bands of the balance and the stock over time across many runs.
+    The runs are given as concatenated columns with the offsets of every run, the layout of a StoredExperiment
+    """
+
+    def __init__(
+        self,
+        balance: tuple[np.ndarray, np.ndarray, np.ndarray],
+        stock: tuple[np.ndarray, np.ndarray, np.ndarray],
+        duration: int,
+        initial_stock: float = np.nan,
+        grid_points: int = 500,
+        quantiles: tuple[float, float] = (0.05, 0.95),
+        output_dir: str | None = None,
+        chunk_runs: int = 256,
+        bins: int = 1024,
+    ) -> None:
+        self.balance: tuple[np.ndarray, np.ndarray, np.ndarray] = balance
+        """The times, the values and the run offsets of the balance records"""
+        self.stock: tuple[np.ndarray, np.ndarray, np.ndarray] = stock
+        """The times, the amounts and the run offsets of the stock records"""
+        self.initial_stock: float = initial_stock
+        """The stock of the runs before their first stock record (the balance starts at 0)"""
+        self.grid: np.ndarray = np.unique(
+            np.linspace(0, duration, grid_points).astype(np.int64)
+        )
+        """The times where the runs are compared"""
+        self.quantiles: tuple[float, float] = quantiles
+        self.output_dir: str | None = output_dir
+        """If set, the figures are saved to this directory instead of being shown"""
+        self.chunk_runs: int = chunk_runs
+        """The runs put on the grid at the same time. With more runs the quantiles come from a histogram"""
+        self.bins: int = bins
+        """The bins of the histogram of every time of the grid, the resolution of the quantiles"""
+
+    @classmethod
+    def from_statistics(cls, runs: list[SimStatistics], duration: int, **kwargs):
+        """Builds the plots from the SimStatistics of several runs (e.g. of stored runs)"""
+        columns = {"balance": [], "stock": []}
+        for stats in runs:
+            columns["balance"].append(stats.get_balance_columns())
+            columns["stock"].append(stats.get_stock_columns())
+        return cls(
+            **{name: cls.concatenate(series) for name, series in columns.items()},
+            duration=duration,
+            initial_stock=runs[0].simulation.initial_inventory_level if runs else np.nan,
+            **kwargs,
+        )
+
+    @classmethod
+    def from_experiment(cls, experiment, **kwargs):
+        """Builds the plots from a StoredExperiment without loading its other columns. The bands read
+        the memory-mapped columns chunk_runs runs at a time"""
+        return cls(
+            balance=(
+                experiment.columns["balance_time"],
+                experiment.columns["balance_value"],
+                experiment.offsets["balance"],
+            ),
+            stock=(
+                experiment.columns["stock_time"],
+                experiment.columns["stock_amount"],
+                experiment.offsets["stock"],
+            ),
+            duration=experiment.parameters["sim_duration"],
+            initial_stock=experiment.parameters["initial_inventory_level"],
+            **kwargs,
+        )
+
+    @staticmethod
+    def concatenate(
+        runs: list[tuple[np.ndarray, np.ndarray]]
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        offsets = np.zeros(len(runs) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(times) for times, _ in runs])
+        return (
+            np.concatenate([times for times, _ in runs]),
+            np.concatenate([values for _, values in runs]),
+            offsets,
+        )
+
+    def bands(
+        self, columns: tuple[np.ndarray, np.ndarray, np.ndarray], initial: float
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the mean and the lower and upper quantiles of the runs at every time of the grid.
+        The runs are read in chunks of chunk_runs runs. If they all fit in one chunk the quantiles are
+        exact, otherwise a first pass takes the mean and the range of every time of the grid and a
+        second one the histogram of its values, so the memory does not grow with the runs"""
+        if len(columns[2]) - 1 <= self.chunk_runs:
+            values = values_on_grid(*columns, self.grid, initial)
+            low, high = np.nanquantile(values, self.quantiles, axis=0)
+            return np.nanmean(values, axis=0), low, high
+
+        total = np.zeros(len(self.grid))
+        count = np.zeros(len(self.grid), dtype=np.int64)
+        minimum = np.full(len(self.grid), np.inf)
+        maximum = np.full(len(self.grid), -np.inf)
+        for values in chunks_on_grid(*columns, self.grid, initial, self.chunk_runs):
+            total += np.nansum(values, axis=0)
+            count += np.count_nonzero(~np.isnan(values), axis=0)
+            minimum = np.fmin(minimum, np.nanmin(values, axis=0, initial=np.inf))
+            maximum = np.fmax(maximum, np.nanmax(values, axis=0, initial=-np.inf))
+
+        # The times where all the runs have the same value have a histogram of width 0
+        maximum = np.where(maximum > minimum, maximum, minimum)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            scale = np.where(maximum > minimum, self.bins / (maximum - minimum), 0.0)
+            mean = total / count
+        counts = np.zeros((len(self.grid), self.bins), dtype=np.int64)
+        for values in chunks_on_grid(*columns, self.grid, initial, self.chunk_runs):
+            known = ~np.isnan(values)
+            column = known.nonzero()[1]
+            bin_index = ((values[known] - minimum[column]) * scale[column]).astype(np.int64)
+            cell = column * self.bins + np.clip(bin_index, 0, self.bins - 1)
+            counts += np.bincount(cell, minlength=counts.size).reshape(counts.shape)
+        low, high = quantiles_from_histogram(counts, minimum, maximum, self.quantiles)
+        return mean, low, high
+
+    def plot_bands(self, columns, initial: float, label: str, ylabel: str, name: str):
+        mean, low, high = self.bands(columns, initial)
+        plt.plot(self.grid, mean, label=f"mean {label}")
+        plt.fill_between(
+            self.grid,
+            low,
+            high,
+            alpha=0.3,
+            label=f"{label} between quantiles {self.quantiles[0]} and {self.quantiles[1]}",
+        )
+        plt.xlabel("Time")
+        plt.ylabel(ylabel)
+        plt.legend()
+        finish_figure(name, self.output_dir)
+
+    def plot_balance(self):
+        self.plot_bands(self.balance, 0.0, "balance of store", "Balance", "balance_bands")
+
+    def plot_stock(self):
+        self.plot_bands(self.stock, self.initial_stock, "stock", "Units in inventory", "stock_bands")
+
+    def render_all(self):
+        self.plot_balance()
+        self.plot_stock()
@@ -0,0 +1,185 @@
+# This file contains the opt-in instrumentation of the simulation engine. When a simulation has no
+# instrumentation nothing of this file runs, so it costs nothing in production runs
+import time
+from typing import Callable
+
+from events import Event
+
+
+class EngineObserver:
+    """Base class for the callbacks of external profilers. Every method does nothing by default"""
+
+    def on_run_start(self, simulation):
+        """Called after the simulation is initialized and before its first event"""
+
+    def on_event(self, simulation, event: Event, elapsed: float):
+        """Called after an event is processed, with the seconds its handler took, as in handler_time"""
+
+    def on_run_end(self, simulation, report: "InstrumentationReport"):
+        """Called when the run is over with the report of the run"""
+
+
+class InstrumentationReport:
+    """What happened in a single run of the simulation"""
+
+    def __init__(self) -> None:
+        self.event_counts: dict[str, int] = {}
+        """The number of events processed of each type"""
+        self.handler_time: dict[str, float] = {}
+        """The seconds spent in the handler of each type of event. The handler of the sells also draws
+        the next client, that time is not included here but in client_generation_time"""
+        self.client_generation_time: float = 0.0
+        """The seconds spent drawing the clients and pushing their events"""
+        self.queue_pushes: int = 0
+        self.queue_pops: int = 0
+        self.peak_queue_length: int = 0
+        self.wall_time: float = 0.0
+        """The seconds of the whole run, initialization included"""
+        self.record_counts: dict[str, int] = {}
+        """The number of records of each registry at the end of the run"""
+
+    def total_events(self) -> int:
+        return sum(self.event_counts.values())
+
+    def events_per_second(self) -> float:
+        return self.total_events() / self.wall_time if self.wall_time else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "event_counts": dict(self.event_counts),
+            "handler_time": dict(self.handler_time),
+            "client_generation_time": self.client_generation_time,
+            "queue_pushes": self.queue_pushes,
+            "queue_pops": self.queue_pops,
+            "peak_queue_length": self.peak_queue_length,
+            "wall_time": self.wall_time,
+            "events_per_second": self.events_per_second(),
+            "record_counts": dict(self.record_counts),
+        }
+
+    def __str__(self) -> str:
+        lines = [
+            f"{self.total_events()} events in {self.wall_time:.4f}s ({self.events_per_second():,.0f} events/s)"
+        ]
+        for name, count in self.event_counts.items():
+            lines.append(
+                f"  {name}: {count} events, {self.handler_time[name]:.4f}s in the handler"
+            )
+        lines.append(f"  clients drawn in {self.client_generation_time:.4f}s")
+        lines.append(
+            f"  queue: {self.queue_pushes} pushes, {self.queue_pops} pops, peak length {self.peak_queue_length}"
+        )
+        lines.append(f"  records: {self.record_counts}")
+        return "\n".join(lines)
+
+
+class InstrumentedEventQueue:
+    """Wraps the event queue of the simulation and counts its operations"""
+
+    def __init__(self, queue, report: InstrumentationReport) -> None:
+        self.queue = queue
+        self.report: InstrumentationReport = report
+
+    def push(self, event: Event):
+        self.queue.push(event)
+        self.report.queue_pushes += 1
+        length = len(self.queue)
+        if length > self.report.peak_queue_length:
+            self.report.peak_queue_length = length
+
+    def pop(self) -> Event:
+        self.report.queue_pops += 1
+        return self.queue.pop()
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+
+def unwrapped_queue(queue):
+    """The event queue of the simulation without the instrumentation that measures it"""
+    return queue.queue if isinstance(queue, InstrumentedEventQueue) else queue
+
+
+class EngineInstrumentation:
+    """Measures the runs of a simulation. Give it to InventorySimulation(instrumentation=...) and read
+    the report of the last run in 'report' (or all of them in 'reports')"""
+
+    def __init__(self, observers: list[EngineObserver] | None = None) -> None:
+        self.observers: list[EngineObserver] = observers if observers else []
+        self.reports: list[InstrumentationReport] = []
+        self.report: InstrumentationReport | None = None
+        """The report of the last run"""
+
+    def wrap_queue(self, queue):
+        """Called by the simulation every time it creates its event queue. Only the queues of the
+        runs made by the instrumentation are measured"""
+        if self.report is None:
+            return queue
+        return InstrumentedEventQueue(queue, self.report)
+
+    def timed_handler(self, simulation, event_type: type, handler: Callable) -> Callable:
+        """Returns the handler of an event type of the simulation that also measures it"""
+        name = event_type.__name__
+        report = self.report
+        observers = self.observers
+        report.event_counts[name] = 0
+        report.handler_time[name] = 0.0
+
+        def process(event: Event):
+            generation_time = report.client_generation_time
+            start = time.perf_counter()
+            handler(event)
+            elapsed = time.perf_counter() - start
+            elapsed -= report.client_generation_time - generation_time
+            report.event_counts[name] += 1
+            report.handler_time[name] += elapsed
+            for observer in observers:
+                observer.on_event(simulation, event, elapsed)
+
+        return process
+
+    def timed_client_generation(self, generate: Callable[[], None]) -> Callable[[], None]:
+        """Returns the method of the simulation that draws the next client, measuring it"""
+        report = self.report
+
+        def generate_client():
+            start = time.perf_counter()
+            generate()
+            report.client_generation_time += time.perf_counter() - start
+
+        return generate_client
+
+    def run(self, simulation, initialize: bool = True):
+        """Runs the simulation measuring it, from the start or, without initialize, from its actual
+        state (see InventorySimulation.resume). The handlers are replaced only during the run"""
+        self.report = InstrumentationReport()
+        start = time.perf_counter()
+        handlers = simulation.event_handlers
+        simulation.event_handlers = {
+            event_type: self.timed_handler(simulation, event_type, handler)
+            for event_type, handler in handlers.items()
+        }
+        # An attribute of the instance hides the method, so the handlers call the measured one
+        simulation.generate_client_sell_event = self.timed_client_generation(
+            simulation.generate_client_sell_event
+        )
+        try:
+            if initialize:
+                simulation.initialize()
+            else:
+                simulation.event_queue = InstrumentedEventQueue(
+                    unwrapped_queue(simulation.event_queue), self.report
+                )
+            for observer in self.observers:
+                observer.on_run_start(simulation)
+            while not simulation.sim_over:
+                simulation.step()
+        finally:
+            simulation.event_handlers = handlers
+            del simulation.generate_client_sell_event
+        report = self.report
+        report.wall_time = time.perf_counter() - start
+        report.record_counts = simulation.registry.record_counts()
+        self.reports.append(report)
+        for observer in self.observers:
+            observer.on_run_end(simulation, report)
@@ -0,0 +1,330 @@
+# This file contains an evaluator of (s,S) policies that computes the long-run costs of the model of
+# InventorySimulation with the stationary distribution of a Markov chain, without simulating it.
+# The chain is observed just after the sales made while an order is on the way. Its states are the
+# inventory level, the level when the order was placed (which fixes the amount ordered, S - level) and
+# the time left until it arrives. Orders are only placed at levels <= s, so there are about
+# (s + 1)^2 / 2 * lead_time states. The sales made without an order on the way only lower the level
+# until it reaches s, so they are not states of the chain: they are solved once per s by a recursion
+# over the level, which also makes the chain converge in a few iterations. The distribution is a dense
+# grid of level x ordered_at x time left, so every step of the chain is a few products of small arrays
+# instead of a loop over the states.
+import math
+from typing import Callable
+
+import numpy as np
+
+from sim_stats import StatisticsResults
+from variates import InverseTransformStream, poisson_pmf, uniform_pmf
+
+
+class MarkovEvaluation:
+    """The long-run rates per unit of time of a policy"""
+
+    def __init__(
+        self,
+        s: int,
+        S: int,
+        loss_rate: float,
+        ordering_cost_rate: float,
+        holding_cost_rate: float,
+        sold_rate: float,
+        mean_inventory: float,
+        product_value: float,
+        iterations: int,
+    ) -> None:
+        self.s: int = s
+        self.S: int = S
+        self.loss_rate: float = loss_rate
+        """The money lost in sales"""
+        self.ordering_cost_rate: float = ordering_cost_rate
+        """The money paid to the supplier"""
+        self.holding_cost_rate: float = holding_cost_rate
+        """The money paid for holding inventory"""
+        self.sold_rate: float = sold_rate
+        """The units sold"""
+        self.mean_inventory: float = mean_inventory
+        """The time average of the inventory level"""
+        self.product_value: float = product_value
+        self.iterations: int = iterations
+        """The iterations the stationary distribution took to converge"""
+
+    def costs_rate(self) -> float:
+        return self.ordering_cost_rate + self.holding_cost_rate
+
+    def balance_rate(self) -> float:
+        """The change of the balance. Like in InventorySimulation the holding payments are added to it"""
+        return (
+            self.product_value * self.sold_rate
+            - self.ordering_cost_rate
+            + self.holding_cost_rate
+        )
+
+    def statistics_results(self, duration: int) -> StatisticsResults:
+        """The expectations of a run of that duration if the rates held from its start. The warm-up
+        from the initial inventory is ignored and there is no variance, so use it only to rank policies
+        """
+        return StatisticsResults(
+            loss_expectation=self.loss_rate * duration,
+            costs_expectation=self.costs_rate() * duration,
+            final_balance_expectation=self.balance_rate() * duration,
+            loss_variance=math.nan,
+            costs_variance=math.nan,
+            final_balance_variance=math.nan,
+        )
+
+
+class MarkovPolicyEvaluator:
+    """Computes the long-run rates of (s,S) policies for clients that arrive every T >= 1 minutes and ask
+    for D units, with T and D independent and given by their probabilities. Like InventorySimulation,
+    T = 0 is drawn again, a supply that arrives at the time of a sale is received before it and the
+    demand that can not be served is lost"""
+
+    def __init__(
+        self,
+        arrival_pmf: np.ndarray,
+        demand_pmf: np.ndarray,
+        ordering_cost_function: Callable[[int], float] = lambda x: x * 5,
+        lead_time: int = 10,
+        holding_cost_rate: float = 3,
+        holding_pay_time: int = 60,
+        product_value: float = 10,
+        tolerance: float = 1e-8,
+        max_iterations: int = 100_000,
+    ) -> None:
+        if lead_time < 1:
+            raise Exception("The Markov evaluator requires a lead time of at least 1")
+        arrival_pmf = np.asarray(arrival_pmf, dtype=np.float64).copy()
+        arrival_pmf[0] = 0
+        self.arrival_times: np.ndarray = np.flatnonzero(arrival_pmf)
+        self.arrival_probabilities: np.ndarray = (
+            arrival_pmf[self.arrival_times] / arrival_pmf.sum()
+        )
+        demand_pmf = np.asarray(demand_pmf, dtype=np.float64)
+        self.demands: np.ndarray = np.flatnonzero(demand_pmf)
+        self.demand_probabilities: np.ndarray = (
+            demand_pmf[self.demands] / demand_pmf.sum()
+        )
+        self.ordering_cost_func: Callable[[int], float] = ordering_cost_function
+        self.lead_time: int = lead_time
+        self.holding_cost_rate: float = holding_cost_rate
+        self.holding_pay_time: int = holding_pay_time
+        self.product_value: float = product_value
+        self.tolerance: float = tolerance
+        self.max_iterations: int = max_iterations
+        self.descents: dict[int, tuple[np.ndarray, ...]] = {}
+        """The results of descent for every s evaluated, they do not depend on S"""
+        self.distributions: dict[int, np.ndarray] = {}
+        """The last stationary distribution that converged for every s. The states only depend on s, so it is
+        the starting point of the next policy with the same s, which is usually close to its solution"""
+
+        # The time until the next client seen from the states, by the minutes left until the supply
+        left = np.arange(1, lead_time + 1)
+        minutes = np.arange(self.arrival_times.max())
+        pmf = np.zeros(self.arrival_times.max() + lead_time + 1)
+        pmf[self.arrival_times] = self.arrival_probabilities
+        self.waiting_matrix: np.ndarray = np.where(
+            left[:, None] > left[None, :], pmf[np.abs(left[:, None] - left[None, :])], 0
+        )
+        """The probability that the client arrives before the supply and leaves it 'left' (column)
+        minutes away, from 'left' (row) minutes away"""
+        self.waiting_time: np.ndarray = np.cumsum(pmf[:lead_time] * np.arange(lead_time))
+        """The expected minutes until the client when it arrives before the supply"""
+        self.residual: np.ndarray = pmf[left[:, None] + minutes[None, :]]
+        """The probability that the client arrives r (column) minutes after the supply"""
+        self.arrival_tail: np.ndarray = self.residual.sum(axis=1)
+        """The probability that the supply arrives before the client"""
+        self.arrival_excess: np.ndarray = self.residual @ minutes
+        """The expected minutes from the supply until the client, 0 if the client arrives first"""
+        self.reorder_waiting: np.ndarray = self.residual @ np.minimum(minutes, lead_time)
+        self.reorder_excess: np.ndarray = self.residual @ np.maximum(minutes - lead_time, 0)
+        self.reorder_arrival: np.ndarray = self.residual[:, lead_time:].sum(axis=1)
+        """For an order placed when the supply arrives: the expected minutes until the client or its
+        own supply, the ones from its supply until the client and the probability that its supply
+        arrives first"""
+
+    @classmethod
+    def from_simulation(cls, simulation, **kwargs):
+        """The evaluator of the model of the simulation. The probabilities of the clients are known for
+        the default distributions and the InverseTransformStream ones, any other distribution raises"""
+        arrival = simulation.client_arrival_dist
+        demand = simulation.client_demand_dist
+        if isinstance(arrival, InverseTransformStream) and isinstance(
+            demand, InverseTransformStream
+        ) and simulation.demand_trace is None:
+            arrival_pmf, demand_pmf = arrival.pmf, demand.pmf
+        elif simulation.has_default_clients():
+            arrival_pmf, demand_pmf = poisson_pmf(5), uniform_pmf(1, 50)
+        else:
+            raise Exception(
+                "The Markov evaluator only knows the default and the InverseTransformStream "
+                "client distributions, without a demand trace"
+            )
+        return cls(
+            arrival_pmf=arrival_pmf,
+            demand_pmf=demand_pmf,
+            ordering_cost_function=simulation.ordering_cost_func,
+            lead_time=simulation.lead_time,
+            holding_cost_rate=simulation.holding_cost_rate,
+            holding_pay_time=simulation.holding_pay_time,
+            product_value=simulation.product_value,
+            **kwargs,
+        )
+
+    def descent(self, s: int, top: int) -> tuple[np.ndarray, ...]:
+        """Follows the sales of a store without an order on the way, from every level y between s + 1 and
+        top just before a sale until the sale that leaves the level at s or below and places an order.
+        Returns, for every y, the probabilities of the level of that order and the expected units lost,
+        units asked, minutes elapsed and integral of the inventory level until it. The results of a level
+        depend on the ones of the lower levels, so they are computed from s + 1 upwards"""
+        levels = top - s
+        if s in self.descents and len(self.descents[s][1]) >= levels:
+            return tuple(result[:levels] for result in self.descents[s])
+        mean_time = float(self.arrival_times @ self.arrival_probabilities)
+        mean_demand = float(self.demands @ self.demand_probabilities)
+        order_level = np.zeros((levels, s + 1))
+        lost = np.zeros(levels)
+        asked = np.zeros(levels)
+        elapsed = np.zeros(levels)
+        inventory_time = np.zeros(levels)
+        # The levels computed for a lower top are kept
+        computed = len(self.descents[s][1]) if s in self.descents else 0
+        for result, known in zip(
+            (order_level, lost, asked, elapsed, inventory_time), self.descents.get(s, ())
+        ):
+            result[:computed] = known
+        for row in range(computed, levels):
+            y = s + 1 + row
+            after = y - self.demands
+            ends = after <= s
+            p_end, p_more = self.demand_probabilities[ends], self.demand_probabilities[~ends]
+            more = after[~ends] - s - 1
+            np.add.at(order_level[row], np.maximum(after[ends], 0), p_end)
+            order_level[row] += p_more @ order_level[more]
+            lost[row] = p_end @ np.maximum(-after[ends], 0) + p_more @ lost[more]
+            asked[row] = mean_demand + p_more @ asked[more]
+            elapsed[row] = p_more.sum() * mean_time + p_more @ elapsed[more]
+            inventory_time[row] = p_more @ (mean_time * after[~ends] + inventory_time[more])
+        self.descents[s] = (order_level, lost, asked, elapsed, inventory_time)
+        return self.descents[s]
+
+    def evaluate(self, s: int, S: int) -> MarkovEvaluation:
+        """Computes the long-run rates of the policy (s,S). Raises an exception if the chain does not
+        converge in max_iterations"""
+        if not 0 <= s < S:
+            raise Exception("The values of policy (s,S) are invalid")
+        L = self.lead_time
+        ordering_cost = np.array(
+            [self.ordering_cost_func(amount) for amount in range(S + 1)], dtype=np.float64
+        )
+        mean_time = float(self.arrival_times @ self.arrival_probabilities)
+        mean_demand = float(self.demands @ self.demand_probabilities)
+        # The states are a grid of level x ordered_at x left, only level <= ordered_at is valid.
+        # When the supply arrives the level becomes S - (ordered_at - level), so the supplies are
+        # followed by that gap: above s when gap < S - s, otherwise a new order is placed at that level
+        level, ordered_at = np.ogrid[: s + 1, : s + 1]
+        valid = np.broadcast_to(level <= ordered_at, (s + 1, s + 1))
+        gap = ordered_at - level
+        supplied = S - gap
+        gaps = np.arange(s + 1)
+        above_gaps = gaps[gaps < S - s]
+        reorder_gaps = gaps[gaps >= S - s]
+        # The valid (level, ordered_at) pairs sorted by gap, there are s + 1 - g pairs with gap g
+        pairs = np.argsort(np.where(valid, gap, s + 1).ravel(), kind="stable")[
+            : np.count_nonzero(valid)
+        ]
+        starts = np.concatenate(([0], np.cumsum(s + 1 - gaps)[:-1]))
+        reorder_minutes = np.arange(min(L, self.residual.shape[1]))
+
+        # Time step: from just after a sale to just before the next one, receiving the supplies in between.
+        # Before the sale the store is in a state of the chain or without an order at a level above s
+        def before_sale_distribution(distribution: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+            waiting = distribution @ self.waiting_matrix
+            by_gap = np.add.reduceat(distribution.reshape(-1, L)[pairs], starts, axis=0)
+            arriving = by_gap @ self.residual
+            above = np.zeros(S - s)
+            above[S - s - 1 - above_gaps] = arriving[above_gaps].sum(axis=1)
+            # The new order arrives before the sale with the level at S, or is on the way at the sale
+            above[S - s - 1] += arriving[reorder_gaps, L:].sum()
+            reordered = S - reorder_gaps[:, None]
+            waiting[reordered, reordered, L - 1 - reorder_minutes] += arriving[
+                reorder_gaps[:, None], reorder_minutes
+            ]
+            return waiting, above
+
+        # The expected integral of the inventory level over the time step and the supplies paid in it
+        left = np.arange(1, L + 1)
+        inventory_time = level[..., None] * (
+            self.waiting_time + left * self.arrival_tail
+        ) + np.where(
+            (supplied > s)[..., None],
+            supplied[..., None] * self.arrival_excess,
+            supplied[..., None] * self.reorder_waiting + S * self.reorder_excess,
+        )
+        supply_cost = ordering_cost[S - ordered_at][..., None]
+        # The order placed when the supply arrives is paid in the same step if it arrives before the sale
+        reorder_cost = ordering_cost[np.clip(gap, 0, S)][..., None]
+        order_costs = self.arrival_tail * supply_cost + np.where(
+            (supplied <= s)[..., None], self.reorder_arrival * reorder_cost, 0
+        )
+        inventory_time = np.where(valid[..., None], inventory_time, 0)
+        order_costs = np.where(valid[..., None], order_costs, 0)
+
+        # Sale: the client takes what it can. With an order on the way the new level only depends on the
+        # old one, so the sale is a product with the matrix of the levels. Without it the store sells
+        # until it places an order, as computed by descent
+        sale = np.zeros((s + 1, s + 1))
+        for demand, probability in zip(self.demands, self.demand_probabilities):
+            sale[np.arange(s + 1), np.maximum(np.arange(s + 1) - demand, 0)] += probability
+        order_level, descent_lost, descent_asked, descent_elapsed, descent_inventory = (
+            self.descent(s, S)
+        )
+
+        def step(distribution: np.ndarray) -> np.ndarray:
+            waiting, above = before_sale_distribution(distribution)
+            after = (sale.T @ waiting.reshape(s + 1, -1)).reshape(waiting.shape)
+            after[gaps, gaps, L - 1] += above @ order_level
+            return after
+
+        distribution = self.distributions.get(s)
+        if distribution is None:
+            distribution = np.repeat(valid[..., None], L, axis=2) / (np.count_nonzero(valid) * L)
+        iterations = 0
+        for iterations in range(1, self.max_iterations + 1):
+            following = step(distribution)
+            change = np.abs(following - distribution).sum()
+            distribution = following
+            if change < self.tolerance:
+                break
+        else:
+            # The rates of an unconverged distribution are not the long-run ones, and it is not kept as the
+            # starting point of the next policy
+            raise Exception(
+                f"The chain of the policy ({s},{S}) did not converge in {self.max_iterations} "
+                f"iterations, the last change was {change:.2e}"
+            )
+        self.distributions[s] = distribution
+
+        # Renewal rewards: every step of the chain takes a time step and a sale, plus the sales until the
+        # next order when the supply arrived and left the level above s
+        waiting, above = before_sale_distribution(distribution)
+        lost_at_level = (
+            np.maximum(self.demands[None, :] - np.arange(s + 1)[:, None], 0)
+            @ self.demand_probabilities
+        )
+        lost_per_step = waiting.sum(axis=(1, 2)) @ lost_at_level + above @ descent_lost
+        asked_per_step = waiting.sum() * mean_demand + above @ descent_asked
+        time_per_step = mean_time + above @ descent_elapsed
+        mean_inventory = (
+            np.vdot(inventory_time, distribution) + above @ descent_inventory
+        ) / time_per_step
+        return MarkovEvaluation(
+            s=s,
+            S=S,
+            loss_rate=self.product_value * lost_per_step / time_per_step,
+            ordering_cost_rate=float(np.vdot(order_costs, distribution)) / time_per_step,
+            holding_cost_rate=self.holding_cost_rate * mean_inventory / self.holding_pay_time,
+            sold_rate=(asked_per_step - lost_per_step) / time_per_step,
+            mean_inventory=mean_inventory,
+            product_value=self.product_value,
+            iterations=iterations,
+        )
@@ -0,0 +1,50 @@
+# This file contains the parameters of the inventory model that can be sent to other processes or
+# machines as plain values, e.g. in the queries of service.py or the batches of distributed.py. The
+# distributions and the ordering cost of a simulation are functions, so only the default distributions
+# and a linear ordering cost can be described with them
+from simulation_engine import InventorySimulation
+
+PARAMETERS: dict[str, type] = {
+    "initial_inventory_level": int,
+    "ordering_cost_per_unit": float,
+    "lead_time": int,
+    "holding_cost_rate": float,
+    "holding_pay_time": int,
+    "product_value": float,
+    "sim_duration": int,
+}
+"""The parameters of the model that can be set. The others keep the defaults of InventorySimulation"""
+
+
+def build_simulation(parameters: dict, s: int, S: int) -> InventorySimulation:
+    """Creates the simulation of the parameters. The runs only need the totals, so no record is stored"""
+    parameters = dict(parameters)
+    cost = parameters.pop("ordering_cost_per_unit", 5)
+    return InventorySimulation(
+        s=s,
+        S=S,
+        ordering_cost_function=lambda x: x * cost,
+        recording_level="totals",
+        **parameters,
+    )
+
+
+def simulation_parameters(simulation: InventorySimulation) -> dict:
+    """Returns the parameters of the model of the simulation, the inverse of build_simulation. The
+    simulation must use the default client distributions without a demand trace and a linear ordering cost,
+    otherwise its runs could not be repeated from the parameters. The recording level is not sent, the
+    statistics of a run do not depend on it"""
+    if not simulation.has_default_clients():
+        raise Exception(
+            "Only the default client distributions can be sent, without a demand trace"
+        )
+    cost = simulation.ordering_cost_func(1)
+    if any(simulation.ordering_cost_func(x) != x * cost for x in (2, 10, 100)):
+        raise Exception("Only a linear ordering cost can be sent")
+    parameters = {
+        name: getattr(simulation, name)
+        for name in PARAMETERS
+        if name != "ordering_cost_per_unit"
+    }
+    parameters["ordering_cost_per_unit"] = cost
+    return parameters
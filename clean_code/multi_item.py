@@ -0,0 +1,185 @@
+# This file contains an engine that simulates a whole catalogue of items (e.g. every SKU in every
+# store) in a single run. Every item has its own (s,S) policy, costs and demand parameters
+import numpy as np
+
+from batch_engine import BatchInventorySimulation
+
+
+class MultiItemResults:
+    """The results of a MultiItemSimulation run. Every array has one row per item and one column per replication"""
+
+    def __init__(
+        self,
+        loss: np.ndarray,
+        costs: np.ndarray,
+        final_balance: np.ndarray,
+        demand: np.ndarray,
+        sold: np.ndarray,
+        sku: np.ndarray,
+        store: np.ndarray,
+    ) -> None:
+        self.loss: np.ndarray = loss
+        """The money lost in sales"""
+        self.costs: np.ndarray = costs
+        """The money spent in holding inventory and supplies"""
+        self.final_balance: np.ndarray = final_balance
+        self.demand: np.ndarray = demand
+        """The units asked by the clients"""
+        self.sold: np.ndarray = sold
+        """The units sold to the clients"""
+        self.sku: np.ndarray = sku
+        """The SKU of each item"""
+        self.store: np.ndarray = store
+        """The store of each item"""
+
+    def loss_expectation(self) -> np.ndarray:
+        return self.loss.mean(axis=1)
+
+    def costs_expectation(self) -> np.ndarray:
+        return self.costs.mean(axis=1)
+
+    def final_balance_expectation(self) -> np.ndarray:
+        return self.final_balance.mean(axis=1)
+
+    def fill_rate(self) -> np.ndarray:
+        """The fraction of the demand of each item that was sold, over all the replications"""
+        demand = self.demand.sum(axis=1)
+        return np.divide(
+            self.sold.sum(axis=1), demand, out=np.ones(len(demand)), where=demand > 0
+        )
+
+
+class MultiItemSimulation(BatchInventorySimulation):
+    """Simulates many items at once. All of them share the event calendar of the batch engine and
+    every parameter is an array with one value per item (a single value is used for all the items).
+    The clients of an item arrive with Poisson(arrival_mean) minutes between them and ask for a
+    uniform number of units between demand_low and demand_high. An order of y units of an item
+    costs fixed_ordering_cost + unit_ordering_cost * y"""
+
+    def __init__(
+        self,
+        s: int | np.ndarray,
+        S: int | np.ndarray,
+        initial_inventory_level: int | np.ndarray = 0,
+        fixed_ordering_cost: float | np.ndarray = 0,
+        unit_ordering_cost: float | np.ndarray = 5,
+        lead_time: int | np.ndarray = 10,
+        holding_cost_rate: float | np.ndarray = 3,
+        holding_pay_time: int | np.ndarray = 60,
+        product_value: float | np.ndarray = 10,
+        arrival_mean: float | np.ndarray = 5,
+        demand_low: int | np.ndarray = 1,
+        demand_high: int | np.ndarray = 50,
+        sku: np.ndarray | None = None,
+        store: np.ndarray | None = None,
+        sim_duration: int = 840,
+        seed: int | np.random.SeedSequence | None = None,
+    ):
+        items = np.broadcast(
+            s,
+            S,
+            initial_inventory_level,
+            fixed_ordering_cost,
+            unit_ordering_cost,
+            lead_time,
+            holding_cost_rate,
+            holding_pay_time,
+            product_value,
+            arrival_mean,
+            demand_low,
+            demand_high,
+        ).size
+        super().__init__(
+            s=s,
+            S=S,
+            sim_duration=sim_duration,
+            seed=seed,
+            client_arrival_sampler=lambda lanes: self.rng.poisson(
+                self.lane_arrival_mean[lanes]
+            ),
+            client_demand_sampler=lambda lanes: self.rng.integers(
+                self.lane_demand_low[lanes], self.lane_demand_high[lanes] + 1
+            ),
+        )
+        self.items: int = items
+        """The number of items simulated"""
+        self.item_parameters: dict[str, np.ndarray] = {
+            name: np.broadcast_to(np.asarray(value), (items,))
+            for name, value in [
+                ("s", s),
+                ("S", S),
+                ("initial_inventory_level", initial_inventory_level),
+                ("fixed_ordering_cost", fixed_ordering_cost),
+                ("unit_ordering_cost", unit_ordering_cost),
+                ("lead_time", lead_time),
+                ("holding_cost_rate", holding_cost_rate),
+                ("holding_pay_time", holding_pay_time),
+                ("product_value", product_value),
+                ("arrival_mean", arrival_mean),
+                ("demand_low", demand_low),
+                ("demand_high", demand_high),
+            ]
+        }
+        """The parameters of every item, the batch engine gets them repeated for each replication"""
+        self.sku: np.ndarray = np.arange(items) if sku is None else np.asarray(sku)
+        self.store: np.ndarray = (
+            np.zeros(items, dtype=np.int64) if store is None else np.asarray(store)
+        )
+        self.lane_arrival_mean: np.ndarray = np.zeros(0)
+        self.lane_demand_low: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.lane_demand_high: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.lane_fixed_ordering_cost: np.ndarray = np.zeros(0)
+        self.lane_unit_ordering_cost: np.ndarray = np.zeros(0)
+
+    @classmethod
+    def for_stores(cls, stores: int, **sku_parameters):
+        """Creates the simulation of the same catalogue of SKUs in several stores. Every parameter is
+        an array with one value per SKU, or an array with shape (stores, SKUs) if it changes between stores.
+        If every parameter is a single value the catalogue has one SKU
+        """
+        shape = np.broadcast(*sku_parameters.values()).shape if sku_parameters else ()
+        skus = shape[-1] if shape else 1
+        parameters = {
+            name: np.broadcast_to(np.asarray(value), (stores, skus)).ravel()
+            for name, value in sku_parameters.items()
+        }
+        store, sku = np.indices((stores, skus))
+        return cls(sku=sku.ravel(), store=store.ravel(), **parameters)
+
+    def ordering_cost(self, amount: np.ndarray, lanes: np.ndarray) -> np.ndarray:
+        return (
+            self.lane_fixed_ordering_cost[lanes]
+            + self.lane_unit_ordering_cost[lanes] * amount
+        )
+
+    def run_items(self, replications: int = 1) -> MultiItemResults:
+        """Runs all the items 'replications' times and returns the results of every item"""
+        parameters = {
+            name: np.repeat(value, replications)
+            for name, value in self.item_parameters.items()
+        }
+        self.s, self.S = parameters["s"], parameters["S"]
+        self.initial_inventory_level = parameters["initial_inventory_level"]
+        self.lead_time = parameters["lead_time"]
+        self.holding_cost_rate = parameters["holding_cost_rate"]
+        self.holding_pay_time = parameters["holding_pay_time"]
+        self.product_value = parameters["product_value"]
+        self.lane_arrival_mean = parameters["arrival_mean"]
+        self.lane_demand_low = parameters["demand_low"]
+        self.lane_demand_high = parameters["demand_high"]
+        self.lane_fixed_ordering_cost = parameters["fixed_ordering_cost"]
+        self.lane_unit_ordering_cost = parameters["unit_ordering_cost"]
+        if np.any(self.s >= self.S):
+            raise Exception("Problem: s >= S and this should not happen")
+
+        self.run(self.items * replications)
+        shape = (self.items, replications)
+        return MultiItemResults(
+            loss=self.loss().reshape(shape),
+            costs=self.costs().reshape(shape),
+            final_balance=self.balance.reshape(shape),
+            demand=self.total_demand.reshape(shape),
+            sold=self.total_sold.reshape(shape),
+            sku=self.sku,
+            store=self.store,
+        )
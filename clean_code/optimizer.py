@@ -1,9 +1,58 @@
 # This file will contain a class for optimizing locally the parameters of the policy (s,S). Will use Hill Climbing
 
 from simulation_engine import *
-from sim_stats import SimStatistics, StatisticsResults
+from sim_stats import SimStatistics, StatisticsResults, StoppingRule
+from batch_engine import BatchInventorySimulation, SharedStreamBatchSimulation
+from markov_evaluator import MarkovEvaluation, MarkovPolicyEvaluator
+from parallel import map_in_pool, seed_generators, worker_payload
+from surrogate import GaussianProcess, expected_improvement
+from variates import VariateStream
+from collections import OrderedDict
+import math
 import numpy as np
 import random as rnd
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from distributed import DistributedBackend
+
+
+def default_fitness(stats: StatisticsResults) -> float:
+    """The fitness used by default by the optimizer. Lower is better"""
+    return (
+        stats.loss_expectation
+        + 2 * stats.costs_expectation
+        - 3 * stats.final_balance_expectation
+    )
+
+
+class EvaluationCache:
+    """Stores the StatisticsResults of the last evaluated policies. When it is full the least recently
+    used one is evicted"""
+
+    def __init__(self, max_size: int = 256) -> None:
+        self.max_size: int = max_size
+        self.entries: OrderedDict[tuple, StatisticsResults] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, key: tuple) -> StatisticsResults | None:
+        results = self.entries.get(key)
+        if results is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return results
+
+    def put(self, key: tuple, results: StatisticsResults):
+        self.entries[key] = results
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.entries)
 
 
 class OptimizeSimulation:
@@ -13,17 +62,97 @@ class OptimizeSimulation:
         initial_policy: tuple[int, int],
         runs: int,
         max_value: int,
+        streaming: bool = False,
+        stopping_rule: StoppingRule | None = None,
+        seed: int | None = None,
+        cache_size: int = 256,
+        shared_streams: bool = False,
+        backend: "DistributedBackend | None" = None,
     ) -> None:
         self.simulation: InventorySimulation = simulation
         self.initial_policy = initial_policy
         self.runs: int = runs
+        """The runs of the simulation done for each policy, in every mode except with a stopping rule"""
         if max_value < initial_policy[1]:
             raise Exception("The max_value variable must be greater than S")
         self.max_value: int = max_value
+        self.streaming: bool = streaming
+        """If True the fitness is computed with the streaming statistics, that store no records"""
+        self.stopping_rule: StoppingRule | None = stopping_rule
+        """If given, each fitness runs the simulation until the precision of the rule is reached
+        instead of a fixed number of runs"""
+        self.simulated_runs: int = 0
+        """The number of runs of the simulation done by all the fitness evaluations"""
+        self.seed: int | None = seed
+        """If given, every policy is evaluated with the same seeded runs (common random numbers), so the
+        differences between neighbors are not hidden by noise and the evaluations can be cached"""
+        self.cache: EvaluationCache = EvaluationCache(cache_size)
+        """The results of the policies already evaluated with the seed. It is kept between optimize calls"""
+        self.shared_streams: bool = shared_streams
+        """If True the policies evaluated together (e.g. the neighbors of a step) are simulated at once with
+        the shared stream batch engine, 'runs' runs each over the same clients. The engine only knows the default
+        client distributions, so the evaluation raises an exception if the simulation uses other ones"""
+        self.backend: DistributedBackend | None = backend
+        """If given, the policies are evaluated by its workers with 'runs' runs each (see distributed.py)"""
 
     def valid_point(self, s: int, S: int):
         return 0 <= s <= S <= self.max_value
 
+    def evaluation_key(self, s: int, S: int) -> tuple:
+        """The key of the evaluation of a policy in the cache: the policy, the parameters of the model
+        (the trace by identity, with the time where the runs start in it) and the runs that are done (the seed, the engine and how many of them)"""
+        sim = self.simulation
+        if self.shared_streams:
+            runs = ("shared_streams", self.runs)
+        elif self.backend is not None:
+            runs = ("distributed", self.runs)
+        elif self.stopping_rule is not None:
+            runs = self.stopping_rule
+        else:
+            runs = self.runs
+        return (
+            s,
+            S,
+            sim.initial_inventory_level,
+            sim.ordering_cost_func,
+            sim.lead_time,
+            sim.holding_cost_rate,
+            sim.holding_pay_time,
+            sim.product_value,
+            sim.client_arrival_dist,
+            sim.client_demand_dist,
+            sim.demand_trace,
+            sim.trace_start,
+            sim.sim_duration,
+            self.seed,
+            runs,
+        )
+
+    def evaluate_policy(self, s: int, S: int) -> StatisticsResults:
+        """Returns the statistics of several runs of the simulation with the policy (s,S).
+        With a seed the results are taken from the cache when the policy was already evaluated"""
+        if self.shared_streams or self.backend is not None:
+            return self.evaluate_policies([(s, S)])[0]
+        key = self.evaluation_key(s, S) if self.seed is not None else None
+        if key is not None:
+            res = self.cache.get(key)
+            if res is not None:
+                return res
+        self.simulation.s, self.simulation.S = s, S
+        stats = SimStatistics(self.simulation)
+        if self.stopping_rule is not None:
+            res = stats.calculate_sequential_statistics_results(
+                self.stopping_rule, seed=self.seed
+            )
+        elif self.streaming:
+            res = stats.calculate_streaming_statistics_results(self.runs, seed=self.seed)
+        else:
+            res = stats.calculate_statistics_results(self.runs, seed=self.seed)
+        self.simulated_runs += res.number_of_runs
+        if key is not None:
+            self.cache.put(key, res)
+        return res
+
     def fitness_function(
         self,
         s: int,
@@ -31,9 +160,7 @@ class OptimizeSimulation:
         fitness: Callable[[StatisticsResults], float],
     ):
         """Returns the average fitness of several runs of the simulation"""
-        self.simulation.s, self.simulation.S = s, S
-        stats = SimStatistics(self.simulation)
-        res = stats.calculate_statistics_results()
+        res = self.evaluate_policy(s, S)
         # return (
         #     res.loss_expectation
         #     + 2 * res.costs_expectation
@@ -43,11 +170,7 @@ class OptimizeSimulation:
 
     def optimize(
         self,
-        fitness: Callable[
-            [StatisticsResults], float
-        ] = lambda stats: stats.loss_expectation
-        + 2 * stats.costs_expectation
-        - 3 * stats.final_balance_expectation,
+        fitness: Callable[[StatisticsResults], float] = default_fitness,
         steps_search: int = 5,
         single_point: bool = False,
     ):
@@ -65,11 +188,11 @@ class OptimizeSimulation:
                 if single_point
                 else self.get_neighbors(point[0], point[1])
             )
-            for n in neighbors:
-                if n in visited_points:
-                    continue
-                neighbors_fitness.append((self.fitness_function(n[0], n[1], fitness), n))
-                visited_points.add(n)
+            neighbors = [n for n in dict.fromkeys(neighbors) if n not in visited_points]
+            visited_points.update(neighbors)
+            # The neighbors are evaluated together, in a single pass with shared_streams
+            for res, n in zip(self.evaluate_policies(neighbors), neighbors):
+                neighbors_fitness.append((fitness(res), n))
             if len(neighbors_fitness) == 0:
                 break
             best = min(neighbors_fitness, key=lambda x: x[0])
@@ -101,3 +224,243 @@ class OptimizeSimulation:
             value = int(min(step_size, S - s) * interpolator)
             neighbors.add(((s + value), S))
         return list(neighbors)
+
+    def all_policies(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the arrays of s and S of all the policies 0 <= s < S <= max_value"""
+        s, S = np.triu_indices(self.max_value + 1, k=1)
+        return s, S
+
+    def prescreen(
+        self,
+        fitness: Callable[[StatisticsResults], float] = default_fitness,
+        top: int = 10,
+        step: int = 1,
+        evaluator: MarkovPolicyEvaluator | None = None,
+        workers: int | None = 1,
+    ) -> list[tuple[int, int]]:
+        """Ranks the policies of the grid with the long-run rates of the Markov evaluator, without
+        simulating, and returns the best 'top' of them to be evaluated by simulation. Only the policies
+        with s and S multiple of 'step' are ranked. The evaluator must match the distributions of the
+        simulation, by default it is the one of the simulation. The cost of each policy grows with
+        s^3 * lead_time, so for a large max_value use a step or several workers"""
+        if evaluator is None:
+            # Ranking does not need the rates to the last digits, the looser tolerance halves the cost
+            evaluator = MarkovPolicyEvaluator.from_simulation(self.simulation, tolerance=1e-6)
+        s, S = self.all_policies()
+        on_step = (s % step == 0) & (S % step == 0)
+        s, S = s[on_step], S[on_step]
+        # The policies with the same s go to the same task, the evaluator reuses their work
+        tasks = [
+            list(zip(s[s == value].tolist(), S[s == value].tolist()))
+            for value in np.unique(s)
+        ]
+        evaluations = map_in_pool(evaluator, _evaluate_markov_policies, tasks, workers)
+        ranked = [
+            (fitness(evaluation.statistics_results(self.simulation.sim_duration)), evaluation)
+            for task in evaluations
+            for evaluation in task
+        ]
+        ranked.sort(key=lambda x: x[0])
+        return [(evaluation.s, evaluation.S) for _, evaluation in ranked[:top]]
+
+    def evaluate_policies(
+        self, policies: list[tuple[int, int]], workers: int | None = 1
+    ) -> list[StatisticsResults]:
+        """Evaluates the policies like evaluate_policy. The policies that are not in the cache are sent
+        together to the workers of the backend, simulated together over the same clients with shared_streams,
+        or simulated at the same time in a pool of processes with several workers"""
+        if workers == 1 and not self.shared_streams and self.backend is None:
+            return [self.evaluate_policy(s, S) for s, S in policies]
+        keys = [
+            self.evaluation_key(s, S) if self.seed is not None else None for s, S in policies
+        ]
+        results = [self.cache.get(key) if key is not None else None for key in keys]
+        missing = [i for i, res in enumerate(results) if res is None]
+        if self.backend is not None:
+            evaluated = self.backend.evaluate_simulation(
+                self.simulation,
+                [policies[i] for i in missing],
+                self.runs,
+                self.seed if self.seed is not None else rnd.randrange(2**32),
+            )
+        elif self.shared_streams:
+            evaluated = self.evaluate_shared_streams([policies[i] for i in missing])
+        else:
+            # The forked workers start with the generators of this process, so without a seed every
+            # task gets its own one, otherwise all of them would draw the same clients
+            evaluated = map_in_pool(
+                self,
+                _evaluate_policy,
+                [
+                    (*policies[i], rnd.randrange(2**32) if self.seed is None else None)
+                    for i in missing
+                ],
+                workers,
+            )
+        for i, res in zip(missing, evaluated):
+            results[i] = res
+            self.simulated_runs += res.number_of_runs
+            if keys[i] is not None:
+                self.cache.put(keys[i], res)
+        return results
+
+    def evaluate_shared_streams(
+        self, policies: list[tuple[int, int]]
+    ) -> list[StatisticsResults]:
+        """Simulates all the policies in a single pass of the shared stream batch engine. With a seed
+        every call draws the same clients, so the policies of different calls are also comparable"""
+        if not policies:
+            return []
+        s, S = np.array(policies, dtype=np.int64).T
+        batch = SharedStreamBatchSimulation.from_simulation(self.simulation, seed=self.seed)
+        return batch.evaluate_policies(s, S, self.runs)
+
+    def bayesian_optimize(
+        self,
+        fitness: Callable[[StatisticsResults], float] = default_fitness,
+        initial_points: int = 6,
+        rounds: int = 3,
+        batch_size: int = 2,
+        seed: int = 0,
+        workers: int | None = 1,
+    ) -> tuple[int, int]:
+        """Searches the best policy with a Gaussian process fitted to the fitness of the evaluated policies.
+        It starts with the initial policy and initial_points random ones, then in every round it
+        evaluates the batch_size policies of the grid with the largest expected improvement. The batch
+        is chosen one policy at a time, assuming the chosen ones have the fitness predicted by the process
+        (the kriging believer), so its policies can be evaluated in parallel by the workers.
+        Returns the evaluated policy with the best predicted fitness"""
+        s, S = self.all_policies()
+        grid = np.column_stack((s, S)) / self.max_value
+        generator = np.random.default_rng(seed)
+        first = generator.choice(len(s), min(initial_points, len(s)), replace=False)
+        policies = [tuple(self.initial_policy)] + [(int(s[i]), int(S[i])) for i in first]
+        policies = list(dict.fromkeys(policies))
+        values = [fitness(res) for res in self.evaluate_policies(policies, workers)]
+        process = GaussianProcess()
+        for _ in range(rounds):
+            points = np.array(policies, dtype=np.float64) / self.max_value
+            observed = np.array(values)
+            process.fit(points, observed)
+            batch = []
+            for _ in range(batch_size):
+                mean, std = process.predict(grid)
+                improvement = expected_improvement(mean, std, observed.min())
+                for chosen in batch + policies:
+                    improvement[(s == chosen[0]) & (S == chosen[1])] = -np.inf
+                best = int(improvement.argmax())
+                if improvement[best] == -np.inf:
+                    break
+                batch.append((int(s[best]), int(S[best])))
+                points = np.vstack((points, grid[best]))
+                observed = np.append(observed, mean[best])
+                process.fit(points, observed, optimize=False)
+            if not batch:
+                break
+            policies += batch
+            values += [fitness(res) for res in self.evaluate_policies(batch, workers)]
+        # The noise of the runs makes the best observed fitness optimistic, the process smooths it
+        process.fit(np.array(policies, dtype=np.float64) / self.max_value, np.array(values))
+        mean, _ = process.predict(np.array(policies, dtype=np.float64) / self.max_value)
+        return policies[int(mean.argmin())]
+
+    def successive_halving(
+        self,
+        fitness: Callable[[StatisticsResults], float] = default_fitness,
+        initial_runs: int = 2,
+        eta: int = 2,
+        seed: int = 0,
+        workers: int | None = None,
+        lanes_per_task: int = 20000,
+    ) -> tuple[int, int]:
+        """Searches the best policy of the whole valid region. All the policies start with a few runs,
+        then in every round only the best 1/eta of them survive and they get eta times more runs.
+        The runs of each round are done with the batch engine in a pool of processes.
+        The results only depend on the seed, not on the number of workers"""
+        if initial_runs < 2:
+            raise Exception("Every policy needs at least 2 runs to estimate its variance")
+        s, S = self.all_policies()
+        # Accumulated count, mean and sum of squared differences of the loss, costs and balance
+        count = np.zeros(len(s))
+        means = np.zeros((3, len(s)))
+        m2 = np.zeros((3, len(s)))
+        survivors = np.arange(len(s))
+        runs = initial_runs
+        round_number = 0
+        while len(survivors) > 1:
+            policies_per_task = max(1, lanes_per_task // runs)
+            chunks = [
+                survivors[i : i + policies_per_task]
+                for i in range(0, len(survivors), policies_per_task)
+            ]
+            tasks = [
+                (s[chunk], S[chunk], runs, (seed, round_number, i))
+                for i, chunk in enumerate(chunks)
+            ]
+            results = map_in_pool(self.simulation, _evaluate_policies, tasks, workers)
+            batch = np.concatenate([np.stack(r) for r in results], axis=1)
+            self.simulated_runs += batch.shape[1] * runs
+            # Chan's merge of the accumulated statistics with the ones of this round
+            batch_mean = batch.mean(axis=2)
+            batch_m2 = ((batch - batch_mean[..., None]) ** 2).sum(axis=2)
+            total = count[survivors] + runs
+            delta = batch_mean - means[:, survivors]
+            m2[:, survivors] += batch_m2 + delta**2 * count[survivors] * runs / total
+            means[:, survivors] += delta * runs / total
+            count[survivors] = total
+
+            scores = np.array(
+                [
+                    fitness(
+                        StatisticsResults(
+                            loss_expectation=means[0, i],
+                            costs_expectation=means[1, i],
+                            final_balance_expectation=means[2, i],
+                            loss_variance=m2[0, i] / (count[i] - 1),
+                            costs_variance=m2[1, i] / (count[i] - 1),
+                            final_balance_variance=m2[2, i] / (count[i] - 1),
+                            number_of_runs=int(count[i]),
+                        )
+                    )
+                    for i in survivors
+                ]
+            )
+            keep = math.ceil(len(survivors) / eta)
+            survivors = survivors[np.argsort(scores, kind="stable")[:keep]]
+            runs *= eta
+            round_number += 1
+        best = survivors[0]
+        return int(s[best]), int(S[best])
+
+
+def _evaluate_policies(
+    task: tuple[np.ndarray, np.ndarray, int, tuple[int, int, int]]
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Runs in a worker process the replications of a chunk of policies with the batch engine"""
+    s, S, runs, seed = task
+    seed_sequence = np.random.SeedSequence(seed[0], spawn_key=seed[1:])
+    batch = BatchInventorySimulation.from_simulation(worker_payload(), seed=seed_sequence)
+    return batch.run_policies(s, S, runs)
+
+
+def _evaluate_policy(task: tuple[int, int, int | None]) -> StatisticsResults:
+    """Evaluates a policy in a worker process with the optimizer of the pool. Without the seed of the
+    optimizer the task seeds the generators of the worker with its own seed"""
+    s, S, seed = task
+    optimizer: OptimizeSimulation = worker_payload()
+    if seed is not None:
+        seed_generators(np.random.SeedSequence(seed))
+        # The blocks drawn before the fork would be the same in every worker
+        for dist in (
+            optimizer.simulation.client_arrival_dist,
+            optimizer.simulation.client_demand_dist,
+        ):
+            if isinstance(dist, VariateStream):
+                dist.reset()
+    return optimizer.evaluate_policy(s, S)
+
+
+def _evaluate_markov_policies(task: list[tuple[int, int]]) -> list[MarkovEvaluation]:
+    """Evaluates in a worker process a list of policies with the Markov evaluator of the pool"""
+    evaluator: MarkovPolicyEvaluator = worker_payload()
+    return [evaluator.evaluate(s, S) for s, S in task]
@@ -0,0 +1,92 @@
+# This file contains the tools for running work of the simulation in a pool of processes and for
+# giving every replication its own reproducible random stream
+# multiprocessing and concurrent.futures are imported when a pool is created, so the processes
+# that never use a pool do not load them
+import random
+from typing import TYPE_CHECKING, Any, Callable, Iterable
+import numpy as np
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+_worker_payload: Any = None
+"""The object shared by all the tasks of a worker process (e.g. the simulation to run)"""
+
+
+def replication_seed(seed: int, replication: int) -> np.random.SeedSequence:
+    """Returns the seed of a replication. It is the same SeedSequence as the child number
+    'replication' spawned by SeedSequence(seed), so it does not depend on how the runs are split"""
+    return np.random.SeedSequence(seed, spawn_key=(replication,))
+
+
+def seed_generators(seed_sequence: np.random.SeedSequence):
+    """Seeds the global generators of random and numpy, which are the ones used by the
+    distributions of the simulation"""
+    state = seed_sequence.generate_state(4)
+    random.seed(int.from_bytes(state.tobytes(), "little"))
+    np.random.seed(state)
+
+
+def pool_context():
+    """The simulations store lambdas that can not be pickled, so the workers are forked when
+    the platform allows it and inherit the payload instead of receiving it pickled"""
+    import multiprocessing
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def worker_payload() -> Any:
+    """Returns the payload given to the pool of the actual worker process"""
+    return _worker_payload
+
+
+def _initialize_worker(payload: Any):
+    global _worker_payload
+    _worker_payload = payload
+
+
+def create_pool(payload: Any, workers: int | None = None) -> "ProcessPoolExecutor":
+    """Creates a pool of processes whose workers can access the payload with worker_payload()"""
+    from concurrent.futures import ProcessPoolExecutor
+
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=pool_context(),
+        initializer=_initialize_worker,
+        initargs=(payload,),
+    )
+
+
+def map_in_pool[
+    T, R
+](
+    payload: Any,
+    function: Callable[[T], R],
+    tasks: Iterable[T],
+    workers: int | None = None,
+) -> list[R]:
+    """Applies function to every task in a pool of processes and returns the results in the
+    order of the tasks. When workers is 1 everything runs in this process, and the payload and the
+    global generators the tasks seed are restored at the end, as if the tasks ran in other processes"""
+    if workers == 1:
+        global _worker_payload
+        previous_payload = _worker_payload
+        random_state, numpy_state = random.getstate(), np.random.get_state()
+        _worker_payload = payload
+        try:
+            return [function(task) for task in tasks]
+        finally:
+            _worker_payload = previous_payload
+            random.setstate(random_state)
+            np.random.set_state(numpy_state)
+    with create_pool(payload, workers) as pool:
+        return list(pool.map(function, tasks))
+
+
+def split_range(total: int, parts: int) -> list[range]:
+    """Splits range(total) in at most 'parts' contiguous ranges of similar size"""
+    parts = max(1, min(parts, total))
+    bounds = np.linspace(0, total, parts + 1).astype(int)
+    return [range(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class Registry:
     """This is the class for store useful information of the simulation"""
 
@@ -46,6 +49,197 @@ class Registry:
         record = PayHoldingRecord(time, cost)
         self.pay_holding_registry[time] = record
 
+    def record_counts(self) -> dict[str, int]:
+        """Returns the number of records stored in each registry"""
+        return {
+            "sell": sum(len(sells) for sells in self.sell_registry.values()),
+            "stock": len(self.stock_registry),
+            "buy": len(self.buy_registry),
+            "balance": len(self.balance_registry),
+            "pay_holding": len(self.pay_holding_registry),
+        }
+
+
+class GrowableArray:
+    """A typed array that grows when values are appended. The values are stored in a numpy buffer
+    that doubles its size when it is full, so the values appended can be read as a view without copying
+    """
+
+    def __init__(self, dtype, capacity: int = 64) -> None:
+        self.dtype: np.dtype = np.dtype(dtype)
+        self.buffer: np.ndarray = np.empty(capacity, dtype=self.dtype)
+        self.size: int = 0
+        """The number of values appended, the rest of the buffer is free"""
+        self.last_value = None
+        """The last value appended, kept as a Python value because the registries compare it with
+        every new record"""
+
+    def append(self, value):
+        if self.size == len(self.buffer):
+            # The views already returned keep the old buffer, the new values go to a bigger one
+            buffer = np.empty(2 * len(self.buffer), dtype=self.dtype)
+            buffer[: self.size] = self.buffer
+            self.buffer = buffer
+        self.buffer[self.size] = value
+        self.size += 1
+        self.last_value = value
+
+    def set_last(self, value):
+        """Overwrites the last value appended. The views that contain it see the new value"""
+        self.buffer[self.size - 1] = value
+        self.last_value = value
+
+    def last(self):
+        """Returns the last value appended, or None if the array is empty"""
+        return self.last_value
+
+    def to_numpy(self) -> np.ndarray:
+        """Returns a view of the values appended. Appending later does not change the view, the values
+        are only written to the part of the buffer that is not in it or to a new buffer"""
+        return self.buffer[: self.size]
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class ColumnarRegistry:
+    """Registry that stores every field of the records in its own growable array.
+    The simulation adds the records in event order, so the columns are always sorted by time.
+    Like in Registry, a stock, balance, buy or pay holding record overwrites the one with the same time
+    """
+
+    def __init__(self) -> None:
+        self.sell_time: GrowableArray = GrowableArray(np.int64)
+        self.sell_amount_asked: GrowableArray = GrowableArray(np.int64)
+        self.sell_amount_seeled: GrowableArray = GrowableArray(np.int64)
+        self.stock_time: GrowableArray = GrowableArray(np.int64)
+        self.stock_amount: GrowableArray = GrowableArray(np.int64)
+        self.buy_time: GrowableArray = GrowableArray(np.int64)
+        self.buy_amount: GrowableArray = GrowableArray(np.int64)
+        self.buy_cost: GrowableArray = GrowableArray(np.float64)
+        self.balance_time: GrowableArray = GrowableArray(np.int64)
+        self.balance_value: GrowableArray = GrowableArray(np.float64)
+        self.pay_holding_time: GrowableArray = GrowableArray(np.int64)
+        self.pay_holding_cost: GrowableArray = GrowableArray(np.float64)
+
+    def add_sell_record(self, time: int, amount_asked: int, amount_seeled: int):
+        """Appends a sell to the sell columns"""
+        self.sell_time.append(time)
+        self.sell_amount_asked.append(amount_asked)
+        self.sell_amount_seeled.append(amount_seeled)
+
+    def add_stock_record(self, time: int, amount: int):
+        """Appends the stock at a time to the stock columns"""
+        if self.stock_time.last() == time:
+            self.stock_amount.set_last(amount)
+        else:
+            self.stock_time.append(time)
+            self.stock_amount.append(amount)
+
+    def add_buy_record(self, time: int, amount: int, cost: int):
+        """Appends a buy to the buy columns"""
+        if self.buy_time.last() == time:
+            self.buy_amount.set_last(amount)
+            self.buy_cost.set_last(cost)
+        else:
+            self.buy_time.append(time)
+            self.buy_amount.append(amount)
+            self.buy_cost.append(cost)
+
+    def add_balance_record(self, time: int, balance: int):
+        """Appends the balance at a time to the balance columns"""
+        if self.balance_time.last() == time:
+            self.balance_value.set_last(balance)
+        else:
+            self.balance_time.append(time)
+            self.balance_value.append(balance)
+
+    def add_pay_holding_record(self, time: int, cost: int):
+        """Appends a payment for holding inventory to the pay holding columns"""
+        if self.pay_holding_time.last() == time:
+            self.pay_holding_cost.set_last(cost)
+        else:
+            self.pay_holding_time.append(time)
+            self.pay_holding_cost.append(cost)
+
+    def record_counts(self) -> dict[str, int]:
+        """Returns the number of records stored in each group of columns"""
+        return {
+            "sell": len(self.sell_time),
+            "stock": len(self.stock_time),
+            "buy": len(self.buy_time),
+            "balance": len(self.balance_time),
+            "pay_holding": len(self.pay_holding_time),
+        }
+
+    def sells(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns views of the time, amount asked and amount seeled of every sell"""
+        return (
+            self.sell_time.to_numpy(),
+            self.sell_amount_asked.to_numpy(),
+            self.sell_amount_seeled.to_numpy(),
+        )
+
+    def stock(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns views of the time and amount of every stock record"""
+        return self.stock_time.to_numpy(), self.stock_amount.to_numpy()
+
+    def buys(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns views of the time, amount and cost of every buy"""
+        return self.buy_time.to_numpy(), self.buy_amount.to_numpy(), self.buy_cost.to_numpy()
+
+    def balance(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns views of the time and value of every balance record"""
+        return self.balance_time.to_numpy(), self.balance_value.to_numpy()
+
+    def pay_holding(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns views of the time and cost of every payment for holding inventory"""
+        return self.pay_holding_time.to_numpy(), self.pay_holding_cost.to_numpy()
+
+
+class TotalsRegistry:
+    """Registry that does not store any record, it only keeps the running sums that the
+    statistics of a run need. The memory used by a run with it does not depend on its duration
+    """
+
+    def __init__(self) -> None:
+        self.amount_asked: int = 0
+        """The total number of units asked by the clients"""
+        self.amount_seeled: int = 0
+        """The total number of units sold to the clients"""
+        self.buy_cost: float = 0
+        """The total amount of money paid to the supplier"""
+        self.pay_holding_cost: float = 0
+        """The total amount of money paid for holding inventory"""
+
+    def add_sell_record(self, time: int, amount_asked: int, amount_seeled: int):
+        self.amount_asked += amount_asked
+        self.amount_seeled += amount_seeled
+
+    def add_stock_record(self, time: int, amount: int):
+        pass
+
+    def add_buy_record(self, time: int, amount: int, cost: int):
+        self.buy_cost += cost
+
+    def add_balance_record(self, time: int, balance: int):
+        pass
+
+    def add_pay_holding_record(self, time: int, cost: int):
+        self.pay_holding_cost += cost
+
+    def record_counts(self) -> dict[str, int]:
+        """This registry stores no records"""
+        return {}
+
+
+RECORDING_LEVELS: dict[str, type] = {
+    "full": Registry,
+    "columnar": ColumnarRegistry,
+    "totals": TotalsRegistry,
+}
+"""The registries that the simulation can use, by the name of its recording level"""
+
 
 class Record:
     """Base class for all the information records of the simulation"""
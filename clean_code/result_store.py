@@ -0,0 +1,299 @@
+# This file contains the on-disk store of the runs of an experiment. Every column of the records is
+# a .npy file, so the runs can be analysed again without simulating them and without loading the
+# whole experiment in memory (the columns are memory-mapped)
+import json
+import os
+from typing import BinaryIO
+
+import numpy as np
+
+from registers import ColumnarRegistry, TotalsRegistry
+from simulation_engine import InventorySimulation
+from sim_stats import SimStatistics, StatisticsResults
+from parallel import replication_seed
+
+COLUMNS: dict[str, dict[str, np.dtype]] = {
+    "sell": {
+        "sell_time": np.dtype(np.int64),
+        "sell_amount_asked": np.dtype(np.int64),
+        "sell_amount_seeled": np.dtype(np.int64),
+    },
+    "stock": {
+        "stock_time": np.dtype(np.int64),
+        "stock_amount": np.dtype(np.int64),
+    },
+    "buy": {
+        "buy_time": np.dtype(np.int64),
+        "buy_amount": np.dtype(np.int64),
+        "buy_cost": np.dtype(np.float64),
+    },
+    "balance": {
+        "balance_time": np.dtype(np.int64),
+        "balance_value": np.dtype(np.float64),
+    },
+    "pay_holding": {
+        "pay_holding_time": np.dtype(np.int64),
+        "pay_holding_cost": np.dtype(np.float64),
+    },
+}
+"""The columns stored of each group of records, with the names of the ColumnarRegistry columns"""
+
+PARAMETERS: list[str] = [
+    "s",
+    "S",
+    "initial_inventory_level",
+    "lead_time",
+    "holding_cost_rate",
+    "holding_pay_time",
+    "product_value",
+    "sim_duration",
+]
+"""The parameters of the simulation saved with the experiment"""
+
+_HEADER_SIZE: int = 128
+"""The size of the .npy headers written by the store. It is fixed, so the header can be written
+again with the final length once all the runs are appended"""
+
+
+def _write_npy_header(file: BinaryIO, dtype: np.dtype, length: int):
+    """Writes at the start of the file the header (version 1.0) of a one dimensional .npy array"""
+    header = repr(
+        {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (length,)}
+    )
+    padding = _HEADER_SIZE - len(np.lib.format.magic(1, 0)) - 2 - len(header) - 1
+    file.seek(0)
+    file.write(np.lib.format.magic(1, 0))
+    file.write((_HEADER_SIZE - len(np.lib.format.magic(1, 0)) - 2).to_bytes(2, "little"))
+    file.write((header + " " * padding + "\n").encode("latin1"))
+
+
+class ColumnWriter:
+    """Appends values to a .npy file without keeping them in memory"""
+
+    def __init__(self, path: str, dtype: np.dtype) -> None:
+        self.dtype: np.dtype = dtype
+        self.length: int = 0
+        self.file: BinaryIO = open(path, "wb")
+        _write_npy_header(self.file, dtype, 0)
+
+    def append(self, values: np.ndarray):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self.file.write(values.tobytes())
+        self.length += len(values)
+
+    def close(self):
+        _write_npy_header(self.file, self.dtype, self.length)
+        self.file.close()
+
+
+class ExperimentWriter:
+    """Writes the runs of an experiment in a directory. Use it as a context manager, the files are
+    complete once it is closed:
+
+        with ExperimentWriter("experiments/s20_S300", simulation) as writer:
+            for i in range(runs):
+                simulation.run()
+                writer.add_run(simulation)
+    """
+
+    def __init__(self, path: str, simulation: InventorySimulation) -> None:
+        os.makedirs(path, exist_ok=True)
+        self.path: str = path
+        self.parameters: dict = {name: getattr(simulation, name) for name in PARAMETERS}
+        self.columns: dict[str, ColumnWriter] = {
+            name: ColumnWriter(os.path.join(path, f"{name}.npy"), dtype)
+            for group in COLUMNS.values()
+            for name, dtype in group.items()
+        }
+        self.offsets: dict[str, list[int]] = {group: [0] for group in COLUMNS}
+        """The index of the first record of every run in the columns of each group"""
+        self.final_balance: list[float] = []
+        self.statistics: StatisticsResults | None = None
+
+    def add_run(self, simulation: InventorySimulation):
+        """Appends the records of the last run of the simulation"""
+        if isinstance(simulation.registry, TotalsRegistry):
+            raise Exception("A run with the totals recording level has no records to store")
+        stats = SimStatistics(simulation)
+        groups = {
+            "sell": stats.get_sells_columns(),
+            "stock": stats.get_stock_columns(),
+            "buy": stats.get_buy_columns(),
+            "balance": stats.get_balance_columns(),
+            "pay_holding": stats.get_pay_hold_columns(),
+        }
+        for group, values in groups.items():
+            for name, column in zip(COLUMNS[group], values):
+                self.columns[name].append(column)
+            self.offsets[group].append(self.offsets[group][-1] + len(values[0]))
+        self.final_balance.append(simulation.actual_balance)
+
+    def close(self):
+        for column in self.columns.values():
+            column.close()
+        for group, offsets in self.offsets.items():
+            np.save(
+                os.path.join(self.path, f"{group}_offsets.npy"),
+                np.array(offsets, dtype=np.int64),
+            )
+        np.save(
+            os.path.join(self.path, "final_balance.npy"),
+            np.array(self.final_balance, dtype=np.float64),
+        )
+        metadata = {
+            "number_of_runs": len(self.final_balance),
+            "parameters": self.parameters,
+            "statistics": vars(self.statistics) if self.statistics else None,
+        }
+        with open(os.path.join(self.path, "experiment.json"), "w") as file:
+            json.dump(metadata, file, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def record_experiment(
+    path: str,
+    simulation: InventorySimulation,
+    number_of_runs: int = 40,
+    seed: int | None = None,
+) -> StatisticsResults:
+    """Runs the simulation number_of_runs times like SimStatistics.calculate_statistics_results and
+    stores every run and the statistics of the runs in the directory"""
+    stats = SimStatistics(simulation)
+    runs = []
+    with ExperimentWriter(path, simulation) as writer:
+        for i in range(number_of_runs):
+            runs.append(
+                stats.run_replication(replication_seed(seed, i) if seed is not None else None)
+            )
+            writer.add_run(simulation)
+        writer.statistics = SimStatistics.results_from_runs(runs)
+    return writer.statistics
+
+
+class StoredRegistry(ColumnarRegistry):
+    """The records of a stored run. The columns are slices of the memory-mapped columns of the
+    experiment, so they are read from disk only when they are used. It can not get new records
+    """
+
+    def __init__(self, columns: dict[str, np.ndarray]) -> None:
+        self.columns: dict[str, np.ndarray] = columns
+
+    def add_sell_record(self, time: int, amount_asked: int, amount_seeled: int):
+        raise Exception("A stored registry is read only")
+
+    add_stock_record = add_buy_record = add_balance_record = add_pay_holding_record = (
+        add_sell_record
+    )
+
+    def record_counts(self) -> dict[str, int]:
+        return {group: len(self.columns[f"{group}_time"]) for group in COLUMNS}
+
+    def sells(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return tuple(self.columns[name] for name in COLUMNS["sell"])
+
+    def stock(self) -> tuple[np.ndarray, np.ndarray]:
+        return tuple(self.columns[name] for name in COLUMNS["stock"])
+
+    def buys(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return tuple(self.columns[name] for name in COLUMNS["buy"])
+
+    def balance(self) -> tuple[np.ndarray, np.ndarray]:
+        return tuple(self.columns[name] for name in COLUMNS["balance"])
+
+    def pay_holding(self) -> tuple[np.ndarray, np.ndarray]:
+        return tuple(self.columns[name] for name in COLUMNS["pay_holding"])
+
+
+class StoredRun:
+    """A stored run with the attributes of InventorySimulation that SimStatistics and Graphics use,
+    so they work with it as with the simulation after the run"""
+
+    def __init__(
+        self, registry: StoredRegistry, actual_balance: float, parameters: dict
+    ) -> None:
+        self.registry: StoredRegistry = registry
+        self.actual_balance: float = actual_balance
+        self.parameters: dict = parameters
+        for name, value in parameters.items():
+            setattr(self, name, value)
+
+
+class StoredExperiment:
+    """Reads an experiment written by ExperimentWriter. The columns are memory-mapped when the
+    experiment is opened, and nothing is read from them until a run or a measure is asked"""
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        with open(os.path.join(path, "experiment.json")) as file:
+            metadata = json.load(file)
+        self.number_of_runs: int = metadata["number_of_runs"]
+        self.parameters: dict = metadata["parameters"]
+        self.stored_statistics: dict | None = metadata["statistics"]
+        self.columns: dict[str, np.ndarray] = {
+            name: self.load(name) for group in COLUMNS.values() for name in group
+        }
+        self.offsets: dict[str, np.ndarray] = {
+            group: self.load(f"{group}_offsets") for group in COLUMNS
+        }
+        self.final_balance: np.ndarray = self.load("final_balance")
+
+    def load(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return self.number_of_runs
+
+    def run(self, index: int) -> StoredRun:
+        """Returns the run with that index. Use SimStatistics(experiment.run(i)) to analyse it"""
+        if not 0 <= index < self.number_of_runs:
+            raise IndexError(f"The experiment has {self.number_of_runs} runs")
+        columns = {}
+        for group, names in COLUMNS.items():
+            start, end = self.offsets[group][index], self.offsets[group][index + 1]
+            for name in names:
+                columns[name] = self.columns[name][start:end]
+        return StoredRun(
+            StoredRegistry(columns), float(self.final_balance[index]), self.parameters
+        )
+
+    def sum_per_run(self, name: str, chunk_size: int = 100_000) -> np.ndarray:
+        """Returns the sum of a column in every run. The runs are read chunk_size at a time, so the
+        memory used does not depend on the size of the experiment"""
+        group = next(group for group, names in COLUMNS.items() if name in names)
+        offsets = self.offsets[group]
+        sums = np.empty(self.number_of_runs, dtype=np.float64)
+        for first in range(0, self.number_of_runs, chunk_size):
+            last = min(first + chunk_size, self.number_of_runs)
+            chunk_offsets = np.asarray(offsets[first : last + 1])
+            values = np.asarray(self.columns[name][chunk_offsets[0] : chunk_offsets[-1]])
+            starts = chunk_offsets[:-1] - chunk_offsets[0]
+            # reduceat can not sum empty runs, they are left at zero
+            not_empty = np.diff(chunk_offsets) > 0
+            chunk = np.zeros(last - first, dtype=np.float64)
+            if not_empty.any():
+                chunk[not_empty] = np.add.reduceat(values, starts[not_empty])
+            sums[first:last] = chunk
+        return sums
+
+    def run_measures(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the loss, costs and final balance of every run, as SimStatistics.measure_run"""
+        loss = self.parameters["product_value"] * (
+            self.sum_per_run("sell_amount_asked") - self.sum_per_run("sell_amount_seeled")
+        )
+        costs = self.sum_per_run("pay_holding_cost") + self.sum_per_run("buy_cost")
+        return loss, costs, np.asarray(self.final_balance, dtype=np.float64)
+
+    def statistics(self) -> StatisticsResults:
+        """The statistics saved with the experiment, or the ones of the stored runs if none was saved"""
+        if self.stored_statistics is None:
+            return StatisticsResults.from_samples(*self.run_measures())
+        fields = {
+            name: tuple(value) if isinstance(value, list) else value
+            for name, value in self.stored_statistics.items()
+        }
+        return StatisticsResults(**fields)
@@ -0,0 +1,282 @@
+# This file contains a local service that evaluates (s,S) policies for what-if queries. It keeps a pool
+# of worker processes and a cache of results alive between queries, so a query does not pay for starting
+# the interpreter and importing the simulation. The protocol is JSON over TCP, one message per line:
+#
+#   request:  {"id": 1, "parameters": {"lead_time": 10}, "policies": [[20, 100], [30, 120]],
+#              "runs": 40, "seed": 0}
+#   replies:  {"id": 1, "type": "progress", "policy": [20, 100], "runs": 10, "statistics": {...}}
+#             {"id": 1, "type": "result", "policy": [20, 100], "cached": false, "statistics": {...}}
+#             {"id": 1, "type": "done"}
+#             {"id": 1, "type": "error", "message": "..."}
+#
+# Usage:
+#   python service.py [--host 127.0.0.1] [--port 8765] [--workers N] [--runs N]
+import argparse
+import asyncio
+import json
+import os
+from typing import AsyncIterator
+
+import numpy as np
+
+from sim_stats import SimStatistics, StatisticsResults
+from optimizer import EvaluationCache
+from model_parameters import PARAMETERS, build_simulation
+from parallel import create_pool, replication_seed, split_range
+
+
+def _run_chunk(
+    task: tuple[dict, int, int, int, range]
+) -> list[tuple[float, float, float]]:
+    """Runs in a worker process the replications of the range of a policy"""
+    parameters, s, S, seed, replications = task
+    stats = SimStatistics(build_simulation(parameters, s, S))
+    return [stats.run_replication(replication_seed(seed, i)) for i in replications]
+
+
+def _warm_up() -> None:
+    """Does nothing, it is sent to every worker when the service starts so all of them are created"""
+
+
+class EvaluationService:
+    """Evaluates the policies of the queries in a pool of processes. The runs of every policy are split
+    in chunks of chunk_size runs, and the statistics of the runs done so far are sent after every chunk.
+    The results of the queries with a seed are cached, and identical queries that arrive while one is
+    running wait for its result instead of running again"""
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        cache_size: int = 256,
+        chunk_size: int = 10,
+        runs: int = 40,
+    ) -> None:
+        self.workers: int | None = workers
+        self.runs: int = runs
+        """The runs of every policy of the queries that do not give them"""
+        self.chunk_size: int = chunk_size
+        self.cache: EvaluationCache = EvaluationCache(cache_size)
+        self.running: dict[tuple, asyncio.Future] = {}
+        """The evaluations in progress by their cache key"""
+        self.pool = None
+        self.server: asyncio.Server | None = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765):
+        """Creates the pool, waits until all its workers are running and starts listening"""
+        self.pool = create_pool(None, self.workers)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *[
+                loop.run_in_executor(self.pool, _warm_up)
+                for _ in range(self.workers or os.cpu_count() or 1)
+            ]
+        )
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+
+    @property
+    def port(self) -> int:
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        """Answers the queries of a connection. The queries of a connection run concurrently and their
+        replies are told apart by the id of the query"""
+        lock = asyncio.Lock()
+
+        async def send(message: dict):
+            async with lock:
+                writer.write((json.dumps(message) + "\n").encode())
+                await writer.drain()
+
+        async def answer(request: dict):
+            try:
+                async for message in self.evaluate(request):
+                    await send({"id": request.get("id"), **message})
+            except Exception as error:
+                await send({"id": request.get("id"), "type": "error", "message": str(error)})
+
+        queries = set()
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError as error:
+                    await send({"id": None, "type": "error", "message": str(error)})
+                    continue
+                query = asyncio.create_task(answer(request))
+                queries.add(query)
+                query.add_done_callback(queries.discard)
+            await asyncio.gather(*queries)
+        except ConnectionError:
+            for query in queries:
+                query.cancel()
+        finally:
+            writer.close()
+
+    async def evaluate(self, request: dict) -> AsyncIterator[dict]:
+        """Yields the progress and the result of every policy of the query and the final message"""
+        parameters = request.get("parameters", {})
+        unknown = set(parameters) - set(PARAMETERS)
+        if unknown:
+            raise Exception(f"Unknown parameters {sorted(unknown)}")
+        parameters = {name: PARAMETERS[name](value) for name, value in parameters.items()}
+        runs = int(request.get("runs", self.runs))
+        if runs < 2:
+            raise Exception("Every policy needs at least 2 runs to estimate its variance")
+        seed = None if request.get("seed") is None else int(request["seed"])
+        policies = [(int(s), int(S)) for s, S in request.get("policies", [[10, 20]])]
+        for s, S in policies:
+            if not 0 <= s < S:
+                raise Exception(f"The policy ({s},{S}) is invalid, it must be 0 <= s < S")
+
+        queue: asyncio.Queue = asyncio.Queue()
+        evaluations = [
+            asyncio.create_task(self.evaluate_policy(parameters, policy, runs, seed, queue))
+            for policy in policies
+        ]
+        try:
+            for _ in range(len(evaluations)):
+                # Each evaluation puts its progress messages and then None when it is finished
+                while (message := await queue.get()) is not None:
+                    yield message
+            for evaluation in evaluations:
+                evaluation.result()
+        finally:
+            for evaluation in evaluations:
+                evaluation.cancel()
+        yield {"type": "done"}
+
+    async def evaluate_policy(
+        self,
+        parameters: dict,
+        policy: tuple[int, int],
+        runs: int,
+        seed: int | None,
+        queue: asyncio.Queue,
+    ):
+        """Puts in the queue the progress and the result of the policy, and None at the end"""
+        try:
+            key = (tuple(sorted(parameters.items())), policy, runs, seed)
+            cached = seed is not None and key in self.cache.entries
+            if cached:
+                results = self.cache.get(key)
+            elif seed is not None and key in self.running:
+                results = await asyncio.shield(self.running[key])
+                cached = True
+            else:
+                future = asyncio.get_running_loop().create_future()
+                if seed is not None:
+                    self.running[key] = future
+                try:
+                    results = await self.simulate(parameters, policy, runs, seed, queue)
+                    future.set_result(results)
+                except BaseException as error:
+                    future.set_exception(error)
+                    future.exception()
+                    raise
+                finally:
+                    self.running.pop(key, None)
+                if seed is not None:
+                    self.cache.put(key, results)
+            await queue.put(
+                {
+                    "type": "result",
+                    "policy": list(policy),
+                    "cached": cached,
+                    "statistics": vars(results),
+                }
+            )
+        finally:
+            await queue.put(None)
+
+    async def simulate(
+        self,
+        parameters: dict,
+        policy: tuple[int, int],
+        runs: int,
+        seed: int | None,
+        queue: asyncio.Queue,
+    ) -> StatisticsResults:
+        # Validates the parameters here, the errors of the workers are harder to read
+        build_simulation(parameters, *policy)
+        if seed is None:
+            seed = int(np.random.SeedSequence().entropy)
+        loop = asyncio.get_running_loop()
+        chunks = split_range(runs, -(-runs // self.chunk_size))
+        pending = [
+            loop.run_in_executor(self.pool, _run_chunk, (parameters, *policy, seed, chunk))
+            for chunk in chunks
+        ]
+        samples: list[tuple[float, float, float]] = []
+        for chunk in asyncio.as_completed(pending):
+            samples += await chunk
+            if len(samples) >= 2 and len(samples) < runs:
+                await queue.put(
+                    {
+                        "type": "progress",
+                        "policy": list(policy),
+                        "runs": len(samples),
+                        "statistics": vars(SimStatistics.results_from_runs(samples)),
+                    }
+                )
+        # The final statistics use the runs in the order of the replications, so they do not depend
+        # on which chunk finished first
+        ordered = [run for future in pending for run in future.result()]
+        return SimStatistics.results_from_runs(ordered)
+
+
+async def request_evaluation(
+    request: dict, host: str = "127.0.0.1", port: int = 8765
+) -> AsyncIterator[dict]:
+    """Sends a query to the service and yields its replies until the last one"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write((json.dumps(request) + "\n").encode())
+        await writer.drain()
+        while line := await reader.readline():
+            message = json.loads(line)
+            yield message
+            if message["type"] in ("done", "error"):
+                break
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def serve(host: str, port: int, workers: int | None, runs: int):
+    service = EvaluationService(workers, runs=runs)
+    await service.start(host, port)
+    print(f"Serving on {host}:{service.port}")
+    try:
+        await service.serve_forever()
+    finally:
+        await service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--runs", type=int, default=40)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.runs))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
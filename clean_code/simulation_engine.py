@@ -1,10 +1,64 @@
+import copy
 import random
-from typing import Callable
-import heapq
+from heapq import heappop, heappush
+from typing import TYPE_CHECKING, Any, Callable
+
+import numpy as np
 
 from registers import *
 from events import *
 from utils import poisson_random_variable
+from instrumentation import EngineInstrumentation, unwrapped_queue
+
+if TYPE_CHECKING:
+    from demand_trace import DemandTrace, TraceReader
+
+
+class SimulationSnapshot:
+    """The state of a simulation at some time of a run, taken with InventorySimulation.snapshot.
+    It includes the random generators, so a run restored from it continues exactly as the original.
+    The snapshot owns copies of the queue and, if it was included, the registry, restoring it does not
+    consume it"""
+
+    def __init__(
+        self,
+        time: int,
+        actual_balance: int,
+        actual_inventory_level: int,
+        pending_order: bool,
+        sim_over: bool,
+        next_holding_payment: int,
+        event_queue: HeapEventQueue | SlotEventQueue,
+        registry: Registry | None,
+        random_state: tuple,
+        numpy_state: dict,
+        distribution_states: dict[str, Any],
+    ) -> None:
+        self.time: int = time
+        self.actual_balance: int = actual_balance
+        self.actual_inventory_level: int = actual_inventory_level
+        self.pending_order: bool = pending_order
+        self.sim_over: bool = sim_over
+        self.next_holding_payment: int = next_holding_payment
+        self.event_queue: HeapEventQueue | SlotEventQueue = event_queue
+        self.registry: Registry | None = registry
+        """The records until the snapshot, None if they were not included"""
+        self.random_state: tuple = random_state
+        """The state of the generator of the random module"""
+        self.numpy_state: dict = numpy_state
+        """The state of the global numpy generator"""
+        self.distribution_states: dict[str, Any] = distribution_states
+        """The state of the distributions that have their own (e.g. the buffer of a VariateStream)"""
+
+
+def default_client_arrival() -> int:
+    """The minutes until the next client by default, Poisson with mean 5"""
+    return poisson_random_variable(5)
+
+
+def default_client_demand() -> int:
+    """The units asked by a client by default, uniform between 1 and 50"""
+    return random.randint(1, 50)
 
 
 class InventorySimulation:
@@ -19,12 +73,22 @@ class InventorySimulation:
         # 60 minutes, 1 hour. After that time the store must pay for the inventory
         holding_pay_time: int = 60,
         product_value: int = 10,
-        client_arrival_dist: Callable[[], int] = lambda: poisson_random_variable(5),
-        client_demand_dist: Callable[[], int] = lambda: random.randint(1, 50),
+        client_arrival_dist: Callable[[], int] = default_client_arrival,
+        client_demand_dist: Callable[[], int] = default_client_demand,
         sim_duration: int = 840,  # 14 hours -> 14 * 60min = 840min
+        recording_level: str = "full",
+        scheduler: str = "heap",
+        accrue_holding: bool = False,
+        instrumentation: EngineInstrumentation | None = None,
+        demand_trace: "DemandTrace | None" = None,
+        trace_start: int = 0,
     ):
         if s >= S:
             raise Exception("Problem: s >= S and this should not happen")
+        if recording_level not in RECORDING_LEVELS:
+            raise Exception(f"Unknown recording level {recording_level}")
+        if scheduler not in SCHEDULERS:
+            raise Exception(f"Unknown scheduler {scheduler}")
         self.s: int = s
         """The minimum amount of units in inventory before ask for supply"""
         self.S: int = S
@@ -35,11 +99,22 @@ class InventorySimulation:
         self.holding_cost_rate: int = holding_cost_rate
         self.holding_pay_time: int = holding_pay_time
         """This is the time difference between payments for holding the inventory"""
+        self.accrue_holding: bool = accrue_holding
+        """If True the payments for holding inventory are settled when the next event arrives instead
+        of being events of the queue. The records and the balance are the same in both modes"""
         self.product_value: int = product_value
         # ------ Variables that represents the distributions
         self.client_arrival_dist: Callable[[], int] = client_arrival_dist
         self.client_demand_dist: Callable[[], int] = client_demand_dist
-        self.registry: Registry = Registry()
+        self.demand_trace: DemandTrace | None = demand_trace
+        """If given, the clients are replayed from the trace instead of being drawn from the distributions"""
+        self.trace_start: int = trace_start
+        """The time of the trace where the runs start, the time 0 of the simulation"""
+        self.trace_reader: TraceReader | None = None
+        """The reader of the trace of the actual run"""
+        self.recording_level: str = recording_level
+        """The kind of registry of the runs, one of the keys of RECORDING_LEVELS"""
+        self.registry: Registry = RECORDING_LEVELS[recording_level]()
         # ------ Now are the variables of the state of the simulation -------
         self.time: int = 0
         """This is the actual simulation time"""
@@ -52,27 +127,50 @@ class InventorySimulation:
         self.pending_order: bool = False
         self.sim_over: bool = False
         """Says if the simulation is over"""
+        self.next_holding_payment: int = holding_pay_time
+        """The time of the next payment for holding inventory that is not settled (accrue_holding mode)"""
+        self.instrumentation: EngineInstrumentation | None = instrumentation
+        """Opt-in measures of the runs. Without it the engine has no instrumentation overhead"""
+        self.event_handlers: dict[type, Callable[[Event], None]] = self.bind_event_handlers()
+        """The bound method that process each type of event, see event_handler_names"""
         # -------- Simulation queue --------
-        self.event_queue: list[Event] = []
+        self.scheduler: str = scheduler
+        """The kind of event queue of the runs, one of the keys of SCHEDULERS"""
+        self.event_queue: HeapEventQueue | SlotEventQueue = self.create_event_queue()
         """The priority queue of events"""
 
+    def has_default_clients(self) -> bool:
+        """True if the clients are drawn from the default distributions, the only ones the engines and
+        evaluators that do not call the distributions of the simulation (e.g. the batch engine) know"""
+        return (
+            self.client_arrival_dist is default_client_arrival
+            and self.client_demand_dist is default_client_demand
+            and self.demand_trace is None
+        )
+
     def initialize(self):
         """Initialize some events for the simulation"""
-        self.event_queue = []
-        heapq.heapify(self.event_queue)
+        self.event_queue = self.create_event_queue()
         self.time = 0
         self.actual_balance = 0
         self.actual_inventory_level = self.initial_inventory_level
         self.pending_order = False
-        self.registry = Registry()
+        self.registry = RECORDING_LEVELS[self.recording_level]()
         self.sim_over = False
+        self.next_holding_payment = self.holding_pay_time
+        if self.demand_trace is not None:
+            self.trace_reader = self.demand_trace.reader(self.trace_start)
         self.verify_supply_policy()
         self.generate_client_sell_event()
-        self.generate_pay_holding_event()
+        if not self.accrue_holding:
+            self.generate_pay_holding_event()
         self.add_simulation_end_event()
 
     def generate_client_sell_event(self):
         """Generate a new Sell Event and push it to the queue"""
+        if self.demand_trace is not None:
+            self.generate_trace_sell_event()
+            return
         time = 0
         while time == 0:
             time: int = self.client_arrival_dist()
@@ -80,6 +178,13 @@ class InventorySimulation:
         client_event: SellEvent = SellEvent(self.time + time, amount)
         self.add_to_event_queue(client_event)
 
+    def generate_trace_sell_event(self):
+        """Pushes the next client of the trace to the queue. Several clients of a trace can arrive at the
+        same time, and there are no more clients after the end of the trace"""
+        client = self.trace_reader.next_client()
+        if client is not None:
+            self.add_to_event_queue(SellEvent(client[0] - self.trace_start, client[1]))
+
     def verify_supply_policy(self):
         """This function verifies if it is time for ask more supplies"""
         if self.actual_inventory_level > self.s or self.pending_order:
@@ -102,14 +207,29 @@ class InventorySimulation:
         )
         self.add_to_event_queue(pay_hold_event)
 
+    def create_event_queue(self) -> HeapEventQueue | SlotEventQueue:
+        """Creates an empty event queue of the kind of the scheduler"""
+        queue = SCHEDULERS[self.scheduler]()
+        if self.instrumentation is not None:
+            return self.instrumentation.wrap_queue(queue)
+        return queue
+
     def add_to_event_queue(self, event: Event):
-        """Adds an event to the simulation queue"""
-        heapq.heappush(self.event_queue, event)
+        """Adds an event to the simulation queue. The heap of a HeapEventQueue is pushed here, without
+        the call to its method, the other queues are called"""
+        queue = self.event_queue
+        if type(queue) is HeapEventQueue:
+            heappush(queue.heap, (event.time, event.priority, queue.sequence, event))
+            queue.sequence += 1
+        else:
+            queue.push(event)
 
     def get_next_event_in_queue(self) -> Event:
         """Extracts the next event in the queue"""
-        event: Event = heapq.heappop(self.event_queue)
-        return event
+        queue = self.event_queue
+        if type(queue) is HeapEventQueue:
+            return heappop(queue.heap)[3]
+        return queue.pop()
 
     def process_sell_event(self, event: SellEvent):
         """Process the event of the arrival of a new client wanting to buy some units of the product"""
@@ -138,28 +258,71 @@ class InventorySimulation:
         self.registry.add_pay_holding_record(self.time, hold_cost)
         self.generate_pay_holding_event()
 
+    def settle_holding_payments(self, until: int):
+        """Makes the payments for holding inventory of every payment time before 'until'.
+        The inventory does not change between two events, so all of them cost the same. A payment at the
+        same time of other events is processed after them, like the PayHoldingEvent priority says"""
+        if self.next_holding_payment >= until:
+            return
+        payments = (until - 1 - self.next_holding_payment) // self.holding_pay_time + 1
+        inventory_level = self.actual_inventory_level
+        hold_cost: int = self.holding_cost_rate * inventory_level
+        for k in range(payments):
+            time = self.next_holding_payment + k * self.holding_pay_time
+            self.actual_balance += hold_cost
+            self.registry.add_pay_holding_record(time, hold_cost)
+            self.registry.add_balance_record(time, self.actual_balance)
+            self.registry.add_stock_record(time, inventory_level)
+        self.next_holding_payment += payments * self.holding_pay_time
+
     def process_simulation_end(self, event: SimulationEndEvent):
         """Stops the simulation by updating the variable self.sim_over"""
         self.sim_over = True
 
+    def process_client_event(self, event: SellEvent):
+        """Process the sell of a client and schedules the arrival of the next one"""
+        self.process_sell_event(event)
+        self.generate_client_sell_event()
+
+    event_handler_names: dict[type, str] = {
+        SellEvent: "process_client_event",
+        SupplyArrivalEvent: "process_supply_arrival_event",
+        PayHoldingEvent: "process_pay_holding_event",
+        SimulationEndEvent: "process_simulation_end",
+    }
+    """The name of the method that process each type of event. A subclass can add types of event or
+    override the methods, every simulation binds its own"""
+
+    def bind_event_handlers(self) -> dict[type, Callable[[Event], None]]:
+        """Returns the methods of this simulation that process each type of event"""
+        return {
+            event_type: getattr(self, name)
+            for event_type, name in self.event_handler_names.items()
+        }
+
+    def find_event_handler(self, event_type: type) -> Callable[[Event], None]:
+        """Returns the handler of the closest base class of an event type that has none of its own, and
+        keeps it for the next events of the type"""
+        for base in event_type.__mro__[1:]:
+            handler = self.event_handlers.get(base)
+            if handler is not None:
+                self.event_handlers[event_type] = handler
+                return handler
+        raise Exception("Unknown event type")
+
     def process_event(self, event: Event):
-        """Process an event depending of its type. Returns a bool that says if the simulation is over"""
-        if isinstance(event, SellEvent):
-            self.process_sell_event(event)
-            self.generate_client_sell_event()
-        elif isinstance(event, SupplyArrivalEvent):
-            self.process_supply_arrival_event(event)
-        elif isinstance(event, PayHoldingEvent):
-            self.process_pay_holding_event(event)
-        elif isinstance(event, SimulationEndEvent):
-            self.process_simulation_end(event)
-        else:
-            raise Exception("Unknown event type")
+        """Process an event with the handler of its type in event_handlers"""
+        handler = self.event_handlers.get(type(event))
+        if handler is None:
+            handler = self.find_event_handler(type(event))
+        handler(event)
 
     def step(self):
         """Extracts the next event in the Event Queue and process it"""
         event: Event = self.get_next_event_in_queue()
         time = event.time
+        if self.accrue_holding:
+            self.settle_holding_payments(time)
         self.time = time  # Advance the simulation time to the Event time
 
         self.process_event(event)
@@ -173,10 +336,100 @@ class InventorySimulation:
 
     def run(self):
         """Run the simulation"""
+        if self.instrumentation is not None:
+            self.instrumentation.run(self)
+            return
         self.initialize()
         while not self.sim_over:
             self.step()
 
+    def snapshot(self, include_registry: bool = False) -> SimulationSnapshot:
+        """Returns the state of the simulation. The registry is only copied if include_registry is True,
+        its copy grows with the run, so by default a run restored from the snapshot only has the records
+        made after the restore"""
+        distribution_states = {}
+        for name in ("client_arrival_dist", "client_demand_dist", "trace_reader"):
+            dist = getattr(self, name)
+            if hasattr(dist, "get_state"):
+                distribution_states[name] = dist.get_state()
+        return SimulationSnapshot(
+            time=self.time,
+            actual_balance=self.actual_balance,
+            actual_inventory_level=self.actual_inventory_level,
+            pending_order=self.pending_order,
+            sim_over=self.sim_over,
+            next_holding_payment=self.next_holding_payment,
+            event_queue=copy.deepcopy(unwrapped_queue(self.event_queue)),
+            registry=copy.deepcopy(self.registry) if include_registry else None,
+            random_state=random.getstate(),
+            numpy_state=np.random.get_state(legacy=False),
+            distribution_states=distribution_states,
+        )
+
+    def restore(self, snapshot: SimulationSnapshot):
+        """Puts the simulation in the state of the snapshot. The policy and the other parameters are not
+        part of the state, so they can be changed before resuming (e.g. to try another policy from day 30)
+        """
+        self.time = snapshot.time
+        self.actual_balance = snapshot.actual_balance
+        self.actual_inventory_level = snapshot.actual_inventory_level
+        self.pending_order = snapshot.pending_order
+        self.sim_over = snapshot.sim_over
+        self.next_holding_payment = snapshot.next_holding_payment
+        self.event_queue = copy.deepcopy(snapshot.event_queue)
+        self.registry = (
+            copy.deepcopy(snapshot.registry)
+            if snapshot.registry is not None
+            else RECORDING_LEVELS[self.recording_level]()
+        )
+        random.setstate(snapshot.random_state)
+        np.random.set_state(snapshot.numpy_state)
+        for name, state in snapshot.distribution_states.items():
+            getattr(self, name).set_state(state)
+
+    def clone(self, snapshot: SimulationSnapshot | None = None):
+        """Returns a new simulation with the parameters of this one in the state of the snapshot (the
+        actual state if none is given), with its own queue and registry. The distributions and the
+        global generators are shared with this simulation and the clone sets them to the state of the
+        snapshot, so a clone must run before the next one is made. A clone replaying a trace has its own
+        reader of the trace, and an instrumented clone has its own instrumentation with the same observers
+        """
+        if snapshot is None:
+            snapshot = self.snapshot()
+        other = copy.copy(self)
+        # The copied handlers are methods of this simulation
+        other.event_handlers = other.bind_event_handlers()
+        if self.instrumentation is not None:
+            other.instrumentation = EngineInstrumentation(list(self.instrumentation.observers))
+        # The clone reads the trace with its own reader, the mapping of the trace is shared
+        other.trace_reader = copy.deepcopy(self.trace_reader)
+        other.restore(snapshot)
+        return other
+
+    def run_continuations(
+        self, snapshot: SimulationSnapshot, policies: list[tuple[int, int]]
+    ) -> list["InventorySimulation"]:
+        """Runs a clone of the snapshot until the end with every (s, S) policy and returns the finished
+        clones. All of them start from the same state and draw the same clients, so the warm-up until
+        the snapshot is simulated once and the policies are compared with common random numbers"""
+        continuations = []
+        for s, S in policies:
+            if s >= S:
+                raise Exception("Problem: s >= S and this should not happen")
+            other = self.clone(snapshot)
+            other.s, other.S = s, S
+            other.resume()
+            continuations.append(other)
+        return continuations
+
+    def resume(self):
+        """Runs the simulation from its actual state until the end, without initializing it"""
+        if self.instrumentation is not None:
+            self.instrumentation.run(self, initialize=False)
+            return
+        while not self.sim_over:
+            self.step()
+
     def run_with(self, s: int, S: int):
         if S < s or s < 0:
             raise Exception("The values of policy (s,S) are invalid")
@@ -0,0 +1,112 @@
+# This file contains the surrogate model used by the Bayesian optimization of the policies: a Gaussian
+# process regression written with numpy, and the expected improvement acquisition function
+import math
+
+import numpy as np
+
+def erfc(x: np.ndarray) -> np.ndarray:
+    """The complementary error function of x >= 0, with the approximation 7.1.26 of Abramowitz and
+    Stegun. Its absolute error is below 1.5e-7 and it is a single numpy expression, scipy is not needed"""
+    t = 1 / (1 + 0.3275911 * x)
+    polynomial = t * (
+        0.254829592
+        + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429)))
+    )
+    return polynomial * np.exp(-(x**2))
+
+
+def normal_cdf(z: np.ndarray) -> np.ndarray:
+    # The tail is computed directly, so the cdf of very negative z is not lost in 1 - erf
+    tail = 0.5 * erfc(np.abs(z) / math.sqrt(2))
+    return np.where(z < 0, tail, 1 - tail)
+
+
+def normal_pdf(z: np.ndarray) -> np.ndarray:
+    return np.exp(-0.5 * z**2) / math.sqrt(2 * math.pi)
+
+
+def expected_improvement(
+    mean: np.ndarray, std: np.ndarray, best: float, exploration: float = 0.0
+) -> np.ndarray:
+    """The expected improvement over 'best' of every point when the fitness is minimized"""
+    improvement = best - mean - exploration
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(std > 0, improvement / std, 0.0)
+    return np.where(
+        std > 0,
+        improvement * normal_cdf(z) + std * normal_pdf(z),
+        np.maximum(improvement, 0.0),
+    )
+
+
+class GaussianProcess:
+    """Gaussian process regression with a squared exponential kernel with one length scale per input
+    dimension and a noise term. The inputs should be scaled to [0, 1] and the outputs are standardized.
+    The length scales and the noise are chosen from a small grid by the marginal likelihood"""
+
+    LENGTH_SCALES: tuple[float, ...] = (0.05, 0.1, 0.2, 0.4, 0.8)
+    NOISES: tuple[float, ...] = (1e-4, 1e-2, 1e-1, 0.3)
+
+    def __init__(self) -> None:
+        self.x: np.ndarray = np.zeros((0, 0))
+        self.length_scales: np.ndarray = np.ones(0)
+        self.noise: float = 1e-2
+        """The variance of the noise relative to the variance of the outputs"""
+        self.y_mean: float = 0.0
+        self.y_std: float = 1.0
+        self.cholesky: np.ndarray = np.zeros((0, 0))
+        self.alpha: np.ndarray = np.zeros(0)
+
+    def kernel(self, a: np.ndarray, b: np.ndarray, length_scales: np.ndarray) -> np.ndarray:
+        distances = ((a[:, None, :] - b[None, :, :]) / length_scales) ** 2
+        return np.exp(-0.5 * distances.sum(axis=2))
+
+    def fit(self, x: np.ndarray, y: np.ndarray, optimize: bool = True):
+        """Fits the process to the points. Without optimize the last length scales and noise are kept,
+        which is what the batch proposals need to add the fantasized points cheaply"""
+        self.x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        self.y_mean = float(y.mean())
+        self.y_std = float(y.std()) or 1.0
+        z = (y - self.y_mean) / self.y_std
+        if optimize or len(self.length_scales) != self.x.shape[1]:
+            best = -math.inf
+            for scales in np.array(
+                np.meshgrid(*[self.LENGTH_SCALES] * self.x.shape[1])
+            ).reshape(self.x.shape[1], -1).T:
+                for noise in self.NOISES:
+                    likelihood = self.log_marginal_likelihood(z, scales, noise)
+                    if likelihood > best:
+                        best, self.length_scales, self.noise = likelihood, scales, noise
+        self.cholesky, self.alpha = self.factorize(z, self.length_scales, self.noise)
+
+    def factorize(
+        self, z: np.ndarray, length_scales: np.ndarray, noise: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        covariance = self.kernel(self.x, self.x, length_scales) + (noise + 1e-8) * np.eye(
+            len(self.x)
+        )
+        cholesky = np.linalg.cholesky(covariance)
+        alpha = np.linalg.solve(cholesky.T, np.linalg.solve(cholesky, z))
+        return cholesky, alpha
+
+    def log_marginal_likelihood(
+        self, z: np.ndarray, length_scales: np.ndarray, noise: float
+    ) -> float:
+        try:
+            cholesky, alpha = self.factorize(z, length_scales, noise)
+        except np.linalg.LinAlgError:
+            return -math.inf
+        return float(
+            -0.5 * z @ alpha
+            - np.log(np.diag(cholesky)).sum()
+            - 0.5 * len(z) * math.log(2 * math.pi)
+        )
+
+    def predict(self, x: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the mean and the standard deviation of the process at the points"""
+        cross = self.kernel(np.asarray(x, dtype=np.float64), self.x, self.length_scales)
+        mean = cross @ self.alpha
+        v = np.linalg.solve(self.cholesky, cross.T)
+        variance = np.maximum(1 - (v**2).sum(axis=0), 0)
+        return mean * self.y_std + self.y_mean, np.sqrt(variance) * self.y_std
@@ -0,0 +1,5 @@
+# The modules of the simulation are imported by name from clean_code, like the notebook does
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
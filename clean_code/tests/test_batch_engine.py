@@ -0,0 +1,98 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from batch_engine import BatchInventorySimulation
+from sim_stats import SimStatistics
+from simulation_engine import InventorySimulation
+
+ARRIVALS = [3, 0, 7, 1, 12, 5, 5, 2, 9, 4]
+DEMANDS = [10, 40, 3, 25, 50, 1, 17, 33]
+
+
+class CyclicSampler:
+    """Gives every replication the same cycle of values, so all of them are the run of the scalar engine"""
+
+    def __init__(self, values: list[int], number_of_runs: int) -> None:
+        self.values: np.ndarray = np.array(values)
+        self.positions: np.ndarray = np.zeros(number_of_runs, dtype=np.int64)
+
+    def __call__(self, lanes: np.ndarray) -> np.ndarray:
+        values = self.values[self.positions[lanes] % len(self.values)]
+        self.positions[lanes] += 1
+        return values
+
+
+@pytest.mark.parametrize("policy", [(20, 100), (5, 8), (60, 61)])
+def test_same_clients_give_the_same_run(policy):
+    s, S = policy
+    simulation = InventorySimulation(
+        s=s,
+        S=S,
+        initial_inventory_level=30,
+        client_arrival_dist=itertools.cycle(ARRIVALS).__next__,
+        client_demand_dist=itertools.cycle(DEMANDS).__next__,
+        sim_duration=3000,
+    )
+    expected = SimStatistics(simulation).run_replication()
+    runs = 3
+    batch = BatchInventorySimulation(
+        s=s,
+        S=S,
+        initial_inventory_level=30,
+        client_arrival_sampler=CyclicSampler(ARRIVALS, runs),
+        client_demand_sampler=CyclicSampler(DEMANDS, runs),
+        sim_duration=3000,
+    )
+    batch.run(runs)
+    for lane in range(runs):
+        assert (batch.loss()[lane], batch.costs()[lane], batch.balance[lane]) == expected
+
+
+def test_default_distributions_give_the_same_means():
+    """The engines draw the clients from different generators, so only the means must agree"""
+    simulation = InventorySimulation(s=20, S=100, initial_inventory_level=100)
+    runs = 400
+    scalar = SimStatistics(simulation).calculate_streaming_statistics_results(runs, seed=0)
+    batch = BatchInventorySimulation.from_simulation(simulation, seed=0)
+    batched = batch.calculate_statistics_results(runs)
+    for name in ("loss", "costs", "final_balance"):
+        difference = getattr(scalar, f"{name}_expectation") - getattr(
+            batched, f"{name}_expectation"
+        )
+        error = np.sqrt(
+            (getattr(scalar, f"{name}_variance") + getattr(batched, f"{name}_variance"))
+            / runs
+        )
+        assert abs(difference) <= 4 * error
+
+
+def branching_cost(amount: int) -> float:
+    if amount > 20:
+        return 40 + 4 * amount
+    return 5 * amount
+
+
+@pytest.mark.parametrize(
+    "cost_function, array_cost",
+    [
+        (branching_cost, lambda x: np.where(x > 20, 40 + 4 * x, 5 * x)),
+        (lambda x: 100, lambda x: np.full(len(x), 100.0)),
+        (lambda x: min(x, 30) * 6, lambda x: np.minimum(x, 30) * 6),
+    ],
+)
+def test_scalar_ordering_costs_are_applied_to_every_order(cost_function, array_cost):
+    simulation = InventorySimulation(s=20, S=100, ordering_cost_function=cost_function)
+    batch = BatchInventorySimulation.from_simulation(simulation, seed=1)
+    batch.run(8)
+    expected = BatchInventorySimulation(s=20, S=100, ordering_cost_function=array_cost, seed=1)
+    expected.run(8)
+    np.testing.assert_array_equal(batch.supply_costs, expected.supply_costs)
+    assert np.all(batch.supply_costs > 0)
+
+
+def test_array_ordering_costs_are_used_as_they_are():
+    cost = lambda x: x * 7
+    simulation = InventorySimulation(ordering_cost_function=cost)
+    assert BatchInventorySimulation.from_simulation(simulation).ordering_cost_func is cost
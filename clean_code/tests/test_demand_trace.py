@@ -0,0 +1,105 @@
+import copy
+
+import numpy as np
+import pytest
+
+from demand_trace import DemandTrace, DemandTraceWriter, import_csv, write_demand_trace
+from parallel import replication_seed, seed_generators
+from simulation_engine import InventorySimulation, default_client_arrival, default_client_demand
+
+TIMES = np.array([0, 3, 3, 8, 15, 15, 15, 22, 40, 41, 57])
+QUANTITIES = np.arange(1, len(TIMES) + 1)
+
+
+def read_all(reader) -> list[tuple[int, int]]:
+    clients = []
+    while (client := reader.next_client()) is not None:
+        clients.append(client)
+    return clients
+
+
+def test_written_and_imported_traces_are_the_clients(tmp_path):
+    trace = write_demand_trace(str(tmp_path / "written"), TIMES, QUANTITIES)
+    assert len(trace) == len(TIMES)
+    np.testing.assert_array_equal(trace.times, TIMES)
+    np.testing.assert_array_equal(trace.quantities, QUANTITIES)
+
+    csv_path = tmp_path / "sales.csv"
+    rows = [f"{q},store 1,{t}" for t, q in zip(TIMES, QUANTITIES)]
+    csv_path.write_text("\n".join(["units,store,minute"] + rows) + "\n")
+    imported = import_csv(
+        str(csv_path), str(tmp_path / "imported"), "minute", "units", chunk_size=3
+    )
+    np.testing.assert_array_equal(imported.times, TIMES)
+    np.testing.assert_array_equal(imported.quantities, QUANTITIES)
+
+
+def test_unsorted_clients_are_rejected(tmp_path):
+    with DemandTraceWriter(str(tmp_path)) as writer:
+        writer.append(TIMES[:5], QUANTITIES[:5])
+        with pytest.raises(Exception):
+            writer.append(TIMES[:2], QUANTITIES[:2])
+        with pytest.raises(Exception):
+            writer.append([30, 20], [1, 1])
+    assert len(DemandTrace(str(tmp_path))) == 5
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 4, 100])
+def test_readers_give_the_clients_with_any_chunk_size(tmp_path, chunk_size):
+    trace = write_demand_trace(str(tmp_path), TIMES, QUANTITIES)
+    expected = list(zip(TIMES.tolist(), QUANTITIES.tolist()))
+    assert read_all(trace.reader(chunk_size=chunk_size)) == expected
+    assert read_all(trace.reader(15, chunk_size)) == expected[4:]
+
+    reader = trace.reader(chunk_size=chunk_size)
+    for _ in range(5):
+        reader.next_client()
+    state = reader.get_state()
+    copied = copy.deepcopy(reader)
+    assert read_all(reader) == expected[5:]
+    assert read_all(copied) == expected[5:]
+    reader.set_state(state)
+    assert read_all(reader) == expected[5:]
+    reader.set_state(1)
+    assert read_all(reader) == expected[1:]
+
+
+def test_runs_start_at_the_trace_start(tmp_path):
+    trace = write_demand_trace(str(tmp_path), TIMES, QUANTITIES)
+    simulation = InventorySimulation(
+        s=5, S=30, sim_duration=20, demand_trace=trace, trace_start=15, recording_level="columnar"
+    )
+    simulation.run()
+    times, asked, _ = simulation.registry.sells()
+    np.testing.assert_array_equal(times, [0, 0, 0, 7])
+    np.testing.assert_array_equal(asked, QUANTITIES[4:8])
+
+    assert trace.windows(20) == [0, 20]
+    assert trace.windows(20, start_time=15) == [15, 35]
+    assert trace.windows(58) == [0]
+    assert trace.windows(59) == []
+
+
+def test_a_trace_of_the_drawn_clients_replays_the_run(tmp_path):
+    parameters = dict(s=20, S=100, initial_inventory_level=50, sim_duration=3000)
+    seed_generators(replication_seed(0, 0))
+    synthetic = InventorySimulation(**parameters, recording_level="columnar")
+    synthetic.run()
+
+    # The run draws the delay and the units of every client in this order, and nothing else
+    seed_generators(replication_seed(0, 0))
+    times, quantities, time = [], [], 0
+    while time <= parameters["sim_duration"]:
+        delay = 0
+        while delay == 0:
+            delay = default_client_arrival()
+        time += delay
+        times.append(time)
+        quantities.append(default_client_demand())
+    trace = write_demand_trace(str(tmp_path), times, quantities)
+
+    replayed = InventorySimulation(**parameters, demand_trace=trace, recording_level="columnar")
+    replayed.run()
+    assert replayed.actual_balance == synthetic.actual_balance
+    for expected, column in zip(synthetic.registry.sells(), replayed.registry.sells()):
+        np.testing.assert_array_equal(column, expected)
@@ -0,0 +1,78 @@
+import random
+import threading
+
+import pytest
+
+from distributed import DistributedBackend, run_batch, start_local_workers
+from sim_stats import SimStatistics
+from simulation_engine import InventorySimulation
+
+POLICIES = [(20, 100), (10, 40)]
+RUNS = 9
+
+
+def results_tuple(results) -> tuple:
+    return (
+        results.loss_expectation,
+        results.costs_expectation,
+        results.final_balance_expectation,
+        results.loss_variance,
+        results.costs_variance,
+        results.final_balance_variance,
+        results.number_of_runs,
+    )
+
+
+def shuffled_worker(backend: DistributedBackend, count: int, order_seed: int):
+    """Takes 'count' batches and answers them in a random order, some of them twice as if they
+    were sent again"""
+    batches = [backend.batches.get() for _ in range(count)]
+    order = random.Random(order_seed)
+    order.shuffle(batches)
+    answers = batches + order.sample(batches, count // 2)
+    for key, parameters, s, S, seed, replications in answers:
+        backend.results.put((key, None))
+        backend.results.put((key, run_batch(parameters, s, S, seed, replications)))
+
+
+def evaluate_in_order(order_seed: int) -> list[tuple]:
+    backend = DistributedBackend(batch_size=2, timeout=10)
+    simulation = InventorySimulation(sim_duration=2000)
+    count = len(POLICIES) * -(-RUNS // backend.batch_size)
+    worker = threading.Thread(target=shuffled_worker, args=(backend, count, order_seed))
+    worker.start()
+    results = backend.evaluate_simulation(simulation, POLICIES, RUNS, seed=3)
+    worker.join()
+    return [results_tuple(res) for res in results]
+
+
+def test_results_do_not_depend_on_the_arrival_order():
+    expected = evaluate_in_order(0)
+    for order_seed in (1, 2, 3):
+        assert evaluate_in_order(order_seed) == expected
+    for (s, S), results in zip(POLICIES, expected):
+        streaming = SimStatistics(InventorySimulation(s=s, S=S, sim_duration=2000))
+        local = streaming.calculate_streaming_statistics_results(RUNS, seed=3)
+        assert results == pytest.approx(results_tuple(local))
+
+
+# The coordinator serves the queues from a thread, the forked workers never use it
+@pytest.mark.filterwarnings("ignore:This process .* is multi-threaded")
+def test_local_workers_give_the_same_results():
+    backend = DistributedBackend(batch_size=2, timeout=30)
+    backend.start()
+    start_local_workers(backend.address, backend.authkey, 2)
+    try:
+        results = backend.evaluate_simulation(
+            InventorySimulation(sim_duration=2000), POLICIES, RUNS, seed=3
+        )
+    finally:
+        backend.stop_workers(2)
+    assert [results_tuple(res) for res in results] == evaluate_in_order(0)
+
+
+def test_unknown_distributions_can_not_be_sent():
+    backend = DistributedBackend()
+    simulation = InventorySimulation(client_demand_dist=lambda: 3)
+    with pytest.raises(Exception):
+        backend.evaluate_simulation(simulation, POLICIES, RUNS)
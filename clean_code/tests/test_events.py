@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from events import HeapEventQueue, PayHoldingEvent, SellEvent, SlotEventQueue
+from parallel import replication_seed, seed_generators
+from simulation_engine import InventorySimulation
+
+COLUMNS = ("sells", "stock", "buys", "balance", "pay_holding")
+
+
+def recorded_run(policy: tuple[int, int], seed: int, **kwargs) -> dict[str, list[np.ndarray]]:
+    """The columns of the records and the final balance of a run with a fixed seed"""
+    s, S = policy
+    simulation = InventorySimulation(
+        s=s,
+        S=S,
+        initial_inventory_level=50,
+        recording_level="columnar",
+        sim_duration=5000,
+        **kwargs,
+    )
+    seed_generators(replication_seed(seed, 0))
+    simulation.run()
+    columns = {
+        name: [np.array(column) for column in getattr(simulation.registry, name)()]
+        for name in COLUMNS
+    }
+    columns["final_balance"] = [np.array(simulation.actual_balance)]
+    return columns
+
+
+@pytest.mark.parametrize("policy", [(20, 100), (5, 8), (0, 300)])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_slot_scheduler_gives_the_heap_run(policy, seed):
+    heap = recorded_run(policy, seed, scheduler="heap")
+    slots = recorded_run(policy, seed, scheduler="slots")
+    for name, columns in heap.items():
+        for expected, column in zip(columns, slots[name]):
+            np.testing.assert_array_equal(column, expected, err_msg=name)
+
+
+def test_simultaneous_events_follow_the_priorities():
+    for queue in (HeapEventQueue(), SlotEventQueue()):
+        queue.push(PayHoldingEvent(60))
+        queue.push(SellEvent(60, 3))
+        popped = [queue.pop() for _ in range(len(queue))]
+        assert [type(event) for event in popped] == [SellEvent, PayHoldingEvent]
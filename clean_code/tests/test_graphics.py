@@ -0,0 +1,41 @@
+import numpy as np
+
+from graphics import ReplicationsGraphics, values_on_grid
+
+DURATION = 840
+
+
+def random_runs(runs: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Records of random walks at random times, some runs start after the first time of the grid"""
+    rng = np.random.default_rng(seed)
+    times, values, offsets = [], [], [0]
+    for _ in range(runs):
+        records = int(rng.integers(1, 200))
+        times.append(np.sort(rng.choice(DURATION, records, replace=False)))
+        values.append(np.cumsum(rng.normal(0, 10, records)))
+        offsets.append(offsets[-1] + records)
+    return np.concatenate(times), np.concatenate(values), np.array(offsets)
+
+
+def test_chunked_bands_match_the_exact_bands():
+    columns = random_runs(600)
+    exact = ReplicationsGraphics(columns, columns, DURATION, chunk_runs=600)
+    chunked = ReplicationsGraphics(columns, columns, DURATION, chunk_runs=64, bins=512)
+    mean, low, high = exact.bands(columns, np.nan)
+    chunked_mean, chunked_low, chunked_high = chunked.bands(columns, np.nan)
+    np.testing.assert_allclose(chunked_mean, mean, rtol=1e-9, atol=1e-9)
+
+    values = values_on_grid(*columns, exact.grid)
+    width = (np.nanmax(values, axis=0) - np.nanmin(values, axis=0)) / 512
+    assert np.all(np.isnan(low) == np.isnan(chunked_low))
+    known = ~np.isnan(low)
+    assert np.all(np.abs(chunked_low - low)[known] <= width[known])
+    assert np.all(np.abs(chunked_high - high)[known] <= width[known])
+
+
+def test_constant_values_give_exact_bands():
+    times = np.zeros(300, dtype=np.int64)
+    columns = times, np.full(300, 7.0), np.arange(301)
+    graphics = ReplicationsGraphics(columns, columns, DURATION, chunk_runs=50)
+    for band in graphics.bands(columns, 7.0):
+        np.testing.assert_array_equal(band, 7.0)
@@ -0,0 +1,92 @@
+from collections import Counter
+
+from events import Event, SellEvent
+from instrumentation import EngineInstrumentation, EngineObserver, InstrumentedEventQueue
+from parallel import replication_seed, seed_generators
+from simulation_engine import InventorySimulation
+
+
+class CountingObserver(EngineObserver):
+    def __init__(self) -> None:
+        self.starts: int = 0
+        self.ends: int = 0
+        self.events: Counter = Counter()
+        self.elapsed: list[float] = []
+
+    def on_run_start(self, simulation):
+        self.starts += 1
+
+    def on_event(self, simulation, event: Event, elapsed: float):
+        self.events[type(event).__name__] += 1
+        self.elapsed.append(elapsed)
+
+    def on_run_end(self, simulation, report):
+        self.ends += 1
+
+
+class CountingSimulation(InventorySimulation):
+    """Counts the events it processes, whatever measures them"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.processed: Counter = Counter()
+
+    def process_event(self, event: Event):
+        self.processed[type(event).__name__] += 1
+        super().process_event(event)
+
+
+def new_simulation(observer: EngineObserver) -> CountingSimulation:
+    return CountingSimulation(
+        s=20,
+        S=100,
+        sim_duration=3000,
+        recording_level="columnar",
+        instrumentation=EngineInstrumentation([observer]),
+    )
+
+
+def check_report(simulation: CountingSimulation, observer: CountingObserver, queued: int = 0):
+    """Checks the report of the last run, that started with 'queued' events in the queue"""
+    report = simulation.instrumentation.report
+    assert report.event_counts == dict(simulation.processed)
+    assert observer.events == simulation.processed
+    assert len(observer.elapsed) == report.total_events() == report.queue_pops
+    assert queued + report.queue_pushes == report.queue_pops + len(simulation.event_queue)
+    assert (observer.starts, observer.ends) == (1, 1)
+    assert all(seconds >= 0 for seconds in report.handler_time.values())
+    assert report.client_generation_time > 0
+    assert report.wall_time >= sum(report.handler_time.values())
+
+
+def test_the_report_counts_every_event_and_queue_operation():
+    observer = CountingObserver()
+    simulation = new_simulation(observer)
+    seed_generators(replication_seed(0, 0))
+    simulation.run()
+    check_report(simulation, observer)
+    report = simulation.instrumentation.report
+    assert report.event_counts["SellEvent"] == simulation.registry.record_counts()["sell"]
+    assert report.event_counts["SimulationEndEvent"] == 1
+    assert report.record_counts == simulation.registry.record_counts()
+    # The methods of the simulation are back after the run
+    assert "generate_client_sell_event" not in vars(simulation)
+    assert simulation.event_handlers[SellEvent].__self__ is simulation
+
+
+def test_resumed_runs_are_measured():
+    simulation = new_simulation(CountingObserver())
+    seed_generators(replication_seed(0, 0))
+    simulation.initialize()
+    while simulation.time < 1000:
+        simulation.step()
+    snapshot = simulation.snapshot()
+    assert not isinstance(snapshot.event_queue, InstrumentedEventQueue)
+
+    clone = simulation.clone(snapshot)
+    observer = CountingObserver()
+    clone.instrumentation.observers = [observer]
+    clone.processed = Counter()
+    clone.resume()
+    check_report(clone, observer, len(snapshot.event_queue))
+    assert clone.sim_over and len(clone.instrumentation.reports) == 1
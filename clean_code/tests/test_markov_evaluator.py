@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from batch_engine import BatchInventorySimulation
+from markov_evaluator import MarkovPolicyEvaluator
+from simulation_engine import InventorySimulation
+from variates import InverseTransformStream
+
+DURATION = 50_000
+RUNS = 16
+
+
+@pytest.mark.parametrize("policy", [(20, 60), (30, 45), (5, 8)])
+def test_rates_match_simulated_means(policy):
+    """The long-run rates are the means per minute of long runs, up to the noise of the runs"""
+    s, S = policy
+    simulation = InventorySimulation(s=s, S=S, sim_duration=DURATION)
+    evaluation = MarkovPolicyEvaluator.from_simulation(simulation).evaluate(s, S)
+    batch = BatchInventorySimulation.from_simulation(simulation, seed=0)
+    batch.run(RUNS)
+    for simulated, rate in (
+        (batch.loss(), evaluation.loss_rate),
+        (batch.supply_costs, evaluation.ordering_cost_rate),
+        (batch.holding_costs, evaluation.holding_cost_rate),
+        (batch.balance, evaluation.balance_rate()),
+    ):
+        per_minute = simulated / DURATION
+        error = per_minute.std(ddof=1) / np.sqrt(RUNS)
+        assert abs(per_minute.mean() - rate) <= max(4 * error, 0.01 * abs(rate))
+
+
+def test_inverse_transform_distributions_are_used():
+    simulation = InventorySimulation(
+        client_arrival_dist=InverseTransformStream.poisson(3),
+        client_demand_dist=InverseTransformStream.uniform_int(1, 20),
+    )
+    evaluator = MarkovPolicyEvaluator.from_simulation(simulation)
+    assert evaluator.arrival_times @ evaluator.arrival_probabilities == pytest.approx(
+        3 / (1 - np.exp(-3))
+    )
+    assert evaluator.demands.max() == 20
+
+
+def test_unknown_distributions_raise():
+    simulation = InventorySimulation(client_demand_dist=lambda: 3)
+    with pytest.raises(Exception):
+        MarkovPolicyEvaluator.from_simulation(simulation)
+
+
+def test_unconverged_chains_raise_and_are_not_kept():
+    evaluator = MarkovPolicyEvaluator.from_simulation(InventorySimulation(), max_iterations=2)
+    with pytest.raises(Exception, match="did not converge"):
+        evaluator.evaluate(20, 60)
+    assert 20 not in evaluator.distributions
+    evaluator.max_iterations = 100_000
+    converged = evaluator.evaluate(20, 60)
+    assert 20 in evaluator.distributions
+    expected = MarkovPolicyEvaluator.from_simulation(InventorySimulation()).evaluate(20, 60)
+    assert converged.loss_rate == pytest.approx(expected.loss_rate, rel=1e-6)
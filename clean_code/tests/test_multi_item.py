@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from batch_engine import BatchInventorySimulation
+from multi_item import MultiItemSimulation
+
+ITEMS = {
+    "s": np.array([10, 20, 5]),
+    "S": np.array([40, 100, 30]),
+    "initial_inventory_level": np.array([0, 50, 10]),
+    "lead_time": np.array([10, 3, 20]),
+    "holding_cost_rate": np.array([3.0, 1.5, 2.0]),
+    "holding_pay_time": np.array([60, 30, 45]),
+    "product_value": np.array([10.0, 7.0, 25.0]),
+    "arrival_mean": np.array([5.0, 2.0, 9.0]),
+    "demand_low": np.array([1, 3, 1]),
+    "demand_high": np.array([50, 8, 4]),
+}
+REPLICATIONS = 6
+
+
+def test_a_single_item_is_a_batch_run():
+    multi = MultiItemSimulation(s=10, S=40, seed=7).run_items(REPLICATIONS)
+    batch = BatchInventorySimulation(s=10, S=40, seed=7)
+    batch.run(REPLICATIONS)
+    np.testing.assert_array_equal(multi.final_balance[0], batch.balance)
+    np.testing.assert_array_equal(multi.loss[0], batch.loss())
+    np.testing.assert_array_equal(multi.costs[0], batch.costs())
+    np.testing.assert_array_equal(multi.demand[0], batch.total_demand)
+
+
+def test_every_item_is_a_batch_run_of_its_parameters():
+    """The items share the generator, so they are the lanes of a batch run with the parameters of
+    each item repeated for its replications"""
+    multi = MultiItemSimulation(**ITEMS, seed=3).run_items(REPLICATIONS)
+    lanes = {name: np.repeat(value, REPLICATIONS) for name, value in ITEMS.items()}
+    arrival_mean = lanes.pop("arrival_mean")
+    low, high = lanes.pop("demand_low"), lanes.pop("demand_high")
+    batch = BatchInventorySimulation(
+        **lanes,
+        seed=3,
+        client_arrival_sampler=lambda ids: batch.rng.poisson(arrival_mean[ids]),
+        client_demand_sampler=lambda ids: batch.rng.integers(low[ids], high[ids] + 1),
+    )
+    batch.run(len(ITEMS["s"]) * REPLICATIONS)
+    shape = multi.final_balance.shape
+    assert shape == (len(ITEMS["s"]), REPLICATIONS)
+    np.testing.assert_array_equal(multi.final_balance, batch.balance.reshape(shape))
+    np.testing.assert_array_equal(multi.loss, batch.loss().reshape(shape))
+    np.testing.assert_array_equal(multi.costs, batch.costs().reshape(shape))
+    np.testing.assert_array_equal(multi.sold, batch.total_sold.reshape(shape))
+    assert np.all(multi.demand >= multi.sold)
+
+
+def test_for_stores_tiles_the_skus_of_every_store():
+    simulation = MultiItemSimulation.for_stores(
+        3, s=np.array([5, 10]), S=np.array([20, 40]), lead_time=np.array([[1, 2], [3, 4], [5, 6]])
+    )
+    assert simulation.items == 6
+    np.testing.assert_array_equal(simulation.store, [0, 0, 1, 1, 2, 2])
+    np.testing.assert_array_equal(simulation.sku, [0, 1, 0, 1, 0, 1])
+    np.testing.assert_array_equal(simulation.item_parameters["s"], [5, 10, 5, 10, 5, 10])
+    np.testing.assert_array_equal(simulation.item_parameters["lead_time"], [1, 2, 3, 4, 5, 6])
+    results = simulation.run_items(2)
+    np.testing.assert_array_equal(results.store, simulation.store)
+
+
+@pytest.mark.parametrize("stores", [1, 2])
+def test_for_stores_with_single_values_has_one_sku(stores):
+    simulation = MultiItemSimulation.for_stores(stores, s=5, S=20)
+    assert simulation.items == stores
+    np.testing.assert_array_equal(simulation.sku, np.zeros(stores))
+    np.testing.assert_array_equal(simulation.store, np.arange(stores))
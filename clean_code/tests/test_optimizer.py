@@ -0,0 +1,118 @@
+import math
+
+import numpy as np
+
+from demand_trace import write_demand_trace
+from optimizer import OptimizeSimulation
+from simulation_engine import InventorySimulation, default_client_demand
+from surrogate import expected_improvement, normal_cdf
+from variates import InverseTransformStream
+
+
+def test_normal_cdf_matches_math_erfc():
+    z = np.linspace(-12, 12, 4801)
+    expected = np.array([0.5 * math.erfc(-value / math.sqrt(2)) for value in z])
+    np.testing.assert_allclose(normal_cdf(z), expected, rtol=0, atol=1.5e-7)
+    assert np.all(np.diff(normal_cdf(z)) >= 0)
+
+
+def test_expected_improvement_without_uncertainty_is_the_improvement():
+    mean = np.array([1.0, 3.0, 2.0])
+    improvement = expected_improvement(mean, np.zeros(3), best=2.0)
+    np.testing.assert_array_equal(improvement, [1.0, 0.0, 0.0])
+    assert np.all(expected_improvement(mean, np.ones(3), best=2.0) > improvement)
+
+
+def test_unseeded_workers_draw_different_clients():
+    """Every pool is forked with the numpy generator of this process, the tasks must still be
+    independent"""
+    simulation = InventorySimulation(
+        client_demand_dist=InverseTransformStream.uniform_int(1, 50)
+    )
+    optimizer = OptimizeSimulation(simulation, (10, 20), 4, 30)
+    results = [optimizer.evaluate_policies([(10, 20)], workers=2)[0] for _ in range(3)]
+    assert len({res.final_balance_expectation for res in results}) == 3
+
+
+def test_every_mode_does_the_runs_of_the_optimizer():
+    for options in ({}, {"streaming": True}, {"shared_streams": True}):
+        optimizer = OptimizeSimulation(
+            InventorySimulation(sim_duration=500), (10, 20), 7, 30, seed=0, **options
+        )
+        assert optimizer.evaluate_policy(10, 20).number_of_runs == 7
+        assert optimizer.evaluate_policies([(5, 25)], workers=2)[0].number_of_runs == 7
+        optimizer.runs = 9
+        assert optimizer.evaluate_policy(10, 20).number_of_runs == 9
+        assert optimizer.simulated_runs == 23
+
+
+def seeded_optimizer(simulation: InventorySimulation, **kwargs) -> OptimizeSimulation:
+    return OptimizeSimulation(simulation, (10, 20), 5, 40, seed=0, **kwargs)
+
+
+def test_evaluations_with_a_seed_are_cached():
+    optimizer = seeded_optimizer(InventorySimulation(sim_duration=500))
+    first = optimizer.evaluate_policy(10, 20)
+    assert optimizer.evaluate_policy(10, 20) is first
+    assert optimizer.simulated_runs == 5
+    assert (optimizer.cache.hits, optimizer.cache.misses) == (1, 1)
+    loss = optimizer.fitness_function(10, 20, lambda res: res.loss_expectation)
+    assert loss == first.loss_expectation
+    assert optimizer.simulated_runs == 5
+
+
+def test_the_least_recently_used_evaluation_is_evicted():
+    optimizer = seeded_optimizer(InventorySimulation(sim_duration=200), cache_size=2)
+    optimizer.evaluate_policy(10, 20)
+    optimizer.evaluate_policy(11, 20)
+    optimizer.evaluate_policy(10, 20)
+    optimizer.evaluate_policy(12, 20)
+    assert len(optimizer.cache) == 2
+    assert optimizer.simulated_runs == 15
+    optimizer.evaluate_policy(10, 20)
+    assert optimizer.simulated_runs == 15
+    optimizer.evaluate_policy(11, 20)
+    assert optimizer.simulated_runs == 20
+
+
+def test_changing_the_model_misses_the_cache(tmp_path):
+    simulation = InventorySimulation(sim_duration=500)
+    optimizer = seeded_optimizer(simulation)
+    optimizer.evaluate_policy(10, 20)
+    simulation.lead_time = 20
+    optimizer.evaluate_policy(10, 20)
+    assert optimizer.simulated_runs == 10
+
+    times = np.arange(0, 3000, 7)
+    quantities = np.arange(len(times)) % 9 + 1
+    simulation.demand_trace = write_demand_trace(str(tmp_path / "a"), times, quantities)
+    from_start = optimizer.evaluate_policy(10, 20)
+    simulation.trace_start = 1000
+    later = optimizer.evaluate_policy(10, 20)
+    simulation.demand_trace = write_demand_trace(str(tmp_path / "b"), times, 10 - quantities)
+    other_trace = optimizer.evaluate_policy(10, 20)
+    assert optimizer.simulated_runs == 25
+    assert later.loss_expectation != from_start.loss_expectation
+    assert other_trace.loss_expectation != later.loss_expectation
+
+
+class RecordingDemand:
+    """The default demand distribution that keeps every amount it draws"""
+
+    def __init__(self) -> None:
+        self.draws: list[int] = []
+
+    def __call__(self) -> int:
+        self.draws.append(default_client_demand())
+        return self.draws[-1]
+
+
+def test_neighbors_see_the_same_clients_with_a_seed():
+    demand = RecordingDemand()
+    optimizer = seeded_optimizer(InventorySimulation(client_demand_dist=demand))
+    draws = []
+    for s, S in [(10, 20), (11, 20), (10, 21)]:
+        demand.draws = []
+        optimizer.evaluate_policy(s, S)
+        draws.append(demand.draws)
+    assert draws[0] and draws[0] == draws[1] == draws[2]
@@ -0,0 +1,42 @@
+import random
+
+import numpy as np
+import pytest
+
+from parallel import map_in_pool, worker_payload
+from sim_stats import SimStatistics
+from simulation_engine import InventorySimulation
+
+RUNS = 12
+
+
+def results_tuple(results) -> tuple:
+    return (
+        results.loss_expectation,
+        results.costs_expectation,
+        results.final_balance_expectation,
+        results.loss_variance,
+        results.costs_variance,
+        results.final_balance_variance,
+    )
+
+
+@pytest.mark.parametrize("workers", [1, 2, 3])
+def test_results_do_not_depend_on_the_workers(workers):
+    stats = SimStatistics(InventorySimulation(s=20, S=100, initial_inventory_level=100))
+    expected = stats.calculate_statistics_results(RUNS, seed=7)
+    parallel = stats.calculate_parallel_statistics_results(RUNS, seed=7, workers=workers)
+    assert results_tuple(parallel) == results_tuple(expected)
+
+
+def test_running_in_this_process_keeps_the_state_of_the_caller():
+    stats = SimStatistics(InventorySimulation(s=20, S=100, initial_inventory_level=100))
+    random.seed(1)
+    np.random.seed(1)
+    expected = random.random(), np.random.random()
+    random.seed(1)
+    np.random.seed(1)
+    map_in_pool("caller", len, ["a"], workers=1)
+    stats.calculate_parallel_statistics_results(RUNS, seed=7, workers=1)
+    assert (random.random(), np.random.random()) == expected
+    assert worker_payload() is None
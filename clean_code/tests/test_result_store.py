@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from parallel import replication_seed
+from result_store import COLUMNS, ColumnWriter, StoredExperiment, record_experiment
+from sim_stats import SimStatistics
+from simulation_engine import InventorySimulation
+
+RUNS = 5
+SEED = 4
+
+
+def new_simulation() -> InventorySimulation:
+    return InventorySimulation(
+        s=20, S=100, initial_inventory_level=30, sim_duration=2000, recording_level="columnar"
+    )
+
+
+def in_memory_runs() -> tuple[list[InventorySimulation], list[tuple[float, float, float]]]:
+    """The runs of record_experiment done again, with the registry of every run kept in memory"""
+    simulations, measures = [], []
+    for i in range(RUNS):
+        simulation = new_simulation()
+        measures.append(SimStatistics(simulation).run_replication(replication_seed(SEED, i)))
+        simulations.append(simulation)
+    return simulations, measures
+
+
+def test_stored_runs_are_the_runs_in_memory(tmp_path):
+    statistics = record_experiment(str(tmp_path), new_simulation(), RUNS, seed=SEED)
+    experiment = StoredExperiment(str(tmp_path))
+    simulations, measures = in_memory_runs()
+    assert len(experiment) == RUNS
+
+    for group, names in COLUMNS.items():
+        lengths = [len(getattr(sim.registry, f"{group}_time")) for sim in simulations]
+        np.testing.assert_array_equal(experiment.offsets[group], np.cumsum([0] + lengths))
+        for name in names:
+            expected = np.concatenate(
+                [getattr(sim.registry, name).to_numpy() for sim in simulations]
+            )
+            np.testing.assert_array_equal(experiment.columns[name], expected, err_msg=name)
+
+    for i, simulation in enumerate(simulations):
+        run = experiment.run(i)
+        for group in ("sells", "stock", "buys", "balance", "pay_holding"):
+            stored_columns = getattr(run.registry, group)()
+            for stored, column in zip(stored_columns, getattr(simulation.registry, group)()):
+                np.testing.assert_array_equal(stored, column, err_msg=group)
+        assert run.actual_balance == simulation.actual_balance
+        assert SimStatistics(run).measure_run() == pytest.approx(measures[i])
+    with pytest.raises(IndexError):
+        experiment.run(RUNS)
+
+    for column, expected in zip(experiment.run_measures(), zip(*measures)):
+        np.testing.assert_allclose(column, expected)
+    assert vars(experiment.statistics()) == pytest.approx(vars(statistics))
+    assert vars(statistics) == pytest.approx(vars(SimStatistics.results_from_runs(measures)))
+    experiment.stored_statistics = None
+    assert vars(experiment.statistics()) == pytest.approx(vars(statistics))
+
+
+@pytest.mark.parametrize("chunks", [[], [[1.5, 2.5], [], [3.5]]])
+def test_a_closed_column_is_a_npy_file(tmp_path, chunks):
+    path = str(tmp_path / "column.npy")
+    writer = ColumnWriter(path, np.dtype(np.float64))
+    for chunk in chunks:
+        writer.append(np.array(chunk))
+    writer.close()
+    column = np.load(path)
+    assert column.dtype == np.float64
+    np.testing.assert_array_equal(column, np.concatenate([[]] + chunks))
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from model_parameters import simulation_parameters
+from service import EvaluationService, request_evaluation
+from sim_stats import SimStatistics
+from simulation_engine import InventorySimulation
+
+QUERY = {"id": 1, "parameters": {"lead_time": 5}, "policies": [[20, 100]], "runs": 20, "seed": 3}
+
+
+class CountingService(EvaluationService):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.simulations: int = 0
+
+    async def simulate(self, *args):
+        self.simulations += 1
+        return await super().simulate(*args)
+
+
+def with_service(queries, workers: int = 2) -> tuple[CountingService, list]:
+    """Starts a service on a free port of localhost, awaits queries(port) and closes the service"""
+
+    async def main():
+        service = CountingService(workers, chunk_size=5)
+        await service.start(port=0)
+        try:
+            return service, await queries(service.port)
+        finally:
+            await service.close()
+
+    return asyncio.run(main())
+
+
+async def replies(request: dict, port: int) -> list[dict]:
+    return [message async for message in request_evaluation(request, port=port)]
+
+
+def test_the_replies_are_the_progress_the_result_and_done():
+    _, messages = with_service(lambda port: replies(QUERY, port))
+    types = [message["type"] for message in messages]
+    assert types[-2:] == ["result", "done"]
+    assert types[:-2] and set(types[:-2]) == {"progress"}
+    assert all(message["id"] == 1 for message in messages)
+    runs = [message["runs"] for message in messages[:-2]]
+    assert runs == sorted(runs) and runs[-1] < 20
+
+    expected = SimStatistics(InventorySimulation(s=20, S=100, lead_time=5))
+    expected = expected.calculate_statistics_results(20, seed=3)
+    result = messages[-2]
+    assert result["policy"] == [20, 100] and not result["cached"]
+    assert result["statistics"] == pytest.approx(vars(expected))
+
+
+def test_repeated_and_concurrent_queries_are_simulated_once():
+    async def queries(port: int):
+        concurrent = await asyncio.gather(replies(QUERY, port), replies(QUERY, port))
+        return concurrent, await replies(QUERY, port)
+
+    service, (concurrent, repeated) = with_service(queries)
+    assert service.simulations == 1
+    results = [messages[-2] for messages in (*concurrent, repeated)]
+    assert sorted(result["cached"] for result in results) == [False, True, True]
+    assert results[0]["statistics"] == results[1]["statistics"] == results[2]["statistics"]
+    assert [message["type"] for message in repeated] == ["result", "done"]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {"id": 2, "policies": [[100, 20]]},
+        {"id": 2, "parameters": {"demand": 3}},
+        {"id": 2, "runs": 1},
+    ],
+)
+def test_invalid_queries_get_an_error(query):
+    service, messages = with_service(lambda port: replies(query, port), workers=1)
+    assert [message["type"] for message in messages] == ["error"]
+    assert messages[0]["id"] == 2 and messages[0]["message"]
+    assert service.simulations == 0
+
+
+@pytest.mark.parametrize("recording_level", ["full", "columnar", "totals"])
+def test_every_recording_level_can_be_sent(recording_level):
+    simulation = InventorySimulation(lead_time=5, recording_level=recording_level)
+    assert simulation_parameters(simulation)["lead_time"] == 5
@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+
+from parallel import replication_seed
+from registers import TotalsRegistry
+from sim_stats import (
+    FlattenRegistry,
+    SimStatistics,
+    StoppingRule,
+    WelfordAccumulator,
+    expected_clients,
+)
+from simulation_engine import InventorySimulation
+from variates import InverseTransformStream, poisson_pmf
+
+
+def renewal_recursion(arrival_pmf: np.ndarray, duration: int) -> float:
+    """expected_clients solving the renewal equation one time at a time"""
+    pmf = np.asarray(arrival_pmf, dtype=np.float64).copy()
+    pmf[0] = 0
+    pmf /= pmf.sum()
+    renewals = np.zeros(duration)
+    for t in range(1, duration):
+        renewals[t] = pmf[1 : t + 1].sum() + sum(
+            pmf[j] * renewals[t - j] for j in range(1, min(t, len(pmf) - 1) + 1)
+        )
+    return renewals[duration - 1]
+
+
+def test_expected_demand_of_the_default_model():
+    assert expected_clients(poisson_pmf(5), 840) * 25.5 == pytest.approx(4242.2987, abs=1e-4)
+
+
+@pytest.mark.parametrize(
+    "arrival_pmf", [[0, 0.5, 0.5], [0.3, 0, 0, 0.7], np.full(100, 0.01), poisson_pmf(2)]
+)
+@pytest.mark.parametrize("duration", [1, 2, 3, 50, 333])
+def test_expected_clients_solve_the_renewal_equation(arrival_pmf, duration):
+    assert expected_clients(np.array(arrival_pmf), duration) == pytest.approx(
+        renewal_recursion(np.array(arrival_pmf), duration), rel=1e-9, abs=1e-12
+    )
+
+
+def test_variance_reduced_variance_is_of_an_equivalent_run():
+    """variance / number_of_runs must be the variance of the expectation, as with independent runs"""
+    simulation = InventorySimulation(
+        s=20,
+        S=100,
+        initial_inventory_level=100,
+        client_arrival_dist=InverseTransformStream.poisson(5),
+        client_demand_dist=InverseTransformStream.uniform_int(1, 50),
+    )
+    stats = SimStatistics(simulation)
+    runs = 20
+    expectations = [
+        stats.calculate_variance_reduced_statistics_results(runs, seed=seed).loss_expectation
+        for seed in range(30)
+    ]
+    results = stats.calculate_variance_reduced_statistics_results(runs, seed=100)
+    assert 0.3 < np.var(expectations, ddof=1) / (results.loss_variance / runs) < 3
+
+
+def new_simulation(recording_level: str = "full") -> InventorySimulation:
+    return InventorySimulation(s=20, S=100, recording_level=recording_level)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_totals_runs_measure_the_same_as_full_runs(seed):
+    full = SimStatistics(new_simulation("full")).run_replication(replication_seed(seed, 0))
+    totals = SimStatistics(new_simulation("totals")).run_replication(replication_seed(seed, 0))
+    assert totals == pytest.approx(full, rel=1e-12)
+
+
+def test_streaming_statistics_are_the_statistics_of_the_runs():
+    simulation = new_simulation("columnar")
+    stats = SimStatistics(simulation)
+    streaming = stats.calculate_streaming_statistics_results(12, seed=5)
+    assert simulation.recording_level == "columnar"
+    assert isinstance(simulation.registry, TotalsRegistry)
+    expected = stats.calculate_statistics_results(12, seed=5)
+    assert vars(streaming) == pytest.approx(vars(expected), rel=1e-12)
+
+
+def test_totals_registries_can_not_be_flattened():
+    with pytest.raises(Exception):
+        FlattenRegistry(TotalsRegistry())
+
+
+def accumulators(runs: list[tuple[float, float, float]]) -> list[WelfordAccumulator]:
+    """The accumulators of the loss, costs and final balance of the runs"""
+    result = [WelfordAccumulator() for _ in range(3)]
+    for run in runs:
+        for accumulator, value in zip(result, run):
+            accumulator.update(value)
+    return result
+
+
+@pytest.mark.parametrize(
+    "rule",
+    [
+        StoppingRule(relative_half_width=0.05, batch_size=5),
+        StoppingRule(absolute_half_width=400, batch_size=5),
+    ],
+)
+def test_the_runs_stop_at_the_first_batch_that_meets_the_rule(rule):
+    stats = SimStatistics(new_simulation("totals"))
+    results = stats.calculate_sequential_statistics_results(rule, seed=0)
+    runs = [stats.run_replication(replication_seed(0, i)) for i in range(results.number_of_runs)]
+    assert results.number_of_runs % rule.batch_size == 0
+    assert results.number_of_runs < rule.max_runs
+    assert all(rule.is_met(acc) for acc in accumulators(runs))
+    assert not all(rule.is_met(acc) for acc in accumulators(runs[: -rule.batch_size]))
+
+    plain = stats.calculate_statistics_results(results.number_of_runs, seed=0)
+    for name in ("loss", "costs", "final_balance"):
+        mean = getattr(results, f"{name}_expectation")
+        assert mean == pytest.approx(getattr(plain, f"{name}_expectation"), rel=1e-12)
+        variance = getattr(results, f"{name}_variance")
+        assert variance == pytest.approx(getattr(plain, f"{name}_variance"), rel=1e-9)
+        half_width = 1.959964 * np.sqrt(variance / results.number_of_runs)
+        assert getattr(results, f"{name}_confidence_interval") == pytest.approx(
+            (mean - half_width, mean + half_width)
+        )
+        if rule.absolute_half_width is not None:
+            assert half_width <= rule.absolute_half_width
+        else:
+            assert half_width <= rule.relative_half_width * abs(mean)
+
+
+def test_the_runs_stop_at_max_runs_if_the_rule_is_not_met():
+    rule = StoppingRule(absolute_half_width=1e-9, batch_size=4, max_runs=10)
+    results = SimStatistics(new_simulation("totals")).calculate_sequential_statistics_results(
+        rule, seed=0
+    )
+    assert results.number_of_runs == 10
+    low, high = results.loss_confidence_interval
+    assert high - low > 2e-9
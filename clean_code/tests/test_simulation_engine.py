@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+
+from events import Event, SellEvent
+from instrumentation import EngineInstrumentation
+from parallel import replication_seed, seed_generators
+from sim_stats import SimStatistics
+from simulation_engine import InventorySimulation
+
+
+def seeded_run(seed: int, **kwargs) -> InventorySimulation:
+    simulation = InventorySimulation(
+        s=20, S=100, initial_inventory_level=50, sim_duration=5000, **kwargs
+    )
+    return seeded_run_of(simulation, seed)
+
+
+def seeded_run_of(simulation: InventorySimulation, seed: int = 0) -> InventorySimulation:
+    seed_generators(replication_seed(seed, 0))
+    simulation.run()
+    return simulation
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("holding_pay_time", [60, 7, 1])
+def test_accrued_totals_are_the_event_totals(seed, holding_pay_time):
+    events = seeded_run(seed, holding_pay_time=holding_pay_time, recording_level="columnar")
+    accrued = seeded_run(
+        seed, holding_pay_time=holding_pay_time, accrue_holding=True, recording_level="totals"
+    )
+    totals = accrued.registry
+    _, asked, sold = events.registry.sells()
+    assert (totals.amount_asked, totals.amount_seeled) == (asked.sum(), sold.sum())
+    assert totals.buy_cost == events.registry.buys()[2].sum()
+    assert totals.pay_holding_cost == events.registry.pay_holding()[1].sum()
+    assert accrued.actual_balance == events.actual_balance
+    assert SimStatistics(accrued).measure_run() == SimStatistics(events).measure_run()
+
+
+def test_accrued_records_are_the_event_records():
+    events = seeded_run(0, recording_level="columnar")
+    accrued = seeded_run(0, recording_level="columnar", accrue_holding=True)
+    for name in ("sells", "stock", "buys", "balance", "pay_holding"):
+        for expected, column in zip(
+            getattr(events.registry, name)(), getattr(accrued.registry, name)()
+        ):
+            np.testing.assert_array_equal(column, expected, err_msg=name)
+
+
+class CountingSimulation(InventorySimulation):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.clients: int = 0
+
+    def process_client_event(self, event: SellEvent):
+        self.clients += 1
+        super().process_client_event(event)
+
+
+class UrgentSellEvent(SellEvent):
+    __slots__ = ()
+
+
+def test_handlers_are_the_methods_of_the_instance():
+    simulation = CountingSimulation(s=20, S=100)
+    seeded_run_of(simulation)
+    assert simulation.clients == simulation.registry.record_counts()["sell"]
+    instrumentation = EngineInstrumentation()
+    simulation.instrumentation = instrumentation
+    simulation.clients = 0
+    seeded_run_of(simulation)
+    assert simulation.clients == instrumentation.report.event_counts["SellEvent"]
+    clone = simulation.clone()
+    assert clone.event_handlers[SellEvent].__self__ is clone
+
+
+def test_subclasses_of_events_use_the_handler_of_their_base():
+    simulation = InventorySimulation(s=20, S=100, initial_inventory_level=30)
+    simulation.initialize()
+    simulation.process_event(UrgentSellEvent(0, 10))
+    assert simulation.actual_inventory_level == 20
+    with pytest.raises(Exception):
+        simulation.process_event(Event(0))
+
+
+def test_clones_continue_the_run_with_their_own_state():
+    instrumentation = EngineInstrumentation()
+    simulation = InventorySimulation(
+        s=20,
+        S=100,
+        initial_inventory_level=50,
+        sim_duration=5000,
+        recording_level="columnar",
+        instrumentation=instrumentation,
+    )
+    seeded_run_of(simulation)
+    balance = simulation.actual_balance
+    seed_generators(replication_seed(0, 0))
+    simulation.initialize()
+    while simulation.time < 2000:
+        simulation.step()
+    snapshot = simulation.snapshot()
+    assert snapshot.registry is None
+    clone = simulation.clone(snapshot)
+    assert clone.instrumentation is not instrumentation
+    clone.resume()
+    assert clone.actual_balance == balance
+    # The records of the clone start at the snapshot, the ones of the original are untouched
+    assert clone.registry.balance()[0][0] > snapshot.time
+    assert simulation.registry.balance()[0][-1] == snapshot.time
+    assert len(instrumentation.reports) == 1
+
+
+def test_columns_can_be_read_during_the_run():
+    simulation = InventorySimulation(recording_level="columnar")
+    simulation.initialize()
+    columns = []
+    while not simulation.sim_over:
+        simulation.step()
+        columns.append(simulation.registry.balance())
+    assert len(columns[-1][0]) == simulation.registry.record_counts()["balance"]
+
+
+def test_columns_are_views_that_outlive_the_growth_of_the_buffers():
+    simulation = InventorySimulation(recording_level="columnar")
+    simulation.initialize()
+    simulation.step()
+    times, values = simulation.registry.balance()
+    first = (times.copy(), values.copy())
+    while not simulation.sim_over:
+        simulation.step()
+    final_times, final_values = simulation.registry.balance()
+    assert np.shares_memory(final_times, simulation.registry.balance_time.buffer)
+    np.testing.assert_array_equal(times, first[0])
+    np.testing.assert_array_equal(final_times[: len(times)], first[0])
+    assert len(final_values) > len(values)
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from variates import InverseTransformStream, VariateStream
+
+
+def draw(stream, count: int) -> list:
+    return [stream() for _ in range(count)]
+
+
+@pytest.mark.parametrize(
+    "new_stream",
+    [
+        lambda rng: VariateStream.poisson(3, block_size=7, rng=rng),
+        lambda rng: VariateStream.uniform_int(1, 50, block_size=7, rng=rng),
+        lambda rng: InverseTransformStream.poisson(3, block_size=7, rng=rng),
+    ],
+)
+def test_seeded_streams_repeat_their_values_across_blocks(new_stream):
+    values = draw(new_stream(np.random.default_rng(5)), 30)
+    assert draw(new_stream(np.random.default_rng(5)), 30) == values
+    assert draw(new_stream(np.random.default_rng(6)), 30) != values
+    # The blocks are consecutive draws of the generator, the block size does not change the values
+    larger = VariateStream(new_stream(np.random.default_rng(5)).sampler, block_size=64)
+    assert draw(larger, 30) == values
+
+
+def test_the_global_generator_streams_repeat_after_seeding():
+    stream = VariateStream.uniform_int(1, 50, block_size=8)
+    np.random.seed(1)
+    values = draw(stream, 20)
+    np.random.seed(1)
+    assert draw(stream, 4) != values[:4]
+    np.random.seed(1)
+    stream.reset()
+    assert draw(stream, 20) == values
+
+
+def test_a_saved_state_resumes_in_the_middle_of_a_block():
+    stream = InverseTransformStream.uniform_int(1, 50, block_size=4, rng=np.random.default_rng(2))
+    draw(stream, 10)
+    state = stream.get_state()
+    following = draw(stream, 9)
+    stream.set_state(state)
+    assert draw(stream, 9) == following
+
+    other = InverseTransformStream.uniform_int(1, 50, block_size=4, rng=np.random.default_rng(9))
+    other.set_state(state)
+    assert draw(other, 9) == following
+
+
+@pytest.mark.parametrize(
+    "stream",
+    [
+        InverseTransformStream.poisson(5, rng=np.random.default_rng(0)),
+        InverseTransformStream.uniform_int(1, 50, rng=np.random.default_rng(0)),
+        InverseTransformStream([0.2, 0.0, 0.5, 0.3], rng=np.random.default_rng(0)),
+    ],
+)
+def test_inverse_transform_samples_have_the_mean_of_the_pmf(stream):
+    samples = np.array(draw(stream, 100_000))
+    error = samples.std() / np.sqrt(len(samples))
+    assert abs(samples.mean() - stream.mean()) < 5 * error
+    assert np.all(stream.pmf[samples] > 0)
+
+
+@pytest.mark.parametrize(
+    "new_stream",
+    [
+        lambda rng: InverseTransformStream.poisson(5, rng=rng),
+        lambda rng: InverseTransformStream.uniform_int(1, 50, rng=rng),
+    ],
+)
+def test_antithetic_draws_are_negatively_correlated(new_stream):
+    normal = new_stream(np.random.default_rng(4))
+    antithetic = new_stream(np.random.default_rng(4))
+    antithetic.antithetic = True
+    values, mirrored = np.array(draw(normal, 10_000)), np.array(draw(antithetic, 10_000))
+    assert np.corrcoef(values, mirrored)[0, 1] < -0.9
+    assert abs(mirrored.mean() - normal.mean()) < 0.1 * normal.mean()
@@ -1,5 +1,4 @@
 from typing import Callable
-import matplotlib.pyplot as plt
 import numpy as np
 import math
 
@@ -27,6 +26,8 @@ def visualize_random_variable(random_variable_generator:Callable, ground_truth_g
         ground_truth_generator (function): Optional. Function to generate ground truth random variables for comparison.
         num_samples (int): Number of samples to generate for visualization (default is 1000).
     """
+    import matplotlib.pyplot as plt
+
     # Generate random variables
     random_values = [random_variable_generator() for _ in range(num_samples)]
     print(random_values)
@@ -58,6 +59,8 @@ def visualize_time_arrivals(arrival_time_generator:Callable, num_samples:int=100
         arrival_time_generator (function): Function to generate arrival times of clients.
         num_samples (int): Number of samples to generate for visualization (default is 1000).
     """
+    import matplotlib.pyplot as plt
+
     # Generate arrival times
     arrival_delays = [arrival_time_generator() for _ in range(num_samples)]
     t = 0
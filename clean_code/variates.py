@@ -0,0 +1,157 @@
+# This file contains random variate streams that draw their values from numpy in large blocks and
+# hand them out one by one, so they can be used as the distributions of InventorySimulation
+import math
+from typing import Callable
+import numpy as np
+
+
+def poisson_pmf(mean: float, tolerance: float = 1e-12) -> np.ndarray:
+    """The probabilities of 0, 1, 2... of a Poisson variable, until the tail is below the tolerance"""
+    probabilities = [math.exp(-mean)]
+    total = probabilities[0]
+    k = 0
+    while 1 - total > tolerance or k < mean:
+        k += 1
+        probabilities.append(probabilities[-1] * mean / k)
+        total += probabilities[-1]
+    return np.array(probabilities)
+
+
+def uniform_pmf(low: int, high: int) -> np.ndarray:
+    """The probabilities of 0, 1, ..., high of an integer uniformly distributed between low and high"""
+    pmf = np.zeros(high + 1)
+    pmf[low:] = 1 / (high - low + 1)
+    return pmf
+
+
+class VariateStream:
+    """A callable with no arguments that returns the next value of a buffered block of samples.
+    When the block is exhausted a new one is drawn with the sampler"""
+
+    def __init__(
+        self,
+        sampler: Callable[[int], np.ndarray],
+        block_size: int = 4096,
+        rng: np.random.Generator | None = None,
+    ):
+        if block_size <= 0:
+            raise Exception("The block size of a variate stream must be positive")
+        self.sampler: Callable[[int], np.ndarray] = sampler
+        """Function that receives a size and returns an array with that many samples"""
+        self.rng: np.random.Generator | None = rng
+        """The generator used by the sampler, None if it uses the global numpy generator"""
+        self.block_size: int = block_size
+        self.buffer: list = []
+        """The values of the actual block, as python numbers"""
+        self.index: int = 0
+        """The position in the buffer of the next value to hand out"""
+
+    def __call__(self):
+        if self.index == len(self.buffer):
+            self.refill()
+        value = self.buffer[self.index]
+        self.index += 1
+        return value
+
+    def refill(self):
+        """Draws a new block of samples"""
+        self.buffer = self.sampler(self.block_size).tolist()
+        self.index = 0
+
+    def get_state(self) -> tuple[list, int, dict | None]:
+        """Returns what the stream needs to hand out again the same values: the buffer, the position
+        in it and the state of its own generator. The state of the global generator is not included"""
+        return (
+            list(self.buffer),
+            self.index,
+            self.rng.bit_generator.state if self.rng is not None else None,
+        )
+
+    def set_state(self, state: tuple[list, int, dict | None]):
+        """Restores a state returned by get_state"""
+        buffer, self.index, rng_state = state
+        self.buffer = list(buffer)
+        if rng_state is not None:
+            self.rng.bit_generator.state = rng_state
+
+    def reset(self):
+        """Discards the values that are left in the buffer. The values that are buffered were drawn with
+        the generator state of the moment of the refill, so the streams must be reset after seeding"""
+        self.buffer = []
+        self.index = 0
+
+    @classmethod
+    def poisson(
+        cls,
+        lambda_param: float,
+        block_size: int = 4096,
+        rng: np.random.Generator | None = None,
+    ):
+        """Stream of a Poisson random variable with parameter lambda_param. Without a generator the
+        global numpy generator is used, the same one used by utils.poisson_random_variable"""
+        poisson = rng.poisson if rng is not None else np.random.poisson
+        return cls(lambda size: poisson(lambda_param, size), block_size, rng)
+
+    @classmethod
+    def uniform_int(
+        cls,
+        low: int,
+        high: int,
+        block_size: int = 4096,
+        rng: np.random.Generator | None = None,
+    ):
+        """Stream of integers uniformly distributed between low and high, both included like in
+        random.randint. Without a generator the global numpy generator is used"""
+        if rng is not None:
+            return cls(lambda size: rng.integers(low, high + 1, size), block_size, rng)
+        return cls(lambda size: np.random.randint(low, high + 1, size), block_size)
+
+
+class InverseTransformStream(VariateStream):
+    """Stream of an integer random variable with a known distribution, drawn by inverse transform: every
+    value is the smallest k with u < P(X <= k) for a uniform u. With antithetic the uniforms u are replaced
+    by 1 - u, so a run with the same seed draws values negatively correlated with the ones of the normal run
+    """
+
+    def __init__(
+        self,
+        pmf: np.ndarray,
+        block_size: int = 4096,
+        rng: np.random.Generator | None = None,
+    ):
+        self.pmf: np.ndarray = np.asarray(pmf, dtype=np.float64)
+        """The probabilities of the values 0, 1, 2..."""
+        self.cdf: np.ndarray = np.cumsum(self.pmf)
+        self.antithetic: bool = False
+        super().__init__(self.sample, block_size, rng)
+
+    def sample(self, size: int) -> np.ndarray:
+        uniforms = self.rng.random(size) if self.rng is not None else np.random.random_sample(size)
+        if self.antithetic:
+            uniforms = 1 - uniforms
+        # The values beyond the truncated tail of the pmf are drawn as its last value
+        return np.minimum(
+            np.searchsorted(self.cdf, uniforms, side="right"), len(self.pmf) - 1
+        )
+
+    def mean(self) -> float:
+        return float(np.arange(len(self.pmf)) @ self.pmf)
+
+    @classmethod
+    def poisson(
+        cls,
+        lambda_param: float,
+        block_size: int = 4096,
+        rng: np.random.Generator | None = None,
+    ):
+        return cls(poisson_pmf(lambda_param), block_size, rng)
+
+    @classmethod
+    def uniform_int(
+        cls,
+        low: int,
+        high: int,
+        block_size: int = 4096,
+        rng: np.random.Generator | None = None,
+    ):
+        return cls(uniform_pmf(low, high), block_size, rng)